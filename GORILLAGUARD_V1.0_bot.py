@@ -4,11 +4,21 @@ import sqlite3  # Para manejo de la base de datos SQLite
 import random  # Para seleccionar frases aleatorias de las listas
 import time  # Para manejar límites de tasa en la API de X
 import re  # Para manejar detección de patrones como enlaces
+import html  # Escapar texto de usuario dentro de mensajes HTML
+import hashlib  # Hash del contenido renderizado del tablero de raids
+import json  # Permisos del chat guardados durante un bloqueo por raid
+import math  # Para estimar el número de páginas de las listas de X
+import heapq  # Cola de envíos aparcados por límite de chat en el outbox de Telegram
+import itertools  # Secuencia de desempate para la cola de envíos
+import threading  # Conexiones SQLite por hilo en la capa de datos
+from concurrent.futures import ThreadPoolExecutor  # Hilos dedicados para SQLite fuera del event loop
 from datetime import datetime, timedelta, timezone # Para operaciones relacionadas con fechas y tiempos
-from collections import defaultdict  # Para manejar estructuras como el conteo de mensajes de usuarios
+from collections import defaultdict, deque  # Agrupación de filas y ventanas acotadas de mensajes por usuario
+from contextlib import contextmanager  # Bloques `with` para atribuir el consumo de CoinMarketCap
+import contextvars  # Etiqueta del comando que origina cada llamada a CoinMarketCap
 
 # Bibliotecas de terceros
-import requests  # Para manejar solicitudes HTTP (API de X y CoinMarketCap)
+import httpx  # Cliente HTTP asíncrono con pool de conexiones (API de X y CoinMarketCap)
 import asyncio  # Para manejar tareas asíncronas como eventos del bot
 from dotenv import load_dotenv  # Para cargar variables de entorno desde el archivo .env
 from pathlib import Path  # Para manejar rutas de archivos y directorios
@@ -17,13 +27,14 @@ from telegram import (
 )  # Herramientas para manejo de Telegram (botones, permisos, actualizaciones)
 from telegram.ext import (
     Application, ApplicationBuilder, CommandHandler, MessageHandler, filters,
-    ContextTypes, CallbackQueryHandler
+    ContextTypes, CallbackQueryHandler, ChatMemberHandler
 )  # Herramientas esenciales para construir y manejar el bot
 from telegram.helpers import escape_markdown  # Para manejar texto en formato Markdown
-from telegram.error import RetryAfter  # Para manejar errores de límite de tasa de Telegram
+from telegram.error import RetryAfter, BadRequest  # Errores de límite de tasa y de mensajes inválidos de Telegram
 
 # Herramientas de Tipado
-from typing import Union  # Para manejo de tipos en funciones asíncronas
+from typing import Union, NamedTuple  # Para manejo de tipos en funciones asíncronas y filas tipadas
+from types import MappingProxyType  # Vistas de solo lectura para la instantánea de mercado
 
 # Resumen de optimizaciones:
 # - Confirmé que todas las importaciones sean necesarias y utilizadas en el código.
@@ -78,26 +89,246 @@ else:
 
 
 
-#DATA BASE BLOCK    # Bloque de comandos y funciones relacionadas con la base de datos
+#X API BLOCK    # Bloque del cliente asíncrono para la API de X
 
-# Initialize SQLite database
-from sqlite3 import Connection, Cursor
-from pathlib import Path
-import sqlite3
-import requests
-import time
+X_API_BASE_URL = "https://api.twitter.com/2/"
+X_API_MAX_RETRIES = 3  # Reintentos máximos por solicitud (429, 5xx y errores de red)
+X_API_BACKOFF_BASE = 2  # Segundos base para el backoff exponencial
+X_API_BACKOFF_CAP = 60  # Espera máxima entre reintentos por errores transitorios
+X_API_MAX_RATE_LIMIT_WAIT = 900  # Espera máxima ante un 429 (ventana de 15 minutos de X)
 
-# Database path and connection
-db_path = Path(__file__).parent / "gorilla_raids.db"
-conn: Connection = sqlite3.connect(db_path, check_same_thread=False)
-cursor: Cursor = conn.cursor()
+# Tamaño máximo de página admitido por cada familia de endpoints paginados
+X_API_PAGE_SIZES = {
+    "tweets/:id/liking_users": 100,
+    "tweets/:id/retweeted_by": 100,
+    "users/:id/followers": 1000,
+    "users/:id/liked_tweets": 100,
+    "users/:id/following": 1000,
+}
+
+# Solicitudes por ventana de 15 minutos (autenticación de app) mientras no haya cabeceras que digan otra cosa
+X_API_DEFAULT_LIMITS = {
+    "tweets/:id/liking_users": 75,
+    "tweets/:id/retweeted_by": 75,
+    "users/:id/followers": 15,
+    "users/:id/liked_tweets": 75,
+    "users/:id/following": 15,
+    "users/by": 300,
+}
+
+
+class XRateLimiter:
+    """
+    Token-bucket rate limiter for the X API, one bucket per endpoint family.
+
+    Buckets are refilled from the `x-rate-limit-*` response headers, so requests
+    go out as fast as the quota allows and callers only wait once the budget of
+    the current window is actually exhausted.
+    """
+
+    class _Bucket:
+        __slots__ = ("limit", "remaining", "reset_at", "lock")
+
+        def __init__(self):
+            self.limit = None  # Tamaño de la ventana (x-rate-limit-limit)
+            self.remaining = None  # Solicitudes disponibles; None = desconocido
+            self.reset_at = None  # Epoch en que se renueva la ventana
+            self.lock = asyncio.Lock()
+
+    def __init__(self):
+        self._buckets: dict = {}
+
+    def _bucket(self, family: str) -> "XRateLimiter._Bucket":
+        bucket = self._buckets.get(family)
+        if bucket is None:
+            bucket = self._buckets[family] = self._Bucket()
+        return bucket
+
+    @staticmethod
+    def _refill_if_expired(bucket: "XRateLimiter._Bucket", now: float):
+        if bucket.reset_at is not None and now >= bucket.reset_at:
+            bucket.remaining = bucket.limit
+            bucket.reset_at = None
+
+    async def acquire(self, family: str):
+        """
+        Takes one token from the family's bucket, waiting for the window reset if it is empty.
+        """
+        bucket = self._bucket(family)
+        async with bucket.lock:
+            while True:
+                now = time.time()
+                self._refill_if_expired(bucket, now)
+                if bucket.remaining is None or bucket.remaining > 0:
+                    if bucket.remaining is not None:
+                        bucket.remaining -= 1
+                    return
+                wait_time = min(X_API_MAX_RATE_LIMIT_WAIT, max(0, bucket.reset_at - now)) + 1
+                print(f"⏳ X API budget for '{family}' exhausted. Waiting {wait_time:.0f} seconds for the window reset...")
+                await asyncio.sleep(wait_time)
+
+    def budget(self, family: str) -> tuple:
+        """
+        Returns the (remaining, limit) budget of a family; either value is None while unknown.
+        """
+        bucket = self._buckets.get(family)
+        if bucket is None:
+            return None, None
+        self._refill_if_expired(bucket, time.time())
+        return bucket.remaining, bucket.limit
+
+    def update(self, family: str, headers):
+        """
+        Synchronizes the family's bucket with the rate-limit headers of a response.
+        """
+        try:
+            remaining = int(headers["x-rate-limit-remaining"])
+            reset_at = int(headers["x-rate-limit-reset"])
+        except (KeyError, TypeError, ValueError):
+            return
+
+        bucket = self._bucket(family)
+        if "x-rate-limit-limit" in headers:
+            try:
+                bucket.limit = int(headers["x-rate-limit-limit"])
+            except ValueError:
+                pass
+
+        if bucket.reset_at != reset_at or bucket.remaining is None:
+            # Nueva ventana: el servidor manda
+            bucket.remaining = remaining
+            bucket.reset_at = reset_at
+        else:
+            # Misma ventana: conservar los tokens ya reservados por solicitudes en vuelo
+            bucket.remaining = min(bucket.remaining, remaining)
+
+
+_X_ENDPOINT_ID_PATTERN = re.compile(r"(?<=/)\d+(?=/|$)")
+_X_ENDPOINT_USERNAME_PATTERN = re.compile(r"^users/by/username/[^/]+")
+
+
+def x_endpoint_family(endpoint: str) -> str:
+    """
+    Normalizes an endpoint into its rate-limit family, e.g. 'tweets/123/liking_users' -> 'tweets/:id/liking_users'.
+    """
+    path = endpoint.strip("/")
+    path = _X_ENDPOINT_USERNAME_PATTERN.sub("users/by/username/:username", path)
+    return _X_ENDPOINT_ID_PATTERN.sub(":id", path)
+
+
+
+class XApiClient:
+    """
+    Asynchronous client for the X API.
+
+    Keeps a single pooled `httpx.AsyncClient` (keep-alive connections are reused
+    across calls), spends the quota through an `XRateLimiter` and retries 429/5xx
+    responses a bounded number of times with `asyncio.sleep`, so the event loop
+    never blocks on X traffic.
+    """
+
+    def __init__(self, bearer_token: str, base_url: str = X_API_BASE_URL, max_retries: int = X_API_MAX_RETRIES):
+        self.bearer_token = bearer_token
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.rate_limiter = XRateLimiter()
+        self.requests_made = 0  # Contador de solicitudes enviadas
+        self._client: Union[httpx.AsyncClient, None] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # El pool se crea de forma perezosa para que quede ligado al event loop del bot
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.bearer_token}"},
+                timeout=httpx.Timeout(15.0, connect=5.0),
+                limits=httpx.Limits(max_connections=10, max_keepalive_connections=5),
+            )
+        return self._client
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        return min(X_API_BACKOFF_CAP, X_API_BACKOFF_BASE * 2 ** attempt) + random.uniform(0, 1)
+
+    async def get(self, endpoint: str, params: dict = None) -> Union[dict, None]:
+        """
+        Performs a GET request against the X API.
+
+        Args:
+            endpoint (str): The API endpoint to call (relative to base URL).
+            params (dict, optional): Query parameters for the API call.
+
+        Returns:
+            dict: Parsed JSON response or None in case of an error.
+        """
+        client = self._get_client()
+        family = x_endpoint_family(endpoint)
+
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            await self.rate_limiter.acquire(family)
+            self.requests_made += 1
+            try:
+                response = await client.get(endpoint, params=params)
+            except httpx.HTTPError as e:
+                print(f"❌ Network error in X API request ({endpoint}): {e}")
+                if last_attempt:
+                    return None
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+
+            self.rate_limiter.update(family, response.headers)
+
+            # Límite de tasa: el limitador espera al reinicio de la ventana en el siguiente intento
+            if response.status_code == 429:
+                if last_attempt:
+                    print(f"❌ Rate limit still exceeded for {endpoint} after {self.max_retries} retries.")
+                    return None
+                print(f"⚠️ Rate limit exceeded for '{family}'. Deferring to the rate limiter...")
+                if "x-rate-limit-reset" not in response.headers:
+                    await asyncio.sleep(self._backoff(attempt))
+                continue
+
+            # Errores transitorios del servidor
+            if response.status_code >= 500:
+                print(f"⚠️ X API server error {response.status_code} for {endpoint}.")
+                if last_attempt:
+                    return None
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+
+            try:
+                response.raise_for_status()
+                return response.json()
+            except (httpx.HTTPStatusError, ValueError) as e:
+                print(f"❌ Error in X API request: {e}")
+                return None
+
+        return None
+
+    async def aclose(self):
+        """
+        Closes the underlying connection pool.
+        """
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+
+class XApiError(Exception):
+    """
+    Raised when an X API call needed to complete an operation fails.
+    """
+
+
+# Cliente compartido por todo el bot
+x_api_client = XApiClient(TWITTER_BEARER_TOKEN)
 
-print("✅ SQLite database initialized successfully!")
 
 # Function to interact with the X API while respecting rate limits
-def x_api_request(endpoint: str, params: dict = None) -> dict:
+async def x_api_request(endpoint: str, params: dict = None) -> Union[dict, None]:
     """
-    Makes a request to the X API while handling rate limits.
+    Single entry point for X API calls. Delegates to the shared async client.
 
     Args:
         endpoint (str): The API endpoint to call (relative to base URL).
@@ -106,161 +337,1419 @@ def x_api_request(endpoint: str, params: dict = None) -> dict:
     Returns:
         dict: Parsed JSON response or None in case of an error.
     """
-    base_url = "https://api.twitter.com/2/"
-    headers = {"Authorization": f"Bearer {TWITTER_BEARER_TOKEN}"}
+    return await x_api_client.get(endpoint, params)
+
+
+async def x_api_paginate(endpoint: str, params: dict = None, max_results: int = 100, pagination_token: str = None):
+    """
+    Iterates over a paginated X API endpoint following `meta.next_token`.
+
+    Args:
+        endpoint (str): The API endpoint to call (relative to base URL).
+        params (dict, optional): Extra query parameters for every page.
+        max_results (int): Page size requested from the API.
+        pagination_token (str, optional): Token to resume from instead of the first page.
+
+    Yields:
+        tuple: The `data` items of each page and the token of the following page (None on the last one).
+
+    Raises:
+        XApiError: If a page cannot be retrieved.
+    """
+    page_params = dict(params or {})
+    page_params["max_results"] = max_results
+    if pagination_token:
+        page_params["pagination_token"] = pagination_token
+
+    while True:
+        response = await x_api_request(endpoint, page_params)
+        if response is None:
+            raise XApiError(f"Failed to fetch a page of {endpoint}")
+
+        next_token = response.get("meta", {}).get("next_token")
+        yield response.get("data", []), next_token
+
+        if not next_token:
+            return
+        page_params["pagination_token"] = next_token
+
+
+# Caché de usuarios de X por username en minúsculas (ID y public_metrics)
+x_user_cache = {}
+X_USERNAME_PATTERN = re.compile(r"^[A-Za-z0-9_]{1,15}$")
+
+
+async def x_api_get_user(username: str) -> Union[dict, None]:
+    """
+    Fetches an X user (ID and public metrics) by username and caches it.
+    """
+    response = await x_api_request(f"users/by/username/{username}", {"user.fields": "public_metrics"})
+    user = (response or {}).get("data")
+    if user and user.get("id"):
+        x_user_cache[username.lower()] = user
+        return user
+    print(f"⚠️ Could not resolve X user @{username}.")
+    return None
+
+
+async def x_api_resolve_user_id(username: str) -> Union[str, None]:
+    """
+    Resolves an X username to its numeric user ID, caching the result.
+    """
+    user = x_user_cache.get(username.lower()) or await x_api_get_user(username)
+    return user["id"] if user else None
+
+
+async def x_api_lookup_users(usernames: list) -> dict:
+    """
+    Resolves many usernames at once (100 per request), filling the user cache.
+
+    Returns:
+        dict: Users keyed by lowercase username; unknown or invalid names are omitted.
+    """
+    users = {}
+    missing = []
+    for username in usernames:
+        key = username.lower()
+        if key in x_user_cache:
+            users[key] = x_user_cache[key]
+        elif X_USERNAME_PATTERN.match(username):
+            missing.append(username)
+
+    for i in range(0, len(missing), 100):
+        batch = missing[i:i + 100]
+        response = await x_api_request("users/by", {"usernames": ",".join(batch), "user.fields": "public_metrics"})
+        for user in (response or {}).get("data", []):
+            key = user["username"].lower()
+            x_user_cache[key] = user
+            users[key] = user
+
+    return users
+
+
+# Cierre ordenado de los clientes HTTP y de la base de datos al detener el bot
+async def close_resources(app: Application):
+    """
+    Closes pooled HTTP clients, the Telegram outbox and the database threads when the application shuts down.
+    """
+    await x_api_client.aclose()
+    await cmc_client.aclose()
+    await telegram_outbox.aclose()
+    db.close()
+
+
+
+
+
+#COINMARKETCAP BLOCK    # Bloque del cliente asíncrono para la API de CoinMarketCap
+
+CMC_API_BASE_URL = "https://pro-api.coinmarketcap.com/v1/"
+CMC_API_MAX_RETRIES = 2  # Reintentos máximos ante 429, 5xx y errores de red
+CMC_MEME_CATEGORY_TTL = 6 * 3600  # El ID de la categoría de memes prácticamente no cambia
+
+CMC_DAILY_CREDIT_BUDGET = int(os.getenv("CMC_DAILY_CREDIT_BUDGET", "333"))  # Créditos por día UTC (plan Basic: 10.000/mes); 0 = sin límite
+
+# Comando o tarea que origina las llamadas a CMC; las tareas creadas heredan la etiqueta
+cmc_command = contextvars.ContextVar("cmc_command", default="other")
+
 
+@contextmanager
+def cmc_usage(command: str):
+    """
+    Attributes the CoinMarketCap calls made inside the block to `command`.
+    """
+    token = cmc_command.set(command)
     try:
-        response = requests.get(base_url + endpoint, headers=headers, params=params)
+        yield
+    finally:
+        cmc_command.reset(token)
+
+
+class CmcCreditMeter:
+    """
+    Counts CoinMarketCap calls and credits per endpoint and per command for the current UTC day.
+
+    Credits are read from `status.credit_count` of each response (CMC's own
+    accounting). Once the daily budget is spent the client stops calling
+    upstream and callers degrade to stale cached data until the day rolls over.
+    """
+
+    def __init__(self, daily_budget: int = CMC_DAILY_CREDIT_BUDGET):
+        self.daily_budget = daily_budget
+        self.credits_total = 0  # Créditos desde el arranque
+        self.day = None
+        self._reset_day(datetime.now(timezone.utc).date())
+
+    def _reset_day(self, day):
+        self.day = day
+        self.calls_today = 0
+        self.credits_today = 0
+        self.denied_today = 0  # Llamadas evitadas por presupuesto agotado
+        self.by_endpoint = defaultdict(lambda: [0, 0])  # endpoint -> [llamadas, créditos]
+        self.by_command = defaultdict(lambda: [0, 0])  # comando -> [llamadas, créditos]
+
+    def _roll(self):
+        today = datetime.now(timezone.utc).date()
+        if today != self.day:
+            print(f"📒 CoinMarketCap usage for {self.day}: {self.credits_today} credits in {self.calls_today} calls.")
+            self._reset_day(today)
+
+    def exhausted(self) -> bool:
+        self._roll()
+        return 0 < self.daily_budget <= self.credits_today
+
+    def deny(self, endpoint: str):
+        self.denied_today += 1
+        if self.denied_today == 1:
+            print(f"⛔ CoinMarketCap daily budget of {self.daily_budget} credits reached. Serving cached data until 00:00 UTC.")
+
+    def record(self, endpoint: str, credits: int):
+        """
+        Records one upstream call (failed attempts count as calls with zero credits).
+        """
+        self._roll()
+        command = cmc_command.get()
+        self.calls_today += 1
+        self.credits_today += credits
+        self.credits_total += credits
+        for usage in (self.by_endpoint[endpoint], self.by_command[command]):
+            usage[0] += 1
+            usage[1] += credits
+
+    def gauges(self) -> dict:
+        self._roll()
+        return {
+            "cmc_credits_today": self.credits_today,
+            "cmc_daily_budget": self.daily_budget,
+            "cmc_calls_today": self.calls_today,
+            "cmc_budget_denied_today": self.denied_today,
+        }
+
+    def report(self) -> str:
+        """
+        Renders today's usage, heaviest endpoints and commands first.
+        """
+        self._roll()
+        budget = self.daily_budget or "∞"
+        lines = [
+            f"💳 CoinMarketCap usage for {self.day} (UTC):",
+            f"• Credits: {self.credits_today} / {budget} in {self.calls_today} calls",
+            f"• Calls skipped by the budget: {self.denied_today}",
+            f"• Credits since start: {self.credits_total}",
+        ]
+        for title, usage in (("By endpoint", self.by_endpoint), ("By command", self.by_command)):
+            lines.append(f"\n{title}:")
+            ranked = sorted(usage.items(), key=lambda item: (-item[1][1], -item[1][0]))
+            lines.extend(f"• {name}: {credits} credits / {calls} calls" for name, (calls, credits) in ranked)
+            if not ranked:
+                lines.append("• none")
+        return "\n".join(lines)
 
-        # Handle rate limits
-        if response.status_code == 429:
-            reset_time = int(response.headers.get("x-rate-limit-reset", time.time() + 60))
-            wait_time = max(0, reset_time - time.time())
-            print(f"⚠️ Rate limit exceeded. Waiting for {wait_time:.2f} seconds...")
-            time.sleep(wait_time)
-            return x_api_request(endpoint, params)  # Retry after waiting
 
-        response.raise_for_status()
-        return response.json()
+def cmc_credit_count(payload) -> int:
+    """
+    Reads the credits CMC charged for a response; defaults to 1 when the status block is missing.
+    """
+    try:
+        return int(payload["status"]["credit_count"])
+    except (KeyError, TypeError, ValueError):
+        return 1
+
+
+class CoinMarketCapClient:
+    """
+    Asynchronous client for the CoinMarketCap API.
+
+    `request` performs uncached calls for the market-data jobs, which keep their
+    own snapshot. `cached` memoizes derived values (such as the meme category)
+    for a TTL, with concurrent callers sharing one load (single-flight).
+    Every call is metered by a `CmcCreditMeter`; when a load fails or the daily
+    budget is spent, the last cached value is served even if it has expired.
+    """
+
+    def __init__(self, api_key: str, base_url: str = CMC_API_BASE_URL, max_retries: int = CMC_API_MAX_RETRIES):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.meter = CmcCreditMeter()
+        self.requests_made = 0  # Solicitudes enviadas a CMC
+        self.cache_hits = 0  # Respuestas servidas desde la caché o desde una llamada en vuelo
+        self.stale_served = 0  # Respuestas caducadas servidas por fallo o presupuesto agotado
+        self._cache: dict = {}  # clave -> (expira_en, valor)
+        self._in_flight: dict = {}  # clave -> Future de la llamada compartida
+        self._client: Union[httpx.AsyncClient, None] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # El pool se crea de forma perezosa para que quede ligado al event loop del bot
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Accepts": "application/json", "X-CMC_PRO_API_KEY": self.api_key or ""},
+                timeout=httpx.Timeout(15.0, connect=5.0),
+                limits=httpx.Limits(max_connections=5, max_keepalive_connections=2),
+            )
+        return self._client
+
+    async def cached(self, key, ttl: float, loader):
+        """
+        Returns the cached value for `key`, or runs `loader()` once for all concurrent callers.
+
+        Failed loads (None) are not cached, so the next caller retries upstream;
+        meanwhile the expired value, if any, is returned instead.
+        """
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.cache_hits += 1
+            return entry[1]
+
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._load(key, ttl, loader))
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.cache_hits += 1
+
+        # shield: si un llamador se cancela, la llamada compartida sigue para los demás
+        return await asyncio.shield(future)
+
+    async def _load(self, key, ttl: float, loader):
+        value = await loader()
+        if value is not None:
+            self._cache[key] = (time.monotonic() + ttl, value)
+        elif key in self._cache:
+            self.stale_served += 1
+            value = self._cache[key][1]
+        return value
+
+    async def request(self, endpoint: str, params: dict = None) -> Union[dict, None]:
+        """
+        Performs an uncached GET request against the CoinMarketCap API.
+
+        Returns:
+            dict: Parsed JSON response or None in case of an error or an exhausted daily budget.
+        """
+        if self.meter.exhausted():
+            self.meter.deny(endpoint)
+            return None
+
+        client = self._get_client()
+
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            self.requests_made += 1
+            try:
+                response = await client.get(endpoint, params=params)
+            except httpx.HTTPError as e:
+                self.meter.record(endpoint, 0)
+                print(f"❌ Network error in CoinMarketCap request ({endpoint}): {e}")
+                if last_attempt:
+                    return None
+                await asyncio.sleep(2 ** attempt + random.uniform(0, 1))
+                continue
+
+            if response.status_code == 429 or response.status_code >= 500:
+                self.meter.record(endpoint, 0)
+                print(f"⚠️ CoinMarketCap returned {response.status_code} for {endpoint}.")
+                if last_attempt:
+                    return None
+                await asyncio.sleep(2 ** attempt + random.uniform(0, 1))
+                continue
+
+            try:
+                response.raise_for_status()
+                payload = response.json()
+            except (httpx.HTTPStatusError, ValueError) as e:
+                self.meter.record(endpoint, 0)
+                print(f"❌ Error in CoinMarketCap request ({endpoint}): {e}")
+                return None
+            self.meter.record(endpoint, cmc_credit_count(payload))
+            return payload
 
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Error in X API request: {e}")
         return None
 
+    def gauges(self) -> dict:
+        now = time.monotonic()
+        return {
+            "cmc_requests": self.requests_made,
+            "cmc_cache_hits": self.cache_hits,
+            "cmc_stale_served": self.stale_served,
+            "cmc_cache_entries": sum(1 for expires_at, _ in self._cache.values() if expires_at > now),
+            "cmc_in_flight": len(self._in_flight),
+            **self.meter.gauges(),
+        }
+
+    async def aclose(self):
+        """
+        Closes the underlying connection pool.
+        """
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+
+# Cliente compartido por todo el bot
+cmc_client = CoinMarketCapClient(COINMARKETCAP_API_KEY)
+
+
+async def cmc_get_meme_category() -> Union[dict, None]:
+    """
+    Resolves CoinMarketCap's meme category (id, name, top coins), cached for hours.
+
+    Only the matching category is kept; the full `/categories` payload is discarded.
+    """
+    async def load():
+        response = await cmc_client.request("cryptocurrency/categories")
+        categories = (response or {}).get("data", [])
+        category = next((cat for cat in categories if "meme" in cat.get("name", "").lower()), None)
+        if category is None and response is not None:
+            print("⚠️ Meme category not found in CoinMarketCap categories.")
+        return category
+
+    return await cmc_client.cached(("meme_category",), CMC_MEME_CATEGORY_TTL, load)
+
+
+
+
+
+#DATA BASE BLOCK    # Bloque de comandos y funciones relacionadas con la base de datos
+
+# Initialize SQLite database
+from sqlite3 import Connection
+from pathlib import Path
+import sqlite3
+import time
+
+# Database path and settings
+db_path = Path(os.getenv("DB_PATH", Path(__file__).parent / "gorilla_raids.db"))
+DB_BUSY_TIMEOUT_MS = 5000  # Espera máxima ante un bloqueo de escritura
+DB_READER_THREADS = 4  # Hilos de lectura; las escrituras usan un único hilo dedicado
+
 # Database schema creation and migration
+# Cada migración se aplica una sola vez; PRAGMA user_version guarda la última aplicada.
+
+def migrate_v1_base_schema(connection: Connection):
+    """
+    Creates the base tables and moves data out of the legacy 'raids_old' table.
+    """
+    # Create table for raids
+    connection.execute("""
+    CREATE TABLE IF NOT EXISTS raids (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        description TEXT NOT NULL,
+        username TEXT NOT NULL,  -- Associated account username
+        tweet_id TEXT,  -- Associated tweet ID (optional for follows)
+        action_type TEXT NOT NULL,  -- Required action type (retweet, like, follow)
+        creator_id INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """)
+
+    # Create table for proofs associated with raids
+    connection.execute("""
+    CREATE TABLE IF NOT EXISTS proofs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        raid_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        username TEXT,
+        proof TEXT NOT NULL,
+        submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (raid_id) REFERENCES raids (id) ON DELETE CASCADE
+    );
+    """)
+
+    # Create table for sponsored coins
+    connection.execute("""
+    CREATE TABLE IF NOT EXISTS sponsored_coins (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        symbol TEXT NOT NULL,
+        price REAL NOT NULL,
+        market_cap REAL NOT NULL,
+        url TEXT NOT NULL,
+        author TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """)
+
+    # Migrate data from the old "raids" table if it exists
+    legacy = connection.execute("""
+    SELECT name FROM sqlite_master WHERE type='table' AND name='raids_old';
+    """).fetchone()
+    if legacy:
+        connection.execute("""
+        INSERT INTO raids (id, name, description, username, tweet_id, action_type, creator_id, created_at)
+        SELECT id, name, description,
+               COALESCE(username, 'default_username'),
+               COALESCE(tweet_id, 'default_tweet_id'),
+               action_type, creator_id, created_at
+        FROM raids_old;
+        """)
+        # Drop the old table
+        connection.execute("DROP TABLE raids_old;")
+
+    # Create table for raid participants
+    connection.execute("""
+    CREATE TABLE IF NOT EXISTS participants (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        raid_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        username TEXT,
+        status TEXT DEFAULT 'pending',  -- Participant status (pending, completed)
+        FOREIGN KEY (raid_id) REFERENCES raids (id) ON DELETE CASCADE
+    );
+    """)
+
+
+def migrate_v2_raid_cursors(connection: Connection):
+    """
+    Creates the table holding incremental verification progress (one row per raid).
+    """
+    connection.execute("""
+    CREATE TABLE IF NOT EXISTS raid_cursors (
+        raid_id INTEGER PRIMARY KEY,
+        head_id TEXT,  -- Newest interaction seen by the last pass
+        next_token TEXT,  -- Pagination token to resume an unfinished backfill
+        backfill_watermark INTEGER,  -- Highest participant ID the running backfill will cover
+        watermark INTEGER NOT NULL DEFAULT 0,  -- Highest participant ID already covered by a full scan
+        target_total INTEGER,  -- Interaction count of the target at the last target-list pass
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (raid_id) REFERENCES raids (id) ON DELETE CASCADE
+    );
+    """)
+
+    # Bases creadas antes de que existiera la columna target_total
+    columns = {column[1] for column in connection.execute("PRAGMA table_info(raid_cursors)")}
+    if "target_total" not in columns:
+        connection.execute("ALTER TABLE raid_cursors ADD COLUMN target_total INTEGER")
+
+
+def migrate_v3_indexes_and_uniqueness(connection: Connection):
+    """
+    Removes duplicated participants/proofs and adds the lookup indexes and UNIQUE(raid_id, user_id) constraints.
+    """
+    # Conservar una fila por (raid_id, user_id): la completada si existe, si no la más antigua
+    connection.execute("""
+    DELETE FROM participants
+    WHERE id NOT IN (
+        SELECT COALESCE(MIN(CASE WHEN status = 'completed' THEN id END), MIN(id))
+        FROM participants
+        GROUP BY raid_id, user_id
+    );
+    """)
+    connection.execute("""
+    DELETE FROM proofs
+    WHERE id NOT IN (SELECT MIN(id) FROM proofs GROUP BY raid_id, user_id);
+    """)
+
+    connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_participants_raid_user ON participants (raid_id, user_id);")
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_participants_raid_status ON participants (raid_id, status);")
+    # El índice único también sirve las búsquedas por proofs(raid_id)
+    connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_proofs_raid_user ON proofs (raid_id, user_id);")
+
+
+def migrate_v4_raid_boards(connection: Connection):
+    """
+    Creates the table holding the live raid board message of each chat.
+    """
+    connection.execute("""
+    CREATE TABLE IF NOT EXISTS raid_boards (
+        chat_id INTEGER PRIMARY KEY,
+        message_id INTEGER NOT NULL,  -- Mensaje del tablero que se edita en el sitio
+        content_hash TEXT,  -- Hash del último contenido publicado
+        pinned INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """)
+
+
+# Recalcula los contadores desnormalizados de cada raid a partir de participants
+RAID_COUNTERS_BACKFILL_SQL = """
+UPDATE raids SET
+    participant_count = (SELECT COUNT(*) FROM participants p WHERE p.raid_id = raids.id),
+    completed_count = (SELECT COUNT(*) FROM participants p WHERE p.raid_id = raids.id AND p.status = 'completed');
+"""
+
+
+def migrate_v5_raid_counters(connection: Connection):
+    """
+    Stores participant_count/completed_count on raids, backfills them and keeps them exact with triggers.
+    """
+    columns = {column[1] for column in connection.execute("PRAGMA table_info(raids)")}
+    if "participant_count" not in columns:
+        connection.execute("ALTER TABLE raids ADD COLUMN participant_count INTEGER NOT NULL DEFAULT 0")
+    if "completed_count" not in columns:
+        connection.execute("ALTER TABLE raids ADD COLUMN completed_count INTEGER NOT NULL DEFAULT 0")
+    connection.execute(RAID_COUNTERS_BACKFILL_SQL)
+
+    connection.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_participants_insert_counters
+    AFTER INSERT ON participants
+    BEGIN
+        UPDATE raids SET
+            participant_count = participant_count + 1,
+            completed_count = completed_count + (NEW.status = 'completed')
+        WHERE id = NEW.raid_id;
+    END;
+    """)
+    connection.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_participants_delete_counters
+    AFTER DELETE ON participants
+    BEGIN
+        UPDATE raids SET
+            participant_count = participant_count - 1,
+            completed_count = completed_count - (OLD.status = 'completed')
+        WHERE id = OLD.raid_id;
+    END;
+    """)
+    # Un cambio de estado (o de raid) resta en la fila vieja y suma en la nueva
+    connection.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_participants_update_counters
+    AFTER UPDATE OF status, raid_id ON participants
+    BEGIN
+        UPDATE raids SET
+            participant_count = participant_count - 1,
+            completed_count = completed_count - (OLD.status = 'completed')
+        WHERE id = OLD.raid_id;
+        UPDATE raids SET
+            participant_count = participant_count + 1,
+            completed_count = completed_count + (NEW.status = 'completed')
+        WHERE id = NEW.raid_id;
+    END;
+    """)
+
+    # El listado de raids se ordena por fecha de creación
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_raids_created_at ON raids (created_at);")
+
+
+def migrate_v6_raid_order_indexes(connection: Connection):
+    """
+    Indexes participants and proofs by raid in id order, for keyset pages and per-raid previews.
+    """
+    # Un índice sobre raid_id incluye el rowid: sirve "WHERE raid_id = ? ORDER BY id LIMIT n" sin ordenar
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_participants_raid_id ON participants (raid_id);")
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_proofs_raid_id ON proofs (raid_id);")
+
+
+def migrate_v7_sponsored_cmc_ids(connection: Connection):
+    """
+    Adds an optional CoinMarketCap id to sponsored coins, used to refresh their price and market cap.
+    """
+    columns = {column[1] for column in connection.execute("PRAGMA table_info(sponsored_coins)")}
+    if "cmc_id" not in columns:
+        connection.execute("ALTER TABLE sponsored_coins ADD COLUMN cmc_id INTEGER")
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_sponsored_coins_cmc_id ON sponsored_coins (cmc_id);")
 
-# Create table for raids
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS raids (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    name TEXT NOT NULL,
-    description TEXT NOT NULL,
-    username TEXT NOT NULL,  -- Associated account username
-    tweet_id TEXT,  -- Associated tweet ID (optional for follows)
-    action_type TEXT NOT NULL,  -- Required action type (retweet, like, follow)
-    creator_id INTEGER NOT NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
-""")
-
-# Create table for proofs associated with raids
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS proofs (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    raid_id INTEGER NOT NULL,
-    user_id INTEGER NOT NULL,
-    username TEXT,
-    proof TEXT NOT NULL,
-    submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (raid_id) REFERENCES raids (id) ON DELETE CASCADE
-);
-""")
-
-# Create table for sponsored coins
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS sponsored_coins (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    name TEXT NOT NULL,
-    symbol TEXT NOT NULL,
-    price REAL NOT NULL,
-    market_cap REAL NOT NULL,
-    url TEXT NOT NULL,
-    author TEXT NOT NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
-""")
-
-# Migrate data from the old "raids" table if it exists
-cursor.execute("""
-SELECT name FROM sqlite_master WHERE type='table' AND name='raids_old';
-""")
-if cursor.fetchone():
-    cursor.execute("""
-    INSERT INTO raids (id, name, description, username, tweet_id, action_type, creator_id, created_at)
-    SELECT id, name, description,
-           COALESCE(username, 'default_username'),
-           COALESCE(tweet_id, 'default_tweet_id'),
-           action_type, creator_id, created_at
-    FROM raids_old;
+
+def migrate_v8_raid_lockdowns(connection: Connection):
+    """
+    Creates the table of active raid lockdowns, so a restart can still reopen a locked chat.
+    """
+    connection.execute("""
+    CREATE TABLE IF NOT EXISTS raid_lockdowns (
+        chat_id INTEGER PRIMARY KEY,
+        unlock_at REAL NOT NULL,  -- Epoch (time.time()) en que debe reabrirse el chat
+        permissions TEXT NOT NULL  -- JSON de los ChatPermissions previos al bloqueo
+    );
     """)
-    # Drop the old table
-    cursor.execute("DROP TABLE raids_old;")
-
-# Create table for raid participants
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS participants (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    raid_id INTEGER NOT NULL,
-    user_id INTEGER NOT NULL,
-    username TEXT,
-    status TEXT DEFAULT 'pending',  -- Participant status (pending, completed)
-    FOREIGN KEY (raid_id) REFERENCES raids (id) ON DELETE CASCADE
-);
-""")
-
-# Commit database schema changes
-conn.commit()
-print("✅ Database schema and tables created/updated successfully!")
+
+
+MIGRATIONS = [
+    migrate_v1_base_schema,
+    migrate_v2_raid_cursors,
+    migrate_v3_indexes_and_uniqueness,
+    migrate_v4_raid_boards,
+    migrate_v5_raid_counters,
+    migrate_v6_raid_order_indexes,
+    migrate_v7_sponsored_cmc_ids,
+    migrate_v8_raid_lockdowns,
+]
+
+
+def run_migrations(connection: Connection):
+    """
+    Applies the pending schema migrations, each one in its own transaction.
+    Does nothing when PRAGMA user_version says the schema is already current.
+    """
+    current_version = connection.execute("PRAGMA user_version").fetchone()[0]
+    if current_version >= len(MIGRATIONS):
+        print(f"✅ Database schema is up to date (version {current_version}).")
+        return
+
+    for version in range(current_version + 1, len(MIGRATIONS) + 1):
+        migration = MIGRATIONS[version - 1]
+        try:
+            connection.execute("BEGIN")
+            migration(connection)
+            connection.execute(f"PRAGMA user_version = {version}")
+            connection.commit()
+            print(f"✅ Applied database migration {version}: {migration.__name__}")
+        except sqlite3.Error:
+            connection.rollback()
+            print(f"❌ Database migration {version} failed. Schema left at version {version - 1}.")
+            raise
+
+
+# Filas tipadas devueltas por la capa de datos
+class Raid(NamedTuple):
+    id: int
+    name: str
+    description: str
+    username: str
+    tweet_id: Union[str, None]
+    action_type: str
+
+
+class RaidSummary(NamedTuple):
+    id: int
+    name: str
+    description: str
+    username: str
+    tweet_id: Union[str, None]
+    action_type: str
+    participant_count: int
+    completed_count: int
+
+
+class Page(NamedTuple):
+    items: list
+    first_id: Union[int, None]  # Cursores de la página (id de la primera y última fila)
+    last_id: Union[int, None]
+    has_prev: bool
+    has_next: bool
+
+
+class ParticipantStatus(NamedTuple):
+    username: str
+    status: str
+
+
+class PendingParticipant(NamedTuple):
+    id: int
+    user_id: int
+    username: str
+
+
+class Proof(NamedTuple):
+    username: str
+    proof: str
+    submitted_at: str
+
+
+class RaidDetails(NamedTuple):
+    participants: list  # ParticipantStatus
+    more_participants: bool
+    proofs: list  # Proof
+    more_proofs: bool
+
+
+class SponsoredCoin(NamedTuple):
+    id: int
+    name: str
+    symbol: str
+    price: float
+    market_cap: float
+    url: str
+    cmc_id: Union[int, None] = None  # ID de CoinMarketCap; None = precio mantenido a mano
+
+
+class RaidLockdown(NamedTuple):
+    chat_id: int
+    unlock_at: float
+    permissions: str
+
+
+class RaidBoard(NamedTuple):
+    chat_id: int
+    message_id: int
+    content_hash: Union[str, None]
+    pinned: bool
+
+
+class Database:
+    """
+    Async data-access layer over SQLite.
+
+    Writes run on one dedicated thread and reads on a small pool of reader
+    threads, each thread with its own connection. With WAL enabled readers never
+    wait behind the writer, no SQLite call runs on the event loop and every
+    operation uses its own cursor.
+    """
+
+    def __init__(self, path: Path, readers: int = DB_READER_THREADS):
+        self.path = path
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._read_executor = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+        self._local = threading.local()
+
+    def connect(self) -> Connection:
+        """
+        Opens a new connection with the WAL/synchronous/busy_timeout settings.
+        """
+        connection = sqlite3.connect(self.path, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")  # Seguro con WAL y sin fsync por commit
+        connection.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+        return connection
+
+    def migrate(self):
+        """
+        Applies pending schema migrations synchronously (called once at startup).
+        """
+        connection = self.connect()
+        try:
+            run_migrations(connection)
+        finally:
+            connection.close()
+
+    def _thread_connection(self) -> Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self.connect()
+        return connection
+
+    def _run_read(self, operation):
+        return operation(self._thread_connection())
+
+    def _run_write(self, operation):
+        connection = self._thread_connection()
+        with connection:  # Una transacción por operación
+            return operation(connection)
+
+    async def _read(self, operation):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._read_executor, self._run_read, operation)
+
+    async def _write(self, operation):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._write_executor, self._run_write, operation)
+
+    def close(self):
+        """
+        Stops the database threads. Their connections are closed when the threads exit.
+        """
+        self._write_executor.shutdown(wait=True)
+        self._read_executor.shutdown(wait=True)
+
+    # Raids
+
+    async def create_raid(self, name: str, description: str, username: str, tweet_id: Union[str, None],
+                          action_type: str, creator_id: int) -> int:
+        def operation(connection: Connection) -> int:
+            return connection.execute("""
+                INSERT INTO raids (name, description, username, tweet_id, action_type, creator_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (name, description, username, tweet_id, action_type, creator_id)).lastrowid
+        return await self._write(operation)
+
+    async def get_raid(self, raid_id: int) -> Union[Raid, None]:
+        def operation(connection: Connection) -> Union[Raid, None]:
+            row = connection.execute("""
+                SELECT id, name, description, username, tweet_id, action_type FROM raids WHERE id = ?
+            """, (raid_id,)).fetchone()
+            return Raid(*row) if row else None
+        return await self._read(operation)
+
+    async def list_raids(self) -> list:
+        """
+        Returns every raid as `Raid` rows (verification targets).
+        """
+        def operation(connection: Connection) -> list:
+            rows = connection.execute("SELECT id, name, description, username, tweet_id, action_type FROM raids")
+            return [Raid(*row) for row in rows]
+        return await self._read(operation)
+
+    async def get_raid_summary(self, raid_id: int) -> Union[RaidSummary, None]:
+        def operation(connection: Connection) -> Union[RaidSummary, None]:
+            row = connection.execute("""
+                SELECT id, name, description, username, tweet_id, action_type, participant_count, completed_count
+                FROM raids WHERE id = ?
+            """, (raid_id,)).fetchone()
+            return RaidSummary(*row) if row else None
+        return await self._read(operation)
+
+    @staticmethod
+    def _keyset_page(connection: Connection, select_sql: str, where_sql: str, params: tuple,
+                     cursor: Union[int, None], backwards: bool, limit: int, descending: bool = False) -> tuple:
+        """
+        Reads one page ordered by `id` using the previous page's edge ID as cursor (WHERE id > ? LIMIT n).
+
+        Returns (rows in display order, has_prev, has_next). The first selected column must be `id`.
+        """
+        forward = ("<", "DESC") if descending else (">", "ASC")
+        backward = (">", "ASC") if descending else ("<", "DESC")
+        operator, order = backward if backwards else forward
+
+        conditions = [where_sql] if where_sql else []
+        if cursor is not None:
+            conditions.append(f"id {operator} ?")
+            params = (*params, cursor)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = connection.execute(
+            f"{select_sql} {where} ORDER BY id {order} LIMIT ?", (*params, limit + 1)
+        ).fetchall()
+
+        more = len(rows) > limit  # Una fila extra dice si hay más en la dirección del recorrido
+        rows = rows[:limit]
+        if backwards:
+            rows.reverse()
+            return rows, more, True
+        return rows, cursor is not None, more
+
+    async def list_raid_summaries_page(self, cursor: Union[int, None] = None, backwards: bool = False,
+                                       limit: int = 5) -> Page:
+        """
+        Returns one page of raids with their counters, newest first.
+        """
+        def operation(connection: Connection) -> Page:
+            rows, has_prev, has_next = self._keyset_page(connection, """
+                SELECT id, name, description, username, tweet_id, action_type, participant_count, completed_count
+                FROM raids
+            """, "", (), cursor, backwards, limit, descending=True)
+            items = [RaidSummary(*row) for row in rows]
+            return Page(items, rows[0][0] if rows else None, rows[-1][0] if rows else None, has_prev, has_next)
+        return await self._read(operation)
+
+    async def list_raid_summaries(self) -> list:
+        """
+        Returns every raid with its participant counters, newest first (`RaidSummary` rows).
+        """
+        def operation(connection: Connection) -> list:
+            rows = connection.execute("""
+                SELECT id, name, description, username, tweet_id, action_type, participant_count, completed_count
+                FROM raids
+                ORDER BY created_at DESC
+            """)
+            return [RaidSummary(*row) for row in rows]
+        return await self._read(operation)
+
+    async def check_raid_counters(self, repair: bool = False) -> list:
+        """
+        Compares the stored raid counters with a live COUNT over participants.
+
+        Returns the mismatches as (raid_id, stored, actual) tuples, where each
+        count is a (participants, completed) pair. With `repair` the counters are
+        recomputed in the same transaction.
+        """
+        def operation(connection: Connection) -> list:
+            rows = connection.execute("""
+                SELECT r.id, r.participant_count, r.completed_count,
+                       COUNT(p.id), COALESCE(SUM(p.status = 'completed'), 0)
+                FROM raids r
+                LEFT JOIN participants p ON p.raid_id = r.id
+                GROUP BY r.id
+            """).fetchall()
+            mismatches = [
+                (raid_id, (stored_total, stored_completed), (actual_total, actual_completed))
+                for raid_id, stored_total, stored_completed, actual_total, actual_completed in rows
+                if (stored_total, stored_completed) != (actual_total, actual_completed)
+            ]
+            if repair and mismatches:
+                connection.execute(RAID_COUNTERS_BACKFILL_SQL)
+            return mismatches
+        return await (self._write(operation) if repair else self._read(operation))
+
+    async def delete_all_raids(self):
+        def operation(connection: Connection):
+            connection.execute("DELETE FROM participants;")
+            connection.execute("DELETE FROM proofs;")
+            connection.execute("DELETE FROM raid_cursors;")
+            connection.execute("DELETE FROM raids;")
+        await self._write(operation)
+
+    async def reset_database(self):
+        """
+        Clears all raid data and resets the ID sequences.
+        """
+        def operation(connection: Connection):
+            connection.execute("DELETE FROM raids;")
+            connection.execute("DELETE FROM participants;")
+            connection.execute("DELETE FROM proofs;")
+            connection.execute("DELETE FROM raid_cursors;")
+            connection.execute("DELETE FROM sqlite_sequence WHERE name IN ('raids', 'participants', 'proofs');")
+        await self._write(operation)
+
+    # Participants
+
+    async def add_participant(self, raid_id: int, user_id: int, username: str) -> bool:
+        """
+        Registers a participant. Returns False if the user had already joined the raid.
+        """
+        def operation(connection: Connection) -> bool:
+            # UNIQUE(raid_id, user_id) descarta inscripciones repetidas
+            return connection.execute(
+                "INSERT OR IGNORE INTO participants (raid_id, user_id, username) VALUES (?, ?, ?)",
+                (raid_id, user_id, username)
+            ).rowcount > 0
+        return await self._write(operation)
+
+    async def get_participants_page(self, raid_id: int, cursor: Union[int, None] = None,
+                                    backwards: bool = False, limit: int = 50) -> Page:
+        """
+        Returns one page of a raid's participants in join order (`ParticipantStatus` items).
+        """
+        def operation(connection: Connection) -> Page:
+            rows, has_prev, has_next = self._keyset_page(
+                connection, "SELECT id, username, status FROM participants", "raid_id = ?", (raid_id,),
+                cursor, backwards, limit
+            )
+            items = [ParticipantStatus(username, status) for _, username, status in rows]
+            return Page(items, rows[0][0] if rows else None, rows[-1][0] if rows else None, has_prev, has_next)
+        return await self._read(operation)
+
+    async def get_pending_participants(self, raid_id: int) -> tuple:
+        """
+        Returns the highest participant ID of the raid and its pending participants (`PendingParticipant` rows).
+        """
+        def operation(connection: Connection) -> tuple:
+            max_participant_id = connection.execute(
+                "SELECT COALESCE(MAX(id), 0) FROM participants WHERE raid_id = ?", (raid_id,)
+            ).fetchone()[0]
+            rows = connection.execute("""
+                SELECT id, user_id, username FROM participants
+                WHERE raid_id = ? AND status = 'pending'
+            """, (raid_id,))
+            return max_participant_id, [PendingParticipant(*row) for row in rows]
+        return await self._read(operation)
+
+    # Proofs
+
+    async def get_proofs_page(self, raid_id: int, cursor: Union[int, None] = None,
+                              backwards: bool = False, limit: int = 15) -> Page:
+        """
+        Returns one page of a raid's proofs in submission order (`Proof` items).
+        """
+        def operation(connection: Connection) -> Page:
+            rows, has_prev, has_next = self._keyset_page(
+                connection, "SELECT id, username, proof, submitted_at FROM proofs", "raid_id = ?", (raid_id,),
+                cursor, backwards, limit
+            )
+            items = [Proof(*row[1:]) for row in rows]
+            return Page(items, rows[0][0] if rows else None, rows[-1][0] if rows else None, has_prev, has_next)
+        return await self._read(operation)
+
+    @staticmethod
+    def _grouped_rows(connection: Connection, table: str, columns: str, raid_ids: Union[list, None],
+                      limit: Union[int, None]):
+        """
+        Streams (raid_id, *columns) rows of several raids in one query, in id order.
+        With `limit` each raid yields at most limit + 1 rows, read through the (raid_id, id) index.
+        """
+        where, params = "", ()
+        if raid_ids is not None:
+            where = f"WHERE {'raid_id' if limit is None else 'r.id'} IN ({', '.join('?' * len(raid_ids))})"
+            params = tuple(raid_ids)
+        if limit is None:
+            return connection.execute(f"SELECT raid_id, {columns} FROM {table} {where} ORDER BY id", params)
+        # Un LIMIT por raid: la subconsulta correlacionada sólo lee las primeras filas de cada uno
+        selected = ", ".join(f"t.{column.strip()}" for column in columns.split(","))
+        return connection.execute(f"""
+            SELECT r.id, {selected}
+            FROM raids r
+            JOIN {table} t ON t.id IN (SELECT id FROM {table} WHERE raid_id = r.id ORDER BY id LIMIT ?)
+            {where}
+            ORDER BY t.id
+        """, (limit + 1, *params))
+
+    async def get_raid_details(self, raid_ids: Union[list, None] = None, limit: Union[int, None] = None) -> dict:
+        """
+        Loads participants and proofs of many raids with one grouped query per table.
+
+        Returns {raid_id: RaidDetails}; raids without rows are absent. With `limit`
+        only the first rows of each raid are kept and the `more_*` flags say whether
+        some were left out. `raid_ids=None` covers every raid.
+        """
+        if raid_ids is not None and not raid_ids:
+            return {}
+
+        def operation(connection: Connection) -> dict:
+            # Agrupar en Python mientras se leen las filas
+            participants = defaultdict(list)
+            for raid_id, username, status in self._grouped_rows(
+                connection, "participants", "username, status", raid_ids, limit
+            ):
+                participants[raid_id].append(ParticipantStatus(username, status))
+
+            proofs = defaultdict(list)
+            for raid_id, username, proof, submitted_at in self._grouped_rows(
+                connection, "proofs", "username, proof, submitted_at", raid_ids, limit
+            ):
+                proofs[raid_id].append(Proof(username, proof, submitted_at))
+
+            details = {}
+            for raid_id in participants.keys() | proofs.keys():
+                raid_participants = participants.get(raid_id, [])
+                raid_proofs = proofs.get(raid_id, [])
+                more_participants = limit is not None and len(raid_participants) > limit
+                more_proofs = limit is not None and len(raid_proofs) > limit
+                details[raid_id] = RaidDetails(
+                    raid_participants[:limit] if more_participants else raid_participants, more_participants,
+                    raid_proofs[:limit] if more_proofs else raid_proofs, more_proofs,
+                )
+            return details
+        return await self._read(operation)
+
+    async def register_proofs(self, raid_id: int, action_type: str, matches: list, state: dict = None):
+        """
+        Marks the matched participants as completed and records their proofs in a single transaction.
+
+        The update only touches rows that are still pending and UNIQUE(raid_id, user_id)
+        on proofs ignores repeated inserts, so re-running a pass never creates duplicates.
+        When `state` is given the raid cursor is saved in the same transaction.
+        """
+        proof_text = f"Completed {action_type}"
+
+        def operation(connection: Connection):
+            if matches:
+                connection.executemany("""
+                    UPDATE participants
+                    SET status = 'completed'
+                    WHERE id = ? AND status = 'pending'
+                """, [(participant.id,) for participant in matches])
+                connection.executemany("""
+                    INSERT OR IGNORE INTO proofs (raid_id, user_id, username, proof)
+                    VALUES (?, ?, ?, ?)
+                """, [(raid_id, participant.user_id, participant.username, proof_text) for participant in matches])
+            if state is not None:
+                self._save_raid_cursor(connection, raid_id, state)
+        await self._write(operation)
+
+    # Verification cursors
+
+    async def load_raid_cursor(self, raid_id: int) -> dict:
+        """
+        Returns the persisted verification progress of a raid (defaults for a raid never verified).
+        """
+        def operation(connection: Connection) -> dict:
+            row = connection.execute("""
+                SELECT head_id, next_token, backfill_watermark, watermark, target_total
+                FROM raid_cursors WHERE raid_id = ?
+            """, (raid_id,)).fetchone()
+            if not row:
+                return {"head_id": None, "next_token": None, "backfill_watermark": None, "watermark": 0, "target_total": None}
+            head_id, next_token, backfill_watermark, watermark, target_total = row
+            return {
+                "head_id": head_id, "next_token": next_token, "backfill_watermark": backfill_watermark,
+                "watermark": watermark, "target_total": target_total,
+            }
+        return await self._read(operation)
+
+    @staticmethod
+    def _save_raid_cursor(connection: Connection, raid_id: int, state: dict):
+        connection.execute("""
+            INSERT INTO raid_cursors (raid_id, head_id, next_token, backfill_watermark, watermark, target_total, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(raid_id) DO UPDATE SET
+                head_id = excluded.head_id,
+                next_token = excluded.next_token,
+                backfill_watermark = excluded.backfill_watermark,
+                watermark = excluded.watermark,
+                target_total = excluded.target_total,
+                updated_at = excluded.updated_at
+        """, (raid_id, state["head_id"], state["next_token"], state["backfill_watermark"], state["watermark"], state["target_total"]))
+
+    # Raid boards
+
+    async def get_raid_board(self, chat_id: int) -> Union[RaidBoard, None]:
+        def operation(connection: Connection) -> Union[RaidBoard, None]:
+            row = connection.execute("""
+                SELECT chat_id, message_id, content_hash, pinned FROM raid_boards WHERE chat_id = ?
+            """, (chat_id,)).fetchone()
+            return RaidBoard(row[0], row[1], row[2], bool(row[3])) if row else None
+        return await self._read(operation)
+
+    async def list_raid_boards(self) -> list:
+        def operation(connection: Connection) -> list:
+            rows = connection.execute("SELECT chat_id, message_id, content_hash, pinned FROM raid_boards").fetchall()
+            return [RaidBoard(row[0], row[1], row[2], bool(row[3])) for row in rows]
+        return await self._read(operation)
+
+    async def save_raid_board(self, chat_id: int, message_id: int, content_hash: str, pinned: bool):
+        def operation(connection: Connection):
+            connection.execute("""
+                INSERT INTO raid_boards (chat_id, message_id, content_hash, pinned, updated_at)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(chat_id) DO UPDATE SET
+                    message_id = excluded.message_id,
+                    content_hash = excluded.content_hash,
+                    pinned = excluded.pinned,
+                    updated_at = excluded.updated_at
+            """, (chat_id, message_id, content_hash, int(pinned)))
+        await self._write(operation)
+
+    async def delete_raid_board(self, chat_id: int) -> bool:
+        def operation(connection: Connection) -> bool:
+            return connection.execute("DELETE FROM raid_boards WHERE chat_id = ?", (chat_id,)).rowcount > 0
+        return await self._write(operation)
+
+    # Raid lockdowns
+
+    async def save_raid_lockdown(self, chat_id: int, unlock_at: float, permissions: str):
+        def operation(connection: Connection):
+            connection.execute("""
+                INSERT INTO raid_lockdowns (chat_id, unlock_at, permissions) VALUES (?, ?, ?)
+                ON CONFLICT(chat_id) DO UPDATE SET
+                    unlock_at = excluded.unlock_at,
+                    permissions = excluded.permissions
+            """, (chat_id, unlock_at, permissions))
+        await self._write(operation)
+
+    async def delete_raid_lockdown(self, chat_id: int) -> bool:
+        def operation(connection: Connection) -> bool:
+            return connection.execute("DELETE FROM raid_lockdowns WHERE chat_id = ?", (chat_id,)).rowcount > 0
+        return await self._write(operation)
+
+    async def list_raid_lockdowns(self) -> list:
+        def operation(connection: Connection) -> list:
+            rows = connection.execute("SELECT chat_id, unlock_at, permissions FROM raid_lockdowns")
+            return [RaidLockdown(*row) for row in rows]
+        return await self._read(operation)
+
+    # Sponsored coins
+
+    async def add_sponsored_coin(self, name: str, symbol: str, price: float, market_cap: float, url: str, author: str) -> int:
+        """
+        Inserts a sponsored coin and returns its ID.
+        """
+        def operation(connection: Connection) -> int:
+            return connection.execute("""
+                INSERT INTO sponsored_coins (name, symbol, price, market_cap, url, author)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (name, symbol, price, market_cap, url, author)).lastrowid
+        return await self._write(operation)
+
+    async def edit_sponsored_coin(self, name: str, symbol: str, price: float, market_cap: float, url: str, author: str) -> bool:
+        """
+        Updates a sponsored coin by name. Returns False if no coin has that name.
+        """
+        def operation(connection: Connection) -> bool:
+            return connection.execute("""
+                UPDATE sponsored_coins
+                SET symbol = ?, price = ?, market_cap = ?, url = ?, author = ?
+                WHERE name = ?
+            """, (symbol, price, market_cap, url, author, name)).rowcount > 0
+        return await self._write(operation)
+
+    async def remove_sponsored_coin(self, name: str) -> bool:
+        """
+        Deletes a sponsored coin by name. Returns False if no coin has that name.
+        """
+        def operation(connection: Connection) -> bool:
+            return connection.execute("DELETE FROM sponsored_coins WHERE name = ?", (name,)).rowcount > 0
+        return await self._write(operation)
+
+    async def get_all_sponsored_coins(self) -> list:
+        def operation(connection: Connection) -> list:
+            rows = connection.execute("SELECT id, name, symbol, price, market_cap, url, cmc_id FROM sponsored_coins ORDER BY id")
+            return [SponsoredCoin(*row) for row in rows]
+        return await self._read(operation)
+
+    async def set_sponsored_coin_cmc_id(self, name: str, cmc_id: Union[int, None]) -> bool:
+        """
+        Maps every sponsored coin with this name to a CoinMarketCap id (None removes the mapping).
+        """
+        def operation(connection: Connection) -> bool:
+            return connection.execute(
+                "UPDATE sponsored_coins SET cmc_id = ? WHERE name = ?", (cmc_id, name)
+            ).rowcount > 0
+        return await self._write(operation)
+
+    async def update_sponsored_prices(self, prices: list) -> int:
+        """
+        Stores refreshed (price, market_cap, cmc_id) rows in one executemany. Returns the rows updated.
+        """
+        def operation(connection: Connection) -> int:
+            return connection.executemany(
+                "UPDATE sponsored_coins SET price = ?, market_cap = ? WHERE cmc_id = ?", prices
+            ).rowcount
+        return await self._write(operation)
+
+
+db = Database(db_path)
+db.migrate()
+
+print("✅ SQLite database initialized successfully!")
 
 # Functions for sponsored coins management
 
-def add_sponsored_coin(name, symbol, price, market_cap, url, author):
+class SponsoredCoinCache:
     """
-    Adds a new sponsored coin to the database.
+    In-process copy of the sponsored_coins table with write-through updates.
+
+    The table is read once; add/edit/remove write to SQLite first and then
+    patch the cached rows in place, so readers never query the database. The
+    HTML block shown by /top_meme_coins is rendered once per change of the
+    coins or of the live quotes and reused until the next change.
+    """
+
+    def __init__(self, database: Database):
+        self.database = database
+        self._coins: dict = {}  # id -> SponsoredCoin, en orden de alta
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        self._version = 0  # Aumenta con cada cambio de los datos
+        self._rendered = None  # (versión, cotizaciones usadas, HTML)
+
+    async def _ensure_loaded(self):
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if not self._loaded:
+                self._coins = {coin.id: coin for coin in await self.database.get_all_sponsored_coins()}
+                self._loaded = True
+
+    def _changed(self):
+        self._version += 1
+        self._rendered = None
+
+    async def coins(self) -> tuple:
+        await self._ensure_loaded()
+        return tuple(self._coins.values())
+
+    async def add(self, name: str, symbol: str, price: float, market_cap: float, url: str, author: str):
+        await self._ensure_loaded()
+        coin_id = await self.database.add_sponsored_coin(name, symbol, price, market_cap, url, author)
+        self._coins[coin_id] = SponsoredCoin(coin_id, name, symbol, price, market_cap, url)
+        self._changed()
+
+    async def edit(self, name: str, symbol: str, price: float, market_cap: float, url: str, author: str) -> bool:
+        await self._ensure_loaded()
+        if not await self.database.edit_sponsored_coin(name, symbol, price, market_cap, url, author):
+            return False
+        # Misma semántica que el UPDATE: todas las filas con ese nombre
+        for coin_id, coin in list(self._coins.items()):
+            if coin.name == name:
+                self._coins[coin_id] = coin._replace(symbol=symbol, price=price, market_cap=market_cap, url=url)
+        self._changed()
+        return True
+
+    async def remove(self, name: str) -> bool:
+        await self._ensure_loaded()
+        if not await self.database.remove_sponsored_coin(name):
+            return False
+        self._coins = {coin_id: coin for coin_id, coin in self._coins.items() if coin.name != name}
+        self._changed()
+        return True
+
+    async def set_cmc_id(self, name: str, cmc_id: Union[int, None]) -> bool:
+        await self._ensure_loaded()
+        if not await self.database.set_sponsored_coin_cmc_id(name, cmc_id):
+            return False
+        for coin_id, coin in list(self._coins.items()):
+            if coin.name == name:
+                self._coins[coin_id] = coin._replace(cmc_id=cmc_id)
+        self._changed()
+        return True
+
+    async def mapped_cmc_ids(self) -> set:
+        await self._ensure_loaded()
+        return {coin.cmc_id for coin in self._coins.values() if coin.cmc_id is not None}
+
+    async def apply_prices(self, prices: dict) -> int:
+        """
+        Writes refreshed prices ({cmc_id: (price, market_cap)}) with one executemany and patches the cache.
+        """
+        await self._ensure_loaded()
+        if not prices:
+            return 0
+        updated = await self.database.update_sponsored_prices(
+            [(price, market_cap, cmc_id) for cmc_id, (price, market_cap) in prices.items()]
+        )
+        for coin_id, coin in list(self._coins.items()):
+            if coin.cmc_id in prices:
+                price, market_cap = prices[coin.cmc_id]
+                self._coins[coin_id] = coin._replace(price=price, market_cap=market_cap)
+        self._changed()
+        return updated
+
+    async def render_html(self, quotes) -> str:
+        """
+        Returns the sponsored section of /top_meme_coins, rebuilt only when the coins or `quotes` changed.
+
+        Args:
+            quotes: Live CoinQuote by uppercase symbol for unmapped coins; mapped coins (cmc_id) and
+                coins without a quote use the stored price and market cap.
+        """
+        await self._ensure_loaded()
+        rendered = self._rendered
+        if rendered is not None and rendered[0] == self._version and rendered[1] is quotes:
+            return rendered[2]
+
+        block = ""
+        if self._coins:
+            block = "<b>📋 <u>Sponsored Meme Coins</u>:</b>\n\n"
+            for coin in self._coins.values():
+                name = html.escape(coin.name or "Unknown")
+                symbol = coin.symbol or "Unknown"
+                url = html.escape(coin.url or "#", quote=True)
+                live = quotes.get(symbol.upper()) if coin.cmc_id is None else None
+                price = live.price if live and live.price is not None else coin.price
+                market_cap = live.market_cap if live and live.market_cap is not None else coin.market_cap
+
+                block += (
+                    f"⭐ <b>{name} ({html.escape(symbol)})</b>\n"
+                    f"   💵 <i>Price:</i> <b>{format_usd(price)}</b>\n"
+                    f"   💰 <i>Market Cap:</i> <b>{format_usd(market_cap, 0)}</b>\n"
+                    f"   🔗 <a href='{url}'>Visit Website</a>\n\n"
+                )
+            # Separator between sponsored and top coins
+            block += "<b>──────────────────────────────</b>\n\n"
+
+        self._rendered = (self._version, quotes, block)
+        return block
+
+    def gauges(self) -> dict:
+        return {"sponsored_coins_cached": len(self._coins), "sponsored_cache_version": self._version}
+
+
+sponsored_coin_cache = SponsoredCoinCache(db)
+
+
+async def add_sponsored_coin(name, symbol, price, market_cap, url, author):
+    """
+    Adds a new sponsored coin to the database and the in-memory cache.
     """
     try:
-        cursor.execute("""
-        INSERT INTO sponsored_coins (name, symbol, price, market_cap, url, author)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """, (name, symbol, price, market_cap, url, author))
-        conn.commit()
+        await sponsored_coin_cache.add(name, symbol, price, market_cap, url, author)
         print(f"✅ Sponsored coin added: {name} ({symbol})")
     except Exception as e:
         print(f"❌ Error adding sponsored coin: {e}")
 
-def edit_sponsored_coin(name, new_symbol, new_price, new_market_cap, new_url, new_author):
+async def edit_sponsored_coin(name, new_symbol, new_price, new_market_cap, new_url, new_author):
     """
-    Edits an existing sponsored coin in the database.
+    Edits an existing sponsored coin in the database and the in-memory cache.
     """
     try:
-        cursor.execute("""
-        UPDATE sponsored_coins
-        SET symbol = ?, price = ?, market_cap = ?, url = ?, author = ?
-        WHERE name = ?
-        """, (new_symbol, new_price, new_market_cap, new_url, new_author, name))
-        conn.commit()
-        if cursor.rowcount == 0:
+        if not await sponsored_coin_cache.edit(name, new_symbol, new_price, new_market_cap, new_url, new_author):
             print(f"⚠️ No sponsored coin found with the name '{name}'.")
         else:
             print(f"✅ Sponsored coin updated: {name}")
     except Exception as e:
         print(f"❌ Error editing sponsored coin: {e}")
 
-def remove_sponsored_coin(name):
+async def remove_sponsored_coin(name):
     """
-    Removes a sponsored coin from the database by name.
+    Removes a sponsored coin by name from the database and the in-memory cache.
     """
     try:
-        cursor.execute("DELETE FROM sponsored_coins WHERE name = ?", (name,))
-        conn.commit()
-        if cursor.rowcount == 0:
+        if not await sponsored_coin_cache.remove(name):
             print(f"⚠️ No sponsored coin found with the name '{name}'.")
         else:
             print(f"✅ Sponsored coin removed: {name}")
     except Exception as e:
         print(f"❌ Error removing sponsored coin: {e}")
 
-def get_all_sponsored_coins():
+async def get_all_sponsored_coins():
     """
-    Fetches all sponsored coins from the database.
+    Returns all sponsored coins from the in-memory cache (loaded from the database on first use).
     """
     try:
-        cursor.execute("SELECT name, symbol, price, market_cap, url FROM sponsored_coins")
-        coins = cursor.fetchall()
-        return [{"name": coin[0], "symbol": coin[1], "price": coin[2], "market_cap": coin[3], "url": coin[4]} for coin in coins]
+        return await sponsored_coin_cache.coins()
     except Exception as e:
         print(f"❌ Error fetching sponsored coins: {e}")
-        return []
+        return ()
+
 
 from telegram import Update
 from telegram.ext import ContextTypes
@@ -275,53 +1764,457 @@ async def add_sponsored_coin_handler(update: Update, context: ContextTypes.DEFAU
             await update.message.reply_text("❌ Usage: /add_sponsored_coin <name> <symbol> <price> <market_cap> <url> <author>")
             return
 
-        name, symbol, price, market_cap, url, author = context.args
-        price = float(price)
-        market_cap = float(market_cap)
+        name, symbol, price, market_cap, url, author = context.args
+        price = float(price)
+        market_cap = float(market_cap)
+
+        await add_sponsored_coin(name, symbol, price, market_cap, url, author)
+        await update.message.reply_text(f"✅ Sponsored coin '{name}' added successfully!")
+    except ValueError:
+        await update.message.reply_text("❌ Invalid price or market cap format. Please enter numeric values.")
+    except Exception as e:
+        await update.message.reply_text(f"❌ Error: {e}")
+
+async def edit_sponsored_coin_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Handler for editing an existing sponsored coin.
+    Command format: /edit_sponsored_coin <name> <new_symbol> <new_price> <new_market_cap> <new_url> <new_author>
+    """
+    try:
+        if len(context.args) < 6:
+            await update.message.reply_text("❌ Usage: /edit_sponsored_coin <name> <new_symbol> <new_price> <new_market_cap> <new_url> <new_author>")
+            return
+
+        name, new_symbol, new_price, new_market_cap, new_url, new_author = context.args
+        new_price = float(new_price)
+        new_market_cap = float(new_market_cap)
+
+        await edit_sponsored_coin(name, new_symbol, new_price, new_market_cap, new_url, new_author)
+        await update.message.reply_text(f"✅ Sponsored coin '{name}' updated successfully!")
+    except ValueError:
+        await update.message.reply_text("❌ Invalid price or market cap format. Please enter numeric values.")
+    except Exception as e:
+        await update.message.reply_text(f"❌ Error: {e}")
+
+async def remove_sponsored_coin_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Handler for removing a sponsored coin.
+    Command format: /remove_sponsored_coin <name>
+    """
+    try:
+        if len(context.args) < 1:
+            await update.message.reply_text("❌ Usage: /remove_sponsored_coin <name>")
+            return
+
+        name = context.args[0]
+        await remove_sponsored_coin(name)
+        await update.message.reply_text(f"✅ Sponsored coin '{name}' removed successfully!")
+    except Exception as e:
+        await update.message.reply_text(f"❌ Error: {e}")
+
+async def map_sponsored_coin_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Handler for mapping a sponsored coin to its CoinMarketCap id so its price is refreshed automatically.
+    Command format: /map_sponsored_coin <name> <cmc_id|none>
+    """
+    if not await is_chat_admin(context, update.effective_chat.id, update.effective_user.id):
+        await update.message.reply_text("❌ This command is restricted to administrators.")
+        return
+
+    try:
+        if len(context.args) < 2:
+            await update.message.reply_text("❌ Usage: /map_sponsored_coin <name> <cmc_id|none>")
+            return
+
+        name, cmc_id = context.args[0], context.args[1]
+        cmc_id = None if cmc_id.lower() == "none" else int(cmc_id)
+
+        if not await sponsored_coin_cache.set_cmc_id(name, cmc_id):
+            await update.message.reply_text(f"⚠️ No sponsored coin found with the name '{name}'.")
+            return
+
+        if cmc_id is None:
+            await update.message.reply_text(f"✅ Sponsored coin '{name}' unmapped. Its price is now maintained by hand.")
+            return
+
+        # Refrescar ya el precio en lugar de esperar a la siguiente pasada
+        context.job_queue.run_once(refresh_sponsored_prices, when=0, name="sponsored_price_refresh_now")
+        await update.message.reply_text(f"✅ Sponsored coin '{name}' mapped to CoinMarketCap id {cmc_id}.")
+    except ValueError:
+        await update.message.reply_text("❌ Invalid CoinMarketCap id. Please enter a number or 'none'.")
+    except Exception as e:
+        await update.message.reply_text(f"❌ Error: {e}")
+
+
+
+
+#ADMIN CACHE BLOCK    # Bloque de caché de administradores por chat
+
+ADMIN_CACHE_TTL = 600  # Segundos que se considera válida la lista de administradores de un chat
+ADMIN_CACHE_ERROR_TTL = 30  # Reintento rápido si getChatAdministrators falla
+ADMIN_STATUSES = ("administrator", "creator")
+
+
+class ChatAdminCache:
+    """
+    Per-chat set of administrator IDs built from `getChatAdministrators`.
+
+    Sets expire after a TTL and are patched in place by `chat_member` updates,
+    so an admin check is an in-memory set lookup instead of a Telegram call.
+    """
+
+    def __init__(self, ttl: float = ADMIN_CACHE_TTL):
+        self.ttl = ttl
+        self._admins: dict = {}  # chat_id -> (expires_at, set de user_id)
+        self._locks: dict = {}  # Una sola recarga en vuelo por chat
+
+    def _fresh(self, chat_id: int) -> Union[set, None]:
+        entry = self._admins.get(chat_id)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    async def get_admins(self, bot, chat_id: int) -> set:
+        """
+        Returns the administrator IDs of a chat, reloading them when the cached set has expired.
+        """
+        admins = self._fresh(chat_id)
+        if admins is not None:
+            return admins
+
+        lock = self._locks.setdefault(chat_id, asyncio.Lock())
+        async with lock:
+            admins = self._fresh(chat_id)
+            if admins is not None:
+                return admins
+
+            try:
+                members = await bot.get_chat_administrators(chat_id)
+                admins = {member.user.id for member in members}
+                ttl = self.ttl
+            except Exception as e:
+                print(f"❌ Failed to load administrators for chat {chat_id}: {e}")
+                stale = self._admins.get(chat_id)
+                admins = stale[1] if stale else set()
+                ttl = ADMIN_CACHE_ERROR_TTL
+
+            self._admins[chat_id] = (time.monotonic() + ttl, admins)
+            return admins
+
+    async def is_admin(self, bot, chat_id: int, user_id: int) -> bool:
+        # Los chats privados (ID positivo) no tienen administradores
+        if chat_id > 0:
+            return False
+        return user_id in await self.get_admins(bot, chat_id)
+
+    def apply_member_update(self, chat_id: int, user_id: int, status: str):
+        """
+        Adds or removes a user from a cached admin set after a membership change.
+        """
+        entry = self._admins.get(chat_id)
+        if not entry:
+            return  # Sin caché para este chat: la próxima consulta la construye completa
+        if status in ADMIN_STATUSES:
+            entry[1].add(user_id)
+        else:
+            entry[1].discard(user_id)
+
+    def tracked_chats(self) -> int:
+        return len(self._admins)
+
+
+chat_admin_cache = ChatAdminCache()
+
+
+async def is_chat_admin(context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int) -> bool:
+    """
+    Tells whether a user is an administrator (or the creator) of a chat, using the cached admin set.
+    """
+    return await chat_admin_cache.is_admin(context.bot, chat_id, user_id)
+
+
+# Manejador de cambios de miembros: mantiene la caché de administradores al día
+async def track_chat_admins(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Keeps the cached admin sets in sync with promotions, demotions and departures.
+    """
+    change = update.chat_member or update.my_chat_member
+    if not change:
+        return
+    member = change.new_chat_member
+    chat_admin_cache.apply_member_update(change.chat.id, member.user.id, member.status)
+
+
+
+
+#TELEGRAM OUTBOX BLOCK    # Bloque de la cola central de envíos a Telegram
+
+TELEGRAM_GLOBAL_RATE = (30, 1.0)  # Mensajes por segundo para todo el bot
+TELEGRAM_GROUP_RATE = (20, 60.0)  # Mensajes por minuto en un mismo grupo
+TELEGRAM_PRIVATE_RATE = (1, 1.0)  # Mensajes por segundo en un chat privado
+OUTBOX_MAX_RETRIES = 5  # Reintentos de una llamada tras RetryAfter
 
-        add_sponsored_coin(name, symbol, price, market_cap, url, author)
-        await update.message.reply_text(f"✅ Sponsored coin '{name}' added successfully!")
-    except ValueError:
-        await update.message.reply_text("❌ Invalid price or market cap format. Please enter numeric values.")
-    except Exception as e:
-        await update.message.reply_text(f"❌ Error: {e}")
+# Clases de prioridad: un número menor se atiende antes
+PRIORITY_MODERATION = 0
+PRIORITY_REPLY = 1
+PRIORITY_SCHEDULED = 2
 
-async def edit_sponsored_coin_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+
+class TelegramOutbox:
     """
-    Handler for editing an existing sponsored coin.
-    Command format: /edit_sponsored_coin <name> <new_symbol> <new_price> <new_market_cap> <new_url> <new_author>
+    Central queue for outbound Telegram calls.
+
+    Calls are served by priority (moderation, then replies, then scheduled posts)
+    within the bot-wide and per-chat limits. A call whose chat is out of budget is
+    parked without holding back other chats, and pending calls sharing a coalesce
+    key collapse into one. A RetryAfter pauses only the chat that received it;
+    moderation calls in that chat keep flowing unless they got the 429 themselves.
     """
-    try:
-        if len(context.args) < 6:
-            await update.message.reply_text("❌ Usage: /edit_sponsored_coin <name> <new_symbol> <new_price> <new_market_cap> <new_url> <new_author>")
-            return
 
-        name, new_symbol, new_price, new_market_cap, new_url, new_author = context.args
-        new_price = float(new_price)
-        new_market_cap = float(new_market_cap)
+    class _Job:
+        __slots__ = ("call", "chat_id", "priority", "seq", "coalesce_key", "counts_as_message", "future", "attempts")
+
+        def __init__(self, call, chat_id, priority, seq, coalesce_key, counts_as_message, future):
+            self.call = call
+            self.chat_id = chat_id
+            self.priority = priority
+            self.seq = seq
+            self.coalesce_key = coalesce_key
+            self.counts_as_message = counts_as_message
+            self.future = future
+            self.attempts = 0
+
+    def __init__(self):
+        self._ready = [deque() for _ in (PRIORITY_MODERATION, PRIORITY_REPLY, PRIORITY_SCHEDULED)]
+        self._parked = []  # heap de (instante listo, seq, trabajo) esperando cupo de su chat
+        self._pending_keys: dict = {}  # coalesce_key -> trabajo aún no enviado
+        self._global_window = deque()
+        self._chat_windows: dict = {}  # chat_id -> deque de instantes de envío
+        self._chat_pauses: dict = {}  # chat_id -> (pausado hasta, también bloquea moderación) tras un RetryAfter
+        self._wakeup = None
+        self._worker = None
+        self._in_flight: set = set()
+        self._seq = itertools.count()
+        self.sent = 0
+        self.coalesced = 0
+        self.retry_after_hits = 0
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    def submit(self, call, chat_id: int, priority: int, coalesce_key=None, counts_as_message: bool = True) -> asyncio.Future:
+        """
+        Queues `call` (a zero-argument coroutine function) and returns a future with its result.
+
+        A pending call with the same `coalesce_key` is replaced by this one and shares its future.
+        """
+        self._ensure_worker()
+        if coalesce_key is not None:
+            job = self._pending_keys.get(coalesce_key)
+            if job is not None:
+                job.call = call  # El contenido más reciente gana
+                self.coalesced += 1
+                return job.future
+
+        job = self._Job(
+            call, chat_id, priority, next(self._seq), coalesce_key, counts_as_message,
+            asyncio.get_running_loop().create_future()
+        )
+        if coalesce_key is not None:
+            self._pending_keys[coalesce_key] = job
+        self._ready[priority].append(job)
+        self._wakeup.set()
+        return job.future
+
+    async def call(self, call, chat_id: int, priority: int, coalesce_key=None, counts_as_message: bool = True):
+        """
+        Queues a call and waits for its result, re-raising its error.
+        """
+        return await self.submit(call, chat_id, priority, coalesce_key, counts_as_message)
+
+    @staticmethod
+    def _window_wait(window: deque, rate: tuple, now: float) -> float:
+        limit, period = rate
+        while window and now - window[0] >= period:
+            window.popleft()
+        if len(window) < limit:
+            return 0.0
+        return window[0] + period - now
+
+    def _chat_wait(self, chat_id: int, now: float) -> float:
+        window = self._chat_windows.get(chat_id)
+        if window is None:
+            return 0.0
+        rate = TELEGRAM_GROUP_RATE if chat_id < 0 else TELEGRAM_PRIVATE_RATE
+        return self._window_wait(window, rate, now)
+
+    def _next_ready(self):
+        for queue in self._ready:
+            if queue:
+                return queue.popleft()
+        return None
 
-        edit_sponsored_coin(name, new_symbol, new_price, new_market_cap, new_url, new_author)
-        await update.message.reply_text(f"✅ Sponsored coin '{name}' updated successfully!")
-    except ValueError:
-        await update.message.reply_text("❌ Invalid price or market cap format. Please enter numeric values.")
-    except Exception as e:
-        await update.message.reply_text(f"❌ Error: {e}")
+    def _unpark(self, now: float):
+        released = []
+        while self._parked and self._parked[0][0] <= now:
+            released.append(heapq.heappop(self._parked)[2])
+        # Vuelven al frente de su cola, en su orden original
+        for job in sorted(released, key=lambda job: job.seq, reverse=True):
+            self._ready[job.priority].appendleft(job)
+
+    def _prune_idle_chats(self, now: float):
+        idle = [
+            chat_id for chat_id, window in self._chat_windows.items()
+            if not window or now - window[-1] >= TELEGRAM_GROUP_RATE[1]
+        ]
+        for chat_id in idle:
+            del self._chat_windows[chat_id]
+        for chat_id in [chat_id for chat_id, (until, _) in self._chat_pauses.items() if until <= now]:
+            del self._chat_pauses[chat_id]
+
+    def _chat_pause(self, job, now: float) -> float:
+        """
+        Returns until when `job` must wait for a RetryAfter of its chat (0 when it may go).
+        """
+        pause = self._chat_pauses.get(job.chat_id)
+        if pause is None:
+            return 0.0
+        until, blocks_moderation = pause
+        if until <= now:
+            del self._chat_pauses[job.chat_id]
+            return 0.0
+        if job.priority == PRIORITY_MODERATION and not blocks_moderation:
+            return 0.0
+        return until
+
+    async def _run(self):
+        last_prune = time.monotonic()
+        while True:
+            now = time.monotonic()
+            self._unpark(now)
+
+            if now - last_prune >= TELEGRAM_GROUP_RATE[1]:
+                self._prune_idle_chats(now)
+                last_prune = now
+
+            job = self._next_ready()
+            if job is None:
+                timeout = self._parked[0][0] - now if self._parked else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
 
-async def remove_sponsored_coin_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            # Chat en pausa por un RetryAfter: aparcar hasta el reintento sin frenar a los demás chats
+            paused_until = self._chat_pause(job, now)
+            if paused_until:
+                heapq.heappush(self._parked, (paused_until, job.seq, job))
+                continue
+
+            # Chat sin cupo: aparcar el trabajo y seguir con los demás
+            if job.counts_as_message:
+                chat_wait = self._chat_wait(job.chat_id, now)
+                if chat_wait > 0:
+                    heapq.heappush(self._parked, (now + chat_wait, job.seq, job))
+                    continue
+
+            global_wait = self._window_wait(self._global_window, TELEGRAM_GLOBAL_RATE, now)
+            if global_wait > 0:
+                self._ready[job.priority].appendleft(job)
+                await asyncio.sleep(global_wait)
+                continue
+
+            self._global_window.append(now)
+            if job.counts_as_message:
+                self._chat_windows.setdefault(job.chat_id, deque()).append(now)
+            if job.coalesce_key is not None and self._pending_keys.get(job.coalesce_key) is job:
+                del self._pending_keys[job.coalesce_key]
+
+            task = asyncio.create_task(self._execute(job))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _execute(self, job):
+        try:
+            result = await job.call()
+        except RetryAfter as e:
+            job.attempts += 1
+            self.retry_after_hits += 1
+            delay = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else float(e.retry_after)
+            if job.attempts > OUTBOX_MAX_RETRIES:
+                if not job.future.done():
+                    job.future.set_exception(e)
+                return
+            # Contrapresión sobre el chat que recibió el 429; la moderación solo se frena si el 429 fue suyo
+            now = time.monotonic()
+            until = now + delay
+            previous_until, previous_blocks = self._chat_pauses.get(job.chat_id, (0.0, False))
+            blocks_moderation = job.priority == PRIORITY_MODERATION or (previous_blocks and previous_until > now)
+            self._chat_pauses[job.chat_id] = (max(until, previous_until), blocks_moderation)
+            print(f"⏳ Telegram rate limit hit in chat {job.chat_id}. Pausing that chat for {delay:.0f} seconds...")
+            heapq.heappush(self._parked, (until, job.seq, job))
+            self._wakeup.set()
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            self.sent += 1
+            if not job.future.done():
+                job.future.set_result(result)
+
+    def gauges(self) -> dict:
+        return {
+            "outbox_queued": sum(len(queue) for queue in self._ready),
+            "outbox_parked": len(self._parked),
+            "outbox_in_flight": len(self._in_flight),
+            "outbox_sent": self.sent,
+            "outbox_coalesced": self.coalesced,
+            "outbox_retry_after": self.retry_after_hits,
+            "outbox_paused_chats": len(self._chat_pauses),
+        }
+
+    async def aclose(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        for job in itertools.chain(*self._ready, (entry[2] for entry in self._parked)):
+            if not job.future.done():
+                job.future.cancel()
+
+
+telegram_outbox = TelegramOutbox()
+
+
+def _log_send_failure(future: asyncio.Future):
+    if not future.cancelled() and future.exception():
+        print(f"❌ Queued Telegram send failed: {future.exception()}")
+
+
+async def send_message_queued(
+    context: ContextTypes.DEFAULT_TYPE, chat_id: int, text: str, priority: int = PRIORITY_REPLY,
+    coalesce_key=None, wait: bool = True, **kwargs
+):
     """
-    Handler for removing a sponsored coin.
-    Command format: /remove_sponsored_coin <name>
+    Sends a message through the outbox. With `wait=False` the send is fire-and-forget
+    and failures are only logged.
+
+    Updates are processed one at a time, so handlers should pass `wait=False` unless
+    they need the sent message: a send parked for a chat's window would otherwise
+    hold back every other update.
     """
-    try:
-        if len(context.args) < 1:
-            await update.message.reply_text("❌ Usage: /remove_sponsored_coin <name>")
-            return
+    future = telegram_outbox.submit(
+        lambda: context.bot.send_message(chat_id=chat_id, text=text, **kwargs),
+        chat_id, priority, coalesce_key
+    )
+    if not wait:
+        future.add_done_callback(_log_send_failure)
+        return None
+    return await future
 
-        name = context.args[0]
-        remove_sponsored_coin(name)
-        await update.message.reply_text(f"✅ Sponsored coin '{name}' removed successfully!")
-    except Exception as e:
-        await update.message.reply_text(f"❌ Error: {e}")
 
 
 
@@ -335,10 +2228,9 @@ async def new_raid(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     chat_id = update.effective_chat.id
-    user = await context.bot.get_chat_member(chat_id, update.effective_user.id)
 
     # Verificar si el usuario es administrador
-    if user.status not in ["administrator", "creator"]:
+    if not await is_chat_admin(context, chat_id, update.effective_user.id):
         await update.message.reply_text("❌ Only administrators can create raids.")
         return
 
@@ -381,15 +2273,9 @@ async def new_raid(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
 
         # Insertar datos en la base de datos
-        cursor.execute(
-            """
-            INSERT INTO raids (name, description, username, tweet_id, action_type, creator_id)
-            VALUES (?, ?, ?, ?, ?, ?)
-            """,
-            (raid_name, raid_description, username, tweet_id, action_type, update.effective_user.id),
+        raid_id = await db.create_raid(
+            raid_name, raid_description, username, tweet_id, action_type, update.effective_user.id
         )
-        conn.commit()
-        raid_id = cursor.lastrowid
 
         # Confirmar creación del RAID
         link_text = f"https://x.com/{username}/status/{tweet_id}" if action_type in ["retweet", "like"] else f"https://x.com/{username}"
@@ -400,6 +2286,7 @@ async def new_raid(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"✔️ Action Required: {action_type.capitalize()}\n"
             f"📌 Participants can join using /join_raid {raid_id}."
         )
+        request_board_refresh(context)
 
     except sqlite3.Error as e:
         print(f"❌ Database error: {e}")
@@ -428,31 +2315,23 @@ async def handle_join_raid(update: Update, context: ContextTypes.DEFAULT_TYPE):
             username = query.from_user.username or "Anonymous"
 
             # Verificar si el RAID existe
-            cursor.execute("SELECT name FROM raids WHERE id = ?", (raid_id,))
-            raid = cursor.fetchone()
+            raid = await db.get_raid(raid_id)
             if not raid:
                 await query.message.reply_text("❌ This raid no longer exists.")
                 return
 
-            # Verificar si el usuario ya está registrado
-            cursor.execute("SELECT id FROM participants WHERE raid_id = ? AND user_id = ?", (raid_id, user_id))
-            if cursor.fetchone():
+            # Registrar al usuario
+            if not await db.add_participant(raid_id, user_id, username):
                 await query.message.reply_text(
-                    f"❌ @{username}, you are already a participant in the raid '{raid[0]}'."
+                    f"❌ @{username}, you are already a participant in the raid '{truncate_text(raid.name, RAID_NAME_LIMIT)}'."
                 )
                 return
 
-            # Registrar al usuario
-            cursor.execute(
-                "INSERT INTO participants (raid_id, user_id, username) VALUES (?, ?, ?)",
-                (raid_id, user_id, username)
-            )
-            conn.commit()
-
             # Confirmar la inscripción
             await query.message.reply_text(
-                f"✅ @{username}, you have successfully joined the raid '{raid[0]}'!"
+                f"✅ @{username}, you have successfully joined the raid '{truncate_text(raid.name, RAID_NAME_LIMIT)}'!"
             )
+            request_board_refresh(context)
         else:
             await query.message.reply_text("❓ <b>Unknown option.</b> Please try again.", parse_mode="HTML")
 
@@ -476,53 +2355,13 @@ async def raid_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     raid_id = int(context.args[0])
 
     try:
-        # Obtener detalles del raid
-        cursor.execute(
-            "SELECT name, description, username, action_type FROM raids WHERE id = ?", (raid_id,)
-        )
-        raid = cursor.fetchone()
-
-        if not raid:
+        page_view = await render_raid_status_page(raid_id, None, False)
+        if not page_view:
             await update.message.reply_text("❌ Invalid raid ID. Please check the available raids.")
             return
 
-        name, description, username, action_type = raid
-
-        # Obtener participantes
-        cursor.execute(
-            "SELECT username, status FROM participants WHERE raid_id = ? ORDER BY status DESC, username ASC",
-            (raid_id,),
-        )
-        participants = cursor.fetchall()
-
-        # Construir el mensaje del estado del raid
-        total_participants = len(participants)
-        completed = sum(1 for _, status in participants if status == "completed")
-        pending = total_participants - completed
-
-        message = (
-            f"🎯 <b>Raid Status:</b>\n\n"
-            f"🆔 <b>Raid ID:</b> <code>{raid_id}</code>\n"
-            f"📛 <b>Name:</b> <code>{name}</code>\n"
-            f"📖 <b>Description:</b> {description}\n"
-            f"🔗 <b>Username:</b> <a href='https://x.com/{username}'>{username}</a>\n"
-            f"✔️ <b>Action Required:</b> {action_type.capitalize()}\n\n"
-            f"👥 <b>Total Participants:</b> {total_participants}\n"
-            f"✅ <b>Completed:</b> {completed}\n"
-            f"⌛ <b>Pending:</b> {pending}\n\n"
-            f"<b>Participants:</b>\n"
-        )
-
-        for participant_username, status in participants:
-            status_icon = "✅" if status == "completed" else "⌛"
-            message += f"  - @{participant_username}: {status_icon}\n"
-
-        # Limitar el tamaño del mensaje
-        if len(message) > 4000:
-            message = message[:3997] + "..."
-
-        # Enviar el mensaje
-        await update.message.reply_text(message, parse_mode="HTML")
+        text, reply_markup = page_view
+        await update.message.reply_text(text, parse_mode="HTML", reply_markup=reply_markup)
 
     except sqlite3.Error as e:
         print(f"❌ Database error: {e}")
@@ -531,6 +2370,80 @@ async def raid_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
         print(f"❌ Error sending raid status: {e}")
 
 
+TELEGRAM_MESSAGE_LIMIT = 4096  # Caracteres máximos por mensaje de Telegram
+DIGEST_MAX_BUTTONS = 100  # Botones máximos en un teclado inline
+DIGEST_DESCRIPTION_LIMIT = 500  # Recorte de descripciones para que una tarjeta siempre quepa
+RAID_NAME_LIMIT = 100  # Recorte del nombre (un único argumento de /new_raid que puede ser enorme)
+RAID_USERNAME_LIMIT = 64  # Recorte del usuario de X mostrado
+DIGEST_BUTTONS_PER_ROW = 2
+
+
+def truncate_text(text: Union[str, None], limit: int) -> str:
+    text = text or ""
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def raid_target_url(username: str, tweet_id: str, action_type: str) -> Union[str, None]:
+    """
+    Builds the X link a raid points at, or None when the raid data is incomplete.
+    """
+    if action_type == "follow" and username:
+        return f"https://x.com/{username}"  # Enlace al perfil del usuario
+    if action_type in ["retweet", "like"] and username and tweet_id:
+        return f"https://x.com/{username}/status/{tweet_id}"  # Enlace al tweet
+    return None
+
+
+def render_raid_card(raid: RaidSummary) -> str:
+    """
+    Renders one raid as an HTML card for a digest message.
+    """
+    pending_count = raid.participant_count - raid.completed_count
+    tweet_url = raid_target_url(raid.username, raid.tweet_id, raid.action_type)
+    link = f"<a href='{html.escape(tweet_url)}'>View Target</a>" if tweet_url else "Invalid URL"
+    description = truncate_text(raid.description, DIGEST_DESCRIPTION_LIMIT)
+
+    return (
+        f"🆔 <code>{raid.id}</code> · 📛 <b>{html.escape(truncate_text(raid.name, RAID_NAME_LIMIT))}</b>\n"
+        f"📖 {html.escape(description)}\n"
+        f"🔗 {link} · ✔️ {raid.action_type.capitalize()}\n"
+        f"👥 {raid.participant_count} · ✅ {raid.completed_count} · ⌛ {pending_count}"
+    )
+
+
+def pack_raid_digest(title: str, raids: list, footer: str = "", limit: int = TELEGRAM_MESSAGE_LIMIT) -> list:
+    """
+    Packs raid cards into as few messages as possible under Telegram's length limit.
+
+    Returns a list of (text, reply_markup) pairs; each message carries one Join
+    button per card it contains.
+    """
+    header = f"{title}\n\n"
+    pages = []
+    cards, buttons = [], []
+    length = len(header) + len(footer)
+
+    def flush():
+        rows = [buttons[i:i + DIGEST_BUTTONS_PER_ROW] for i in range(0, len(buttons), DIGEST_BUTTONS_PER_ROW)]
+        pages.append((header + "\n\n".join(cards) + footer, InlineKeyboardMarkup(rows)))
+
+    for raid in raids:
+        card = render_raid_card(raid)
+        added = len(card) + (2 if cards else 0)
+        if cards and (length + added > limit or len(buttons) >= DIGEST_MAX_BUTTONS):
+            flush()
+            cards, buttons = [], []
+            length = len(header) + len(footer)
+            added = len(card)
+        cards.append(card)
+        buttons.append(InlineKeyboardButton(f"Join #{raid.id}", callback_data=f"join_raid:{raid.id}"))
+        length += added
+
+    if cards:
+        flush()
+    return pages
+
+
 # Comando: /list_raids
 async def list_raids(query: CallbackQuery, context: ContextTypes.DEFAULT_TYPE):
     """
@@ -544,18 +2457,8 @@ async def list_raids(query: CallbackQuery, context: ContextTypes.DEFAULT_TYPE):
         print(f"Button clicked: {query.data}")
 
         # Consultar los RAIDS activos
-        cursor.execute("""
-            SELECT r.id, r.name, r.description, r.username, r.tweet_id, r.action_type,
-                   (SELECT COUNT(*) FROM participants p WHERE p.raid_id = r.id) as participant_count,
-                   (SELECT COUNT(*) FROM participants p WHERE p.raid_id = r.id AND p.status = 'completed') as completed_count
-            FROM raids r
-            ORDER BY r.created_at DESC
-        """)
-        raids = cursor.fetchall()
-
-        # Debugging: Verificar los raids recuperados
-        print("✅ Retrieved raids from database:")
-        print(raids)
+        raids = await db.list_raid_summaries()
+        print(f"✅ Retrieved {len(raids)} raids from database.")
 
         # Si no hay RAIDS activos
         if not raids:
@@ -563,44 +2466,14 @@ async def list_raids(query: CallbackQuery, context: ContextTypes.DEFAULT_TYPE):
             await query.message.edit_text(no_raids_message, parse_mode="HTML")
             return
 
-        # Iterar sobre los RAIDS y enviar un mensaje por cada uno
-        for raid in raids:
-            raid_id, name, description, username, tweet_id, action_type, participant_count, completed_count = raid
-            pending_count = participant_count - completed_count
-
-            # Validar y generar el enlace según el tipo de acción
-            tweet_url = "Invalid URL"
-            if action_type == "follow" and username:
-                tweet_url = f"https://x.com/{username}"  # Enlace al perfil del usuario
-            elif action_type in ["retweet", "like"] and username and tweet_id:
-                tweet_url = f"https://x.com/{username}/status/{tweet_id}"  # Enlace al tweet
-            else:
-                print(f"⚠️ Invalid data for Raid ID {raid_id}: username='{username}', tweet_id='{tweet_id}', action_type='{action_type}'")
-
-            # Crear botón para unirse al RAID
-            keyboard = [[InlineKeyboardButton("Join Raid", callback_data=f"join_raid:{raid_id}")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-
-            # Construir el mensaje
-            message = (
-                f"📋 <b>Active Raid:</b>\n\n"
-                f"🆔 <b>Raid ID:</b> <code>{raid_id}</code>\n"
-                f"📛 <b>Name:</b> <code>{name}</code>\n"
-                f"📖 <b>Description:</b> {description}\n"
-                f"🔗 <b>Link:</b> <a href='{tweet_url}'>View Target</a>\n"
-                f"✔️ <b>Action Required:</b> {action_type.capitalize()}\n"
-                f"👥 <b>Participants:</b> {participant_count}\n"
-                f"✅ <b>Completed:</b> {completed_count}\n"
-                f"⌛ <b>Pending:</b> {pending_count}\n"
-            )
-
-            # Enviar un mensaje nuevo por cada RAID
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text=message,
+        # Empaquetar todos los RAIDS en el menor número de mensajes posible
+        for text, reply_markup in pack_raid_digest("📋 <b>Active Raids:</b>", raids):
+            await send_message_queued(
+                context, chat_id, text,
                 parse_mode="HTML",
-                disable_web_page_preview=False,  # Permitir vista previa si el enlace es válido
-                reply_markup=reply_markup
+                disable_web_page_preview=True,  # Varios enlaces por mensaje: sin vista previa
+                reply_markup=reply_markup,
+                wait=False  # Un chat sin cupo no debe frenar el procesamiento de updates
             )
 
     except sqlite3.Error as db_error:
@@ -621,72 +2494,15 @@ async def list_raids_detailed(update: Update, context: ContextTypes.DEFAULT_TYPE
     Lists detailed information about all active raids, including participants and proofs.
     """
     try:
-        # Consultar raids activos
-        cursor.execute("""
-            SELECT r.id, r.name, r.description, r.username, r.tweet_id, r.action_type,
-                   (SELECT COUNT(*) FROM participants p WHERE p.raid_id = r.id) as participant_count,
-                   (SELECT COUNT(*) FROM participants p WHERE p.raid_id = r.id AND p.status = 'completed') as completed_count
-            FROM raids r
-            ORDER BY r.created_at DESC
-        """)
-        raids = cursor.fetchall()
-
-        if not raids:
+        page_view = await render_detailed_raids_page(None, False)
+        if not page_view:
             await update.message.reply_text("No active raids to display.")
             return
 
-        # Construir el mensaje
-        message = "📋 <b>Detailed Active Raids:</b>\n\n"
-        for raid in raids:
-            raid_id, name, description, username, tweet_id, action_type, participant_count, completed_count = raid
-            pending_count = participant_count - completed_count
-            tweet_url = f"https://x.com/{username}/status/{tweet_id}" if username and tweet_id else "Invalid URL"
-
-            # Información básica del raid
-            message += (
-                f"🆔 <b>Raid ID:</b> <code>{raid_id}</code>\n"
-                f"📛 <b>Name:</b> <code>{name}</code>\n"
-                f"📖 <b>Description:</b> {description}\n"
-                f"🔗 <b>Link:</b> <a href='{tweet_url}'>{'View Target' if tweet_url else 'Invalid URL'}</a>\n"
-                f"✔️ <b>Action Required:</b> {action_type.capitalize()}\n"
-                f"👥 <b>Participants:</b> {participant_count}\n"
-                f"✅ <b>Completed:</b> {completed_count}\n"
-                f"⌛ <b>Pending:</b> {pending_count}\n\n"
-            )
-
-            # Lista de participantes
-            cursor.execute("SELECT username, status FROM participants WHERE raid_id = ? ORDER BY status DESC", (raid_id,))
-            participants = cursor.fetchall()
-            if participants:
-                message += "<b>Participants:</b>\n"
-                for participant_username, status in participants:
-                    status_icon = "✅" if status == "completed" else "⌛"
-                    message += f"  - @{participant_username}: {status_icon}\n"
-            else:
-                message += "👤 No participants yet.\n"
-
-            # Lista de pruebas
-            cursor.execute("SELECT username, proof, submitted_at FROM proofs WHERE raid_id = ?", (raid_id,))
-            proofs = cursor.fetchall()
-            if proofs:
-                message += "\n<b>Proofs:</b>\n"
-                for username, proof, submitted_at in proofs:
-                    message += (
-                        f"  - @{username}\n"
-                        f"    ✔️ <b>Proof:</b> {proof}\n"
-                        f"    🕒 <b>Submitted At:</b> {submitted_at}\n"
-                    )
-            else:
-                message += "\n<b>Proofs:</b> None\n"
-
-            message += "\n"
-
-        # Limitar el tamaño del mensaje
-        if len(message) > 4000:
-            message = message[:3997] + "..."
-
-        # Enviar el mensaje
-        await update.message.reply_text(message, parse_mode="HTML", disable_web_page_preview=True)
+        text, reply_markup = page_view
+        await update.message.reply_text(
+            text, parse_mode="HTML", disable_web_page_preview=True, reply_markup=reply_markup
+        )
 
     except sqlite3.Error as e:
         print(f"❌ Database error in /list_raids_detailed: {e}")
@@ -706,10 +2522,9 @@ async def delete_all_raids(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     chat_id = update.effective_chat.id
-    user = await context.bot.get_chat_member(chat_id, update.effective_user.id)
 
     # Verificar permisos de administrador
-    if user.status not in ["administrator", "creator"]:
+    if not await is_chat_admin(context, chat_id, update.effective_user.id):
         await update.message.reply_text("❌ Only administrators can delete all raids.")
         return
 
@@ -744,13 +2559,11 @@ async def confirm_delete_raids(update: CallbackQuery, context: ContextTypes.DEFA
 
     try:
         # Eliminar datos de las tablas relacionadas
-        cursor.execute("DELETE FROM participants;")
-        cursor.execute("DELETE FROM proofs;")
-        cursor.execute("DELETE FROM raids;")
-        conn.commit()
+        await db.delete_all_raids()
 
         await query.edit_message_text("✅ All raids and associated data have been successfully deleted.")
         print("✅ All raids and related data deleted successfully.")
+        request_board_refresh(context)
 
     except sqlite3.Error as e:
         print(f"❌ Database error while deleting raids: {e}")
@@ -778,178 +2591,622 @@ async def cancel_delete_raids(update: CallbackQuery, context: ContextTypes.DEFAU
 # Comando: /reset_database
 async def reset_database_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
-    Resets the entire database by clearing all data and resetting ID sequences.
+    Resets the entire database by clearing all data and resetting ID sequences.
+    """
+    chat_id = update.effective_chat.id
+
+    # Verificar si el usuario es administrador
+    if not await is_chat_admin(context, chat_id, update.effective_user.id):
+        await update.message.reply_text("❌ Only administrators can reset the database.")
+        return
+
+    try:
+        # Vaciar las tablas y reiniciar los contadores de ID
+        await db.reset_database()
+        await update.message.reply_text("✅ Database has been reset successfully!")
+        print("✅ Database reset by admin.")
+        request_board_refresh(context)
+    except Exception as e:
+        print(f"❌ Error resetting database: {e}")
+        await update.message.reply_text("❌ Failed to reset the database. Please try again later.")
+
+
+# Comando: /check_raid_counters [fix]
+async def check_raid_counters_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Verifies the stored participant/completed counters against the participants table (restricted to admins).
+    """
+    chat_id = update.effective_chat.id
+
+    if not await is_chat_admin(context, chat_id, update.effective_user.id):
+        await update.message.reply_text("❌ This command is restricted to administrators.")
+        return
+
+    repair = bool(context.args) and context.args[0].lower() == "fix"
+    try:
+        mismatches = await db.check_raid_counters(repair=repair)
+    except Exception as e:
+        print(f"❌ Error checking raid counters: {e}")
+        await update.message.reply_text("❌ Failed to check the raid counters. Please try again later.")
+        return
+
+    if not mismatches:
+        await update.message.reply_text("✅ All raid counters are consistent.")
+        return
+
+    lines = [
+        f"• Raid {raid_id}: stored {stored[0]}/{stored[1]}, actual {actual[0]}/{actual[1]}"
+        for raid_id, stored, actual in mismatches[:20]
+    ]
+    if len(mismatches) > 20:
+        lines.append(f"… and {len(mismatches) - 20} more.")
+    status = "🔧 Counters repaired." if repair else "Run /check_raid_counters fix to repair them."
+    print(f"⚠️ {len(mismatches)} raid(s) with inconsistent counters (repair={repair}).")
+    await update.message.reply_text(
+        f"⚠️ {len(mismatches)} raid(s) with inconsistent counters (participants/completed):\n"
+        + "\n".join(lines) + f"\n\n{status}"
+    )
+    if repair:
+        request_board_refresh(context)
+
+
+# Comando: /show_proofs
+async def show_proofs(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Retrieves and displays proofs for a specific raid.
+    """
+    if len(context.args) != 1 or not context.args[0].isdigit():
+        await update.message.reply_text("Usage: /show_proofs <raid_id>")
+        return
+
+    raid_id = int(context.args[0])
+
+    try:
+        page_view = await render_proofs_page(raid_id, None, False)
+        if not page_view:
+            await update.message.reply_text("❌ Invalid raid ID. Please check the available raids.")
+            return
+
+        text, reply_markup = page_view
+        await update.message.reply_text(text, parse_mode="HTML", reply_markup=reply_markup)
+    except Exception as e:
+        print(f"Error sending proofs: {e}")
+        await update.message.reply_text("❌ An error occurred while retrieving proofs.")
+
+
+# Paginación por cursor (keyset) con botones ⬅️/➡️
+# callback_data: "<vista>:<raid_id>:<n|p>:<cursor>" (n = siguiente, p = anterior)
+STATUS_PAGE_SIZE = 50  # Participantes por página en /raid_status
+PROOFS_PAGE_SIZE = 15  # Pruebas por página en /show_proofs
+DETAILED_PAGE_SIZE = 3  # Raids por página en /list_raids_detailed
+DETAILED_PREVIEW_SIZE = 5  # Participantes y pruebas mostrados por raid en la vista detallada
+DETAILED_DESCRIPTION_LIMIT = 150  # Recorte de descripciones para que la página quepa en un mensaje
+PAGE_CALLBACK_PATTERN = "^(rs|sp|rd):"
+
+
+def page_navigation_markup(view: str, raid_id: int, page: Page) -> Union[InlineKeyboardMarkup, None]:
+    """
+    Builds the Prev/Next buttons of a page; the callback data carries the edge ID as cursor.
+    """
+    buttons = []
+    if page.has_prev:
+        buttons.append(InlineKeyboardButton("⬅️ Prev", callback_data=f"{view}:{raid_id}:p:{page.first_id}"))
+    if page.has_next:
+        buttons.append(InlineKeyboardButton("Next ➡️", callback_data=f"{view}:{raid_id}:n:{page.last_id}"))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+def render_participant_lines(participants: list) -> list:
+    lines = []
+    for participant in participants:
+        status_icon = "✅" if participant.status == "completed" else "⌛"
+        lines.append(f"  - @{html.escape(participant.username or 'Unknown')}: {status_icon}")
+    return lines
+
+
+def render_proof_lines(proofs: list) -> list:
+    lines = []
+    for proof in proofs:
+        lines.append(
+            f"  - @{html.escape(proof.username or 'Unknown')}\n"
+            f"    ✔️ <b>Proof:</b> {html.escape(proof.proof or '')}\n"
+            f"    🕒 <b>Submitted At:</b> {proof.submitted_at}"
+        )
+    return lines
+
+
+async def render_raid_status_page(raid_id: int, cursor: Union[int, None], backwards: bool) -> Union[tuple, None]:
+    """
+    Renders one page of /raid_status as (text, reply_markup), or None if the raid does not exist.
+    """
+    raid = await db.get_raid_summary(raid_id)
+    if not raid:
+        return None
+    page = await db.get_participants_page(raid_id, cursor, backwards, STATUS_PAGE_SIZE)
+
+    lines = [
+        "🎯 <b>Raid Status:</b>\n",
+        f"🆔 <b>Raid ID:</b> <code>{raid.id}</code>",
+        f"📛 <b>Name:</b> <code>{html.escape(truncate_text(raid.name, RAID_NAME_LIMIT))}</code>",
+        f"📖 <b>Description:</b> {html.escape(truncate_text(raid.description, DIGEST_DESCRIPTION_LIMIT))}",
+        f"🔗 <b>Username:</b> <a href='https://x.com/{html.escape(raid.username or '')}'>"
+        f"{html.escape(truncate_text(raid.username, RAID_USERNAME_LIMIT))}</a>",
+        f"✔️ <b>Action Required:</b> {raid.action_type.capitalize()}\n",
+        f"👥 <b>Total Participants:</b> {raid.participant_count}",
+        f"✅ <b>Completed:</b> {raid.completed_count}",
+        f"⌛ <b>Pending:</b> {raid.participant_count - raid.completed_count}\n",
+        "<b>Participants:</b>",
+    ]
+    lines.extend(render_participant_lines(page.items) or ["  👤 No participants yet."])
+    return "\n".join(lines), page_navigation_markup("rs", raid_id, page)
+
+
+async def render_proofs_page(raid_id: int, cursor: Union[int, None], backwards: bool) -> Union[tuple, None]:
+    """
+    Renders one page of /show_proofs as (text, reply_markup), or None if the raid does not exist.
+    """
+    raid = await db.get_raid(raid_id)
+    if not raid:
+        return None
+    page = await db.get_proofs_page(raid_id, cursor, backwards, PROOFS_PAGE_SIZE)
+    if not page.items and cursor is None:
+        return f"No proofs have been submitted for the raid '{html.escape(truncate_text(raid.name, RAID_NAME_LIMIT))}'.", None
+
+    lines = [
+        "📋 <b>Proofs for Raid:</b>\n",
+        f"🆔 <b>Raid ID:</b> <code>{raid_id}</code>",
+        f"📛 <b>Name:</b> <code>{html.escape(truncate_text(raid.name, RAID_NAME_LIMIT))}</code>",
+        f"📖 <b>Description:</b> {html.escape(truncate_text(raid.description, DIGEST_DESCRIPTION_LIMIT))}\n",
+        "<b>Submitted Proofs:</b>",
+    ]
+    lines.append("\n\n".join(render_proof_lines(page.items)))
+    return "\n".join(lines), page_navigation_markup("sp", raid_id, page)
+
+
+def render_raid_details(raid: RaidSummary, details: Union[RaidDetails, None]) -> list:
+    """
+    Renders one raid of the detailed view as a list of lines (joined once by the caller).
+    """
+    details = details or RaidDetails([], False, [], False)
+    tweet_url = raid_target_url(raid.username, raid.tweet_id, raid.action_type)
+    link = f"<a href='{html.escape(tweet_url)}'>View Target</a>" if tweet_url else "Invalid URL"
+    lines = [
+        f"🆔 <b>Raid ID:</b> <code>{raid.id}</code>",
+        f"📛 <b>Name:</b> <code>{html.escape(truncate_text(raid.name, RAID_NAME_LIMIT))}</code>",
+        f"📖 <b>Description:</b> {html.escape(truncate_text(raid.description, DETAILED_DESCRIPTION_LIMIT))}",
+        f"🔗 <b>Link:</b> {link}",
+        f"✔️ <b>Action Required:</b> {raid.action_type.capitalize()}",
+        f"👥 <b>Participants:</b> {raid.participant_count}",
+        f"✅ <b>Completed:</b> {raid.completed_count}",
+        f"⌛ <b>Pending:</b> {raid.participant_count - raid.completed_count}\n",
+    ]
+
+    # Solo una vista previa por raid: el detalle completo está en /raid_status y /show_proofs
+    if details.participants:
+        lines.append("<b>Participants:</b>")
+        lines.extend(render_participant_lines(details.participants))
+        if details.more_participants:
+            lines.append(f"  … more in /raid_status {raid.id}")
+    else:
+        lines.append("👤 No participants yet.")
+
+    if details.proofs:
+        lines.append("\n<b>Proofs:</b>")
+        lines.extend(render_proof_lines(details.proofs))
+        if details.more_proofs:
+            lines.append(f"  … more in /show_proofs {raid.id}")
+    else:
+        lines.append("\n<b>Proofs:</b> None")
+    return lines
+
+
+async def render_detailed_raids_page(cursor: Union[int, None], backwards: bool) -> Union[tuple, None]:
+    """
+    Renders one page of /list_raids_detailed as (text, reply_markup), or None when there are no raids.
+    """
+    page = await db.list_raid_summaries_page(cursor, backwards, DETAILED_PAGE_SIZE)
+    if not page.items and cursor is None:
+        return None
+
+    # Participantes y pruebas de toda la página: una consulta agrupada por tabla
+    details = await db.get_raid_details([raid.id for raid in page.items], limit=DETAILED_PREVIEW_SIZE)
+    lines = ["📋 <b>Detailed Active Raids:</b>\n"]
+    for raid in page.items:
+        lines.extend(render_raid_details(raid, details.get(raid.id)))
+        lines.append("")
+
+    return "\n".join(lines), page_navigation_markup("rd", 0, page)
+
+
+PAGE_RENDERERS = {
+    "rs": render_raid_status_page,
+    "sp": render_proofs_page,
+    "rd": lambda _, cursor, backwards: render_detailed_raids_page(cursor, backwards),
+}
+
+
+# Manejador de los botones ⬅️/➡️: edita el mensaje con la página pedida
+async def handle_page_navigation(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+
+    try:
+        view, raid_id, direction, cursor = query.data.split(":")
+        page_view = await PAGE_RENDERERS[view](int(raid_id), int(cursor), direction == "p")
+        if not page_view:
+            await query.edit_message_text("❌ This list is no longer available.")
+            return
+        text, reply_markup = page_view
+        await query.edit_message_text(
+            text, parse_mode="HTML", disable_web_page_preview=True, reply_markup=reply_markup
+        )
+    except BadRequest as e:
+        if "not modified" not in str(e).lower():
+            print(f"❌ Error paginating {query.data}: {e}")
+    except Exception as e:
+        print(f"❌ Error paginating {query.data}: {e}")
+
+
+# Sistema de validación y registro de pruebas
+X_VERIFY_MAX_PAGES_PER_RAID = 50  # Tope de páginas leídas por raid en cada pasada
+X_VERIFY_MAX_PAGES_PER_PARTICIPANT = 3  # Tope de páginas de likes/follows leídas por participante
+X_PLANNER_WINDOW_PENALTY = 100  # Coste, en solicitudes, de tener que esperar una ventana de 15 minutos
+X_VERIFY_CONCURRENCY = 5  # Raids verificados en paralelo en cada pasada
+X_VERIFY_RAID_TIMEOUT = 840  # Segundos máximos por raid, por debajo del intervalo de 900 s del trabajo
+verification_lock = asyncio.Lock()  # Evita que dos pasadas de verificación se solapen
+
+
+async def build_interaction_endpoint(action_type: str, username: str, tweet_id: str) -> Union[str, None]:
+    """
+    Returns the X API endpoint listing the users that completed a raid's action.
+    """
+    if action_type == "retweet" and tweet_id:
+        return f"tweets/{tweet_id}/retweeted_by"
+    if action_type == "like" and tweet_id:
+        return f"tweets/{tweet_id}/liking_users"
+    if action_type == "follow" and username:
+        # El endpoint de seguidores requiere el ID numérico de la cuenta
+        target_user_id = await x_api_resolve_user_id(username)
+        return f"users/{target_user_id}/followers" if target_user_id else None
+    return None
+
+
+async def register_proofs(raid_id: int, action_type: str, matches: list, state: dict = None):
+    """
+    Writes a raid's matched participants (and optionally its cursor) in one transaction and logs them.
+    """
+    await db.register_proofs(raid_id, action_type, matches, state)
+    for participant in matches:
+        print(f"✅ @{participant.username} completed the action for Raid ID {raid_id}.")
+
+
+async def scan_interactions(endpoint: str, pending: dict, matches: list,
+                            page_budget: int, start_token: str = None, stop_at_id: str = None) -> dict:
+    """
+    Streams an interaction list, moving pending participants into `matches` page by page.
+
+    The X lists are returned newest first, so reaching `stop_at_id` means the rest
+    of the list was already seen by a previous pass.
+
+    Returns:
+        dict: `outcome` ('head', 'end', 'matched' or 'budget'), `first_id` of the
+        scan, `next_token` to resume from and number of `pages` read.
+    """
+    max_results = X_API_PAGE_SIZES.get(x_endpoint_family(endpoint), 100)
+    result = {"outcome": "budget", "first_id": None, "next_token": start_token, "pages": 0}
+
+    if page_budget <= 0:
+        return result
+
+    async for page, next_token in x_api_paginate(endpoint, max_results=max_results, pagination_token=start_token):
+        result["pages"] += 1
+        result["next_token"] = next_token
+        if result["first_id"] is None and page:
+            result["first_id"] = page[0].get("id")
+
+        for user in page:
+            if stop_at_id and user.get("id") == stop_at_id:
+                result["outcome"] = "head"
+                return result
+            participant = pending.pop(user.get("username", "").lower(), None)
+            if participant:
+                matches.append(participant)
+
+        # Parar en cuanto todos los pendientes estén verificados
+        if not pending:
+            result["outcome"] = "matched"
+            return result
+        if not next_token:
+            result["outcome"] = "end"
+            return result
+        if result["pages"] >= page_budget:
+            return result
+
+    return result
+
+
+async def verify_by_target_list(raid_id: int, action_type: str, endpoint: str, state: dict,
+                                pending: dict, max_participant_id: int) -> int:
+    """
+    Verifies a raid by paging the target's interaction list, using the cursor persisted by previous passes.
+
+    Each pass first reads only the interactions newer than the last seen one
+    (`head_id`). Participants that joined after the last full scan (ID above the
+    `watermark`) may have interacted earlier, so they are covered once by a
+    backfill that resumes from its saved pagination token across passes.
+
+    Returns:
+        int: Number of participants marked as completed.
+    """
+    matches = []
+
+    def mark_fully_covered():
+        state.update(watermark=max_participant_id, next_token=None, backfill_watermark=None)
+
+    # Fase 1: interacciones nuevas desde la última pasada
+    try:
+        head = await scan_interactions(
+            endpoint, pending, matches, X_VERIFY_MAX_PAGES_PER_RAID, stop_at_id=state["head_id"]
+        )
+    except XApiError:
+        # Conservar lo verificado antes del fallo sin avanzar el cursor
+        await register_proofs(raid_id, action_type, matches)
+        raise
+
+    pages_read = head["pages"]
+    if head["first_id"]:
+        state["head_id"] = head["first_id"]
+
+    if head["outcome"] in ("end", "matched"):
+        mark_fully_covered()
+    elif head["outcome"] == "budget":
+        # Hueco entre lo leído y la cabeza anterior: se completa como backfill en próximas pasadas
+        state.update(next_token=head["next_token"], backfill_watermark=max_participant_id)
+    else:
+        # Fase 2: backfill para quienes se unieron después del último escaneo completo
+        if needs_backfill(state, pending):
+            if state["backfill_watermark"] is None:
+                state.update(next_token=None, backfill_watermark=max_participant_id)
+            try:
+                backfill = await scan_interactions(
+                    endpoint, pending, matches,
+                    X_VERIFY_MAX_PAGES_PER_RAID - pages_read, start_token=state["next_token"]
+                )
+            except XApiError:
+                await register_proofs(raid_id, action_type, matches)
+                raise
+            pages_read += backfill["pages"]
+            if backfill["outcome"] == "matched":
+                mark_fully_covered()
+            elif backfill["outcome"] == "end":
+                state.update(watermark=state["backfill_watermark"], next_token=None, backfill_watermark=None)
+            else:
+                state["next_token"] = backfill["next_token"]
+                print(f"⏸️ Backfill for Raid ID {raid_id} paused; it will resume on the next pass.")
+
+    await register_proofs(raid_id, action_type, matches, state)
+    print(f"📄 Raid ID {raid_id}: {pages_read} page(s) read, {len(pending)} participant(s) still pending.")
+    return len(matches)
+
+
+async def verify_by_participants(raid_id: int, action_type: str, target_id: str, pending: dict) -> int:
+    """
+    Verifies a raid from the participants' side: looks for the target tweet in each
+    pending participant's `liked_tweets`, or for the target account in their `following`.
+
+    Returns:
+        int: Number of participants marked as completed.
+    """
+    matches = []
+    users = await x_api_lookup_users([participant.username for participant in pending.values()])
+    relation = "liked_tweets" if action_type == "like" else "following"
+    max_results = X_API_PAGE_SIZES[f"users/:id/{relation}"]
+    pages_read = 0
+
+    try:
+        for key in list(pending):
+            user = users.get(key)
+            if not user:
+                continue
+
+            pages = 0
+            async for page, _ in x_api_paginate(f"users/{user['id']}/{relation}", max_results=max_results):
+                pages += 1
+                if any(item.get("id") == target_id for item in page):
+                    matches.append(pending.pop(key))
+                    break
+                if pages >= X_VERIFY_MAX_PAGES_PER_PARTICIPANT:
+                    break
+            pages_read += pages
+    finally:
+        await register_proofs(raid_id, action_type, matches)
+
+    print(f"📄 Raid ID {raid_id}: {pages_read} participant page(s) read, {len(pending)} participant(s) still pending.")
+    return len(matches)
+
+
+def needs_backfill(state: dict, pending: dict) -> bool:
+    """
+    Tells whether some pending participant is not covered yet by a full scan of the target list,
+    or a previous backfill (including the gap left by a head scan out of budget) is unfinished.
     """
-    chat_id = update.effective_chat.id
-    user = await context.bot.get_chat_member(chat_id, update.effective_user.id)
+    if state["head_id"] is None or state["backfill_watermark"] is not None or state["next_token"]:
+        return True
+    return any(participant.id > state["watermark"] for participant in pending.values())
 
-    # Verificar si el usuario es administrador
-    if user.status not in ["administrator", "creator"]:
-        await update.message.reply_text("❌ Only administrators can reset the database.")
-        return
 
-    try:
-        # Vaciar las tablas
-        cursor.execute("DELETE FROM raids;")
-        cursor.execute("DELETE FROM participants;")
-        cursor.execute("DELETE FROM proofs;")  # Limpieza de la tabla proofs
+def estimate_request_cost(family: str, pages: int) -> float:
+    """
+    Converts a number of requests into a cost that also accounts for the
+    rate-limit windows the requests would have to wait for.
+    """
+    remaining, limit = x_api_client.rate_limiter.budget(family)
+    limit = limit or X_API_DEFAULT_LIMITS.get(family, 15)
+    remaining = limit if remaining is None else remaining
+    windows_to_wait = math.ceil(max(0, pages - remaining) / limit)
+    return pages + windows_to_wait * X_PLANNER_WINDOW_PENALTY
 
-        # Reiniciar los contadores de ID
-        cursor.execute("DELETE FROM sqlite_sequence WHERE name IN ('raids', 'participants', 'proofs');")
 
-        conn.commit()
-        await update.message.reply_text("✅ Database has been reset successfully!")
-        print("✅ Database reset by admin.")
-    except Exception as e:
-        print(f"❌ Error resetting database: {e}")
-        await update.message.reply_text("❌ Failed to reset the database. Please try again later.")
+async def fetch_target_total(action_type: str, username: str, tweet_id: str) -> Union[int, None]:
+    """
+    Returns the size of the target's interaction list (likes of the tweet or followers of the account).
+    """
+    if action_type == "like":
+        response = await x_api_request(f"tweets/{tweet_id}", {"tweet.fields": "public_metrics"})
+        return (response or {}).get("data", {}).get("public_metrics", {}).get("like_count")
+    if action_type == "follow":
+        user = await x_api_get_user(username)
+        return (user or {}).get("public_metrics", {}).get("followers_count")
+    return None
 
 
-# Comando: /show_proofs
-async def show_proofs(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def plan_verification_direction(raid_id: int, action_type: str, username: str, tweet_id: str,
+                                      endpoint: str, state: dict, pending: dict) -> str:
     """
-    Retrieves and displays proofs for a specific raid.
+    Chooses the cheaper way to verify a raid: paging the target's list ('target')
+    or checking each pending participant's own likes/follows ('participants').
+
+    The estimate uses the target's interaction count, the persisted cursor and
+    the current rate-limit budget of each endpoint family. Retweets can only be
+    verified from the target's side.
     """
-    if len(context.args) != 1 or not context.args[0].isdigit():
-        await update.message.reply_text("Usage: /show_proofs <raid_id>")
-        return
+    if action_type not in ("like", "follow"):
+        return "target"
+
+    total = await fetch_target_total(action_type, username, tweet_id)
+    if total is None:
+        return "target"
+
+    # Lado del objetivo: lista completa si hace falta backfill, si no solo lo nuevo
+    target_family = x_endpoint_family(endpoint)
+    target_page_size = X_API_PAGE_SIZES.get(target_family, 100)
+    if needs_backfill(state, pending) or state["target_total"] is None:
+        target_pages = max(1, math.ceil(total / target_page_size))
+    else:
+        target_pages = max(1, math.ceil(max(0, total - state["target_total"]) / target_page_size))
+    target_cost = estimate_request_cost(target_family, target_pages)
+
+    # Lado de los participantes: búsqueda de IDs + páginas de likes/follows por persona
+    relation = "liked_tweets" if action_type == "like" else "following"
+    uncached = sum(1 for key in pending if key not in x_user_cache)
+    lookup_pages = math.ceil(uncached / 100)
+    participant_pages = 0
+    for key in pending:
+        following_count = x_user_cache.get(key, {}).get("public_metrics", {}).get("following_count")
+        if action_type == "follow" and following_count:
+            participant_pages += min(X_VERIFY_MAX_PAGES_PER_PARTICIPANT, math.ceil(following_count / 1000))
+        else:
+            participant_pages += 1
+    participant_cost = (
+        estimate_request_cost("users/by", lookup_pages)
+        + estimate_request_cost(f"users/:id/{relation}", participant_pages)
+    )
 
-    raid_id = int(context.args[0])
+    direction = "participants" if participant_cost < target_cost else "target"
+    print(
+        f"🧭 Raid ID {raid_id} ({action_type}): target list ≈ {target_pages} page(s) (cost {target_cost:.0f}) "
+        f"vs participant lookups ≈ {lookup_pages + participant_pages} request(s) (cost {participant_cost:.0f}) "
+        f"→ {direction}"
+    )
+    if direction == "target":
+        state["target_total"] = total
+    return direction
 
-    # Verificar si el raid existe
-    cursor.execute("SELECT id, name, description FROM raids WHERE id = ?", (raid_id,))
-    raid = cursor.fetchone()
 
-    if not raid:
-        await update.message.reply_text("❌ Invalid raid ID. Please check the available raids.")
-        return
+async def verify_raid_interactions(raid_id: int, username: str, tweet_id: str, action_type: str) -> int:
+    """
+    Verifies a single raid in the direction chosen by the planner.
 
-    raid_id, name, description = raid
+    Returns:
+        int: Number of participants marked as completed.
+    """
+    endpoint = await build_interaction_endpoint(action_type, username, tweet_id)
+    if not endpoint:
+        print(f"⚠️ Invalid endpoint for Raid ID {raid_id}. Skipping...")
+        return 0
 
-    # Obtener las pruebas asociadas al raid
-    cursor.execute("""
-        SELECT username, proof, submitted_at
-        FROM proofs
-        WHERE raid_id = ?
-        ORDER BY submitted_at ASC
-    """, (raid_id,))
-    proofs = cursor.fetchall()
+    state = await db.load_raid_cursor(raid_id)
+    max_participant_id, pending_rows = await db.get_pending_participants(raid_id)
 
-    if not proofs:
-        await update.message.reply_text(f"No proofs have been submitted for the raid '{name}'.")
-        return
+    # Participantes pendientes indexados por username en minúsculas
+    pending = {participant.username.lower(): participant for participant in pending_rows if participant.username}
+    if not pending:
+        print(f"✅ No pending participants for Raid ID {raid_id}.")
+        if state["watermark"] != max_participant_id:
+            state.update(watermark=max_participant_id, next_token=None, backfill_watermark=None)
+            await register_proofs(raid_id, action_type, [], state)
+        return 0
 
-    # Construir el mensaje con las pruebas
-    def escape_html(text):
-        return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    print(f"🔍 Verifying interactions for Raid ID {raid_id} ({len(pending)} pending)...")
+    direction = await plan_verification_direction(raid_id, action_type, username, tweet_id, endpoint, state, pending)
 
-    message = (
-        f"📋 <b>Proofs for Raid:</b>\n\n"
-        f"🆔 <b>Raid ID:</b> <code>{raid_id}</code>\n"
-        f"📛 <b>Name:</b> <code>{escape_html(name)}</code>\n"
-        f"📖 <b>Description:</b> {escape_html(description)}\n\n"
-        f"<b>Submitted Proofs:</b>\n"
-    )
+    if direction == "participants":
+        target_id = tweet_id if action_type == "like" else endpoint.split("/")[1]
+        return await verify_by_participants(raid_id, action_type, target_id, pending)
+    return await verify_by_target_list(raid_id, action_type, endpoint, state, pending, max_participant_id)
 
-    for username, proof_text, submitted_at in proofs:
-        message += (
-            f"  - @{escape_html(username)}\n"
-            f"    ✔️ <b>Proof:</b> {escape_html(proof_text)}\n"
-            f"    🕒 <b>Submitted At:</b> {submitted_at}\n\n"
-        )
 
-    try:
-        await update.message.reply_text(message, parse_mode="HTML")
-    except Exception as e:
-        print(f"Error sending proofs: {e}")
-        await update.message.reply_text("❌ An error occurred while retrieving proofs.")
+async def verify_raid_safely(semaphore: asyncio.Semaphore, raid_id: int, username: str, tweet_id: str, action_type: str) -> int:
+    """
+    Runs the verification of one raid inside the worker pool, isolating its failures and timeouts.
+    """
+    async with semaphore:
+        try:
+            return await asyncio.wait_for(
+                verify_raid_interactions(raid_id, username, tweet_id, action_type), timeout=X_VERIFY_RAID_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            print(f"⏱️ Verification of Raid ID {raid_id} timed out after {X_VERIFY_RAID_TIMEOUT} seconds.")
+        except Exception as e:
+            print(f"❌ Error verifying interactions for Raid ID {raid_id}: {e}")
+        return 0
 
 
-# Sistema de validación y registro de pruebas
 async def verify_and_register_proofs():
     """
     Verifies user interactions and registers proofs in the database for active raids.
-    """
-    try:
-        # Consultar raids activos
-        cursor.execute("""
-            SELECT id, username, tweet_id, action_type
-            FROM raids
-        """)
-        raids = cursor.fetchall()
-
-        if not raids:
-            print("⚠️ No active raids to verify.")
-            return
 
-        requests_made = 0  # Contador de solicitudes a la API
+    Independent raids are verified concurrently (at most `X_VERIFY_CONCURRENCY` at a
+    time) and share the X API rate limiter, so a pass takes about as long as its
+    slowest raid. Overlapping passes are skipped.
+    """
+    if verification_lock.locked():
+        print("⚠️ Previous proof verification pass is still running. Skipping this one.")
+        return
 
-        for raid_id, username, tweet_id, action_type in raids:
-            # Validar configuración del raid
-            if not username or not action_type:
-                print(f"⚠️ Skipping invalid raid configuration for Raid ID {raid_id}.")
-                continue
+    async with verification_lock:
+        try:
+            # Consultar raids activos
+            raids = await db.list_raids()
 
-            # Determinar el endpoint según el tipo de acción
-            endpoint = None
-            if action_type == "retweet":
-                endpoint = f"tweets/{tweet_id}/retweeted_by"
-            elif action_type == "like":
-                endpoint = f"tweets/{tweet_id}/liking_users"
-            elif action_type == "follow":
-                endpoint = f"users/by/username/{username}/followers"
-
-            if not endpoint:
-                print(f"⚠️ Unknown action type for Raid ID {raid_id}. Skipping...")
-                continue
+            if not raids:
+                print("⚠️ No active raids to verify.")
+                return
 
-            # Llamar a la API y procesar la respuesta
-            try:
-                print(f"🔍 Verifying interactions for Raid ID {raid_id}...")
-                response = await x_api_request(endpoint)
-                requests_made += 1  # Incrementar contador
+            requests_before = x_api_client.requests_made
+            started_at = time.monotonic()
+            semaphore = asyncio.Semaphore(X_VERIFY_CONCURRENCY)
+            tasks = []
 
-                if not response or "data" not in response:
-                    print(f"⚠️ No interactions found for Raid ID {raid_id}.")
+            for raid_id, _, _, username, tweet_id, action_type in raids:
+                # Validar configuración del raid
+                if not username or not action_type:
+                    print(f"⚠️ Skipping invalid raid configuration for Raid ID {raid_id}.")
                     continue
+                tasks.append(verify_raid_safely(semaphore, raid_id, username, tweet_id, action_type))
 
-                # Extraer los usuarios que completaron la acción
-                interacting_users = {user["username"].lower() for user in response["data"]}
-
-                # Verificar participantes pendientes
-                cursor.execute("""
-                    SELECT id, user_id, username FROM participants
-                    WHERE raid_id = ? AND status = 'pending'
-                """, (raid_id,))
-                participants = cursor.fetchall()
-
-                for participant_id, user_id, participant_username in participants:
-                    if participant_username.lower() in interacting_users:
-                        # Actualizar estado del participante y registrar prueba
-                        cursor.execute("""
-                            UPDATE participants
-                            SET status = 'completed'
-                            WHERE id = ?
-                        """, (participant_id,))
-                        cursor.execute("""
-                            INSERT INTO proofs (raid_id, user_id, username, proof)
-                            VALUES (?, ?, ?, ?)
-                        """, (raid_id, user_id, participant_username, f"Completed {action_type}"))
-                        conn.commit()
-                        print(f"✅ @{participant_username} completed the action for Raid ID {raid_id}.")
-
-            except Exception as e:
-                print(f"❌ Error verifying interactions for Raid ID {raid_id}: {e}")
-
-            # Respetar los límites de la API
-            await asyncio.sleep(60)  # Ajustar tiempo según los límites de la API
+            completed = sum(await asyncio.gather(*tasks))
 
-        print(f"🔄 Proof verification completed. Total API requests made: {requests_made}")
+            requests_made = x_api_client.requests_made - requests_before
+            print(
+                f"🔄 Proof verification completed in {time.monotonic() - started_at:.1f}s. "
+                f"{completed} participant(s) verified across {len(tasks)} raid(s). Total API requests made: {requests_made}"
+            )
 
-    except sqlite3.Error as db_error:
-        print(f"❌ Database error during verification: {db_error}")
-    except Exception as e:
-        print(f"❌ Unexpected error in verify_and_register_proofs: {e}")
+        except sqlite3.Error as db_error:
+            print(f"❌ Database error during verification: {db_error}")
+        except Exception as e:
+            print(f"❌ Unexpected error in verify_and_register_proofs: {e}")
 
 
 # Función: Verificación periódica de pruebas
@@ -960,6 +3217,7 @@ async def periodic_proof_verification(context: ContextTypes.DEFAULT_TYPE):
     print("🔄 Running periodic proof verification...")
     try:
         await verify_and_register_proofs()
+        request_board_refresh(context)  # Solo se edita si cambiaron los completados
     except Exception as e:
         print(f"❌ Error during periodic proof verification: {e}")
 
@@ -974,10 +3232,9 @@ async def start_proof_verification(update: Update, context: ContextTypes.DEFAULT
         return
 
     chat_id = update.effective_chat.id
-    user = await context.bot.get_chat_member(chat_id, update.effective_user.id)
 
     # Verificar permisos de administrador
-    if user.status not in ["administrator", "creator"]:
+    if not await is_chat_admin(context, chat_id, update.effective_user.id):
         await update.message.reply_text("❌ This command is restricted to administrators.")
         return
 
@@ -1005,10 +3262,9 @@ async def stop_proof_verification(update: Update, context: ContextTypes.DEFAULT_
         return
 
     chat_id = update.effective_chat.id
-    user = await context.bot.get_chat_member(chat_id, update.effective_user.id)
 
     # Verificar permisos de administrador
-    if user.status not in ["administrator", "creator"]:
+    if not await is_chat_admin(context, chat_id, update.effective_user.id):
         await update.message.reply_text("❌ This command is restricted to administrators.")
         return
 
@@ -1024,84 +3280,6 @@ async def stop_proof_verification(update: Update, context: ContextTypes.DEFAULT_
         await update.message.reply_text("❌ Failed to stop proof verification. Please try again.")
 
 
-# Función: verify_and_register_proofs con manejo optimizado del contador y excepciones
-async def verify_and_register_proofs():
-    """Verifica automáticamente las interacciones y registra las pruebas en la base de datos."""
-    cursor.execute("""
-        SELECT id, username, tweet_id, action_type
-        FROM raids
-    """)
-    raids = cursor.fetchall()
-
-    if not raids:
-        print("No active raids to verify.")
-        return
-
-    requests_made = 0  # Inicializa el contador de solicitudes
-
-    for raid in raids:
-        raid_id, username, tweet_id, action_type = raid
-        endpoint = None
-
-        # Determinar el endpoint según el tipo de acción
-        if action_type == "retweet":
-            endpoint = f"tweets/{tweet_id}/retweeted_by"
-        elif action_type == "like":
-            endpoint = f"tweets/{tweet_id}/liking_users"
-        elif action_type == "follow":
-            endpoint = f"users/by/username/{username}/followers"
-        else:
-            print(f"Unknown action type for Raid ID {raid_id}: {action_type}")
-            continue
-
-        # Consultar la API de X
-        try:
-            print(f"🔍 Verifying interactions for Raid ID {raid_id}...")
-            response = await x_api_request(endpoint)  # Asegúrate de que sea asíncrona
-            requests_made += 1  # Incrementa el contador de solicitudes
-
-            if not response or "data" not in response:
-                print(f"No interactions found for Raid ID {raid_id}.")
-                continue
-
-            # Lista de usuarios que completaron la acción
-            interacting_users = {user["username"].lower() for user in response["data"]}
-
-            # Verificar participantes pendientes
-            cursor.execute("""
-                SELECT id, user_id, username FROM participants
-                WHERE raid_id = ? AND status = 'pending'
-            """, (raid_id,))
-            participants = cursor.fetchall()
-
-            for participant_id, user_id, participant_username in participants:
-                if participant_username.lower() in interacting_users:
-                    # Actualizar estado del participante
-                    cursor.execute("""
-                        UPDATE participants
-                        SET status = 'completed'
-                        WHERE id = ?
-                    """, (participant_id,))
-                    conn.commit()
-
-                    # Registrar prueba
-                    cursor.execute("""
-                        INSERT INTO proofs (raid_id, user_id, username, proof)
-                        VALUES (?, ?, ?, ?)
-                    """, (raid_id, user_id, participant_username, f"Completed {action_type}"))
-                    conn.commit()
-
-                    print(f"✅ @{participant_username} completed the action for Raid ID {raid_id}.")
-
-        except Exception as e:
-            print(f"❌ Error verifying interactions for Raid ID {raid_id}: {e}")
-
-        # Respetar los límites de la API
-        await asyncio.sleep(60)  # Ajusta este tiempo si es necesario
-
-    print(f"🔄 Proof verification completed. Total API requests made: {requests_made}")
-
-
 # Manejador de botones: menu_handler
 async def menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
@@ -1170,34 +3348,31 @@ async def handle_join_raid(update: Update, context: ContextTypes.DEFAULT_TYPE):
         print(f"Handling join_raid callback: {query.data}")  # Debugging log
 
         raid_id = query.data.split(":")[1]
+        chat_id = query.message.chat_id
         user_id = query.from_user.id
         username = query.from_user.username or "Anonymous"
 
         # Validate if the RAID exists
-        cursor.execute("SELECT name FROM raids WHERE id = ?", (raid_id,))
-        raid = cursor.fetchone()
+        raid = await db.get_raid(raid_id)
         if not raid:
-            await query.message.reply_text("❌ This raid no longer exists.")
-            return
-
-        # Check if the user is already registered
-        cursor.execute("SELECT id FROM participants WHERE raid_id = ? AND user_id = ?", (raid_id, user_id))
-        if cursor.fetchone():
-            await query.message.reply_text(f"❌ @{username}, you are already a participant in this raid.")
+            await send_message_queued(context, chat_id, "❌ This raid no longer exists.", wait=False)
             return
 
         # Register the user in the RAID
-        cursor.execute(
-            "INSERT INTO participants (raid_id, user_id, username) VALUES (?, ?, ?)",
-            (raid_id, user_id, username)
-        )
-        conn.commit()
+        if not await db.add_participant(raid_id, user_id, username):
+            await send_message_queued(
+                context, chat_id, f"❌ @{username}, you are already a participant in this raid.", wait=False
+            )
+            return
 
-        await query.message.reply_text(f"✅ @{username}, you have successfully joined the raid!")
+        await send_message_queued(context, chat_id, f"✅ @{username}, you have successfully joined the raid!", wait=False)
+        request_board_refresh(context)
 
     except Exception as e:
         print(f"❌ Error in handle_join_raid: {e}")
-        await query.message.reply_text("❌ Failed to join the raid. Please try again later.")
+        await send_message_queued(
+            context, query.message.chat_id, "❌ Failed to join the raid. Please try again later.", wait=False
+        )
 
 
 # Publicar raids automáticamente
@@ -1208,57 +3383,31 @@ async def post_raids(context: ContextTypes.DEFAULT_TYPE):
     chat_id = context.job.chat_id
 
     # Consultar raids activos y contar participantes
-    cursor.execute("""
-        SELECT r.id, r.name, r.description, r.username, r.tweet_id, r.action_type, 
-               (SELECT COUNT(*) FROM participants p WHERE p.raid_id = r.id) as participant_count,
-               (SELECT COUNT(*) FROM participants p WHERE p.raid_id = r.id AND p.status = 'completed') as completed_count
-        FROM raids r
-        ORDER BY r.created_at DESC
-    """)
-    raids = cursor.fetchall()
+    raids = await db.list_raid_summaries()
 
     if not raids:
-        await context.bot.send_message(chat_id, "No active raids to display.")
+        await send_message_queued(
+            context, chat_id, "No active raids to display.",
+            priority=PRIORITY_SCHEDULED, coalesce_key=("raid_post", chat_id, None)
+        )
         return
 
-    for raid in raids:
-        raid_id, name, description, username, tweet_id, action_type, participant_count, completed_count = raid
-        pending_count = participant_count - completed_count
-
-        # Construir el enlace correcto
-        tweet_url = None
-        if action_type == "follow":
-            tweet_url = f"https://x.com/{username}"
-        elif action_type in ["retweet", "like"] and tweet_id and username:
-            tweet_url = f"https://x.com/{username}/status/{tweet_id}"
-        if not tweet_url:
-            tweet_url = "Invalid URL"
-
-        # Crear el botón "Join Raid"
-        keyboard = [[InlineKeyboardButton("Join Raid", callback_data=f"join_raid:{raid_id}")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        # Enviar mensaje del raid
+    # Un digest en lugar de un mensaje por raid; cada página pendiente se reemplaza por la más reciente
+    pages = pack_raid_digest(
+        "🎯 <b>Active Raids:</b>", raids, footer="\n\nClick a button below to join a raid!"
+    )
+    for page, (text, reply_markup) in enumerate(pages):
         try:
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text=(
-                    f"🎯 <b>Active Raid:</b>\n\n"
-                    f"🆔 <b>Raid ID:</b> <code>{raid_id}</code>\n"
-                    f"📛 <b>Name:</b> <code>{name}</code>\n"
-                    f"📖 <b>Description:</b> {description}\n"
-                    f"🔗 <b>Link:</b> <a href='{tweet_url}'>View Target</a>\n"
-                    f"✔️ <b>Action Required:</b> {action_type.capitalize()}\n"
-                    f"👥 <b>Participants:</b> {participant_count}\n"
-                    f"✅ <b>Completed:</b> {completed_count}\n"
-                    f"⌛ <b>Pending:</b> {pending_count}\n\n"
-                    f"Click the button below to join this raid!"
-                ),
+            await send_message_queued(
+                context, chat_id, text,
+                priority=PRIORITY_SCHEDULED,
+                coalesce_key=("raid_post", chat_id, page),
                 reply_markup=reply_markup,
-                parse_mode="HTML"
+                parse_mode="HTML",
+                disable_web_page_preview=True
             )
         except Exception as e:
-            print(f"Error sending raid message for Raid ID {raid_id}: {e}")
+            print(f"Error sending raid digest page {page + 1} to chat {chat_id}: {e}")
 
 
 # Comando: /start_raid_posts
@@ -1267,9 +3416,8 @@ async def start_raid_posts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     Starts automatic posting of raids (restricted to admins).
     """
     chat_id = update.effective_chat.id
-    user = await context.bot.get_chat_member(chat_id, update.effective_user.id)
 
-    if user.status not in ["administrator", "creator"]:
+    if not await is_chat_admin(context, chat_id, update.effective_user.id):
         await update.message.reply_text("❌ This command is restricted to administrators.")
         return
 
@@ -1289,9 +3437,8 @@ async def stop_raid_posts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     Stops automatic posting of raids (restricted to admins).
     """
     chat_id = update.effective_chat.id
-    user = await context.bot.get_chat_member(chat_id, update.effective_user.id)
 
-    if user.status not in ["administrator", "creator"]:
+    if not await is_chat_admin(context, chat_id, update.effective_user.id):
         await update.message.reply_text("❌ This command is restricted to administrators.")
         return
 
@@ -1302,68 +3449,135 @@ async def stop_raid_posts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("✅ Auto-posting of raids has been stopped!")
 
 
-# Verificación periódica de interacciones
-async def verify_and_register_proofs():
+RAID_BOARD_DEBOUNCE = 5  # Segundos para agrupar cambios en una sola edición del tablero
+RAID_BOARD_TITLE = "📌 <b>Live Raid Board</b>"
+RAID_BOARD_FOOTER = "\n\nTap a button below to join a raid!"
+RAID_BOARD_OVERFLOW_RESERVE = 80  # Espacio reservado para la línea de "más raids"
+
+
+def render_raid_board(raids: list) -> tuple:
     """
-    Verifies user interactions and registers proofs in the database while respecting API limits.
+    Renders the board as (text, reply_markup, content_hash). Raids that do not fit in one message are summarized in a final line.
     """
-    cursor.execute("""
-        SELECT id, username, tweet_id, action_type
-        FROM raids
-    """)
-    raids = cursor.fetchall()
-
     if not raids:
-        print("No active raids to verify.")
+        text = f"{RAID_BOARD_TITLE}\n\nNo active raids right now."
+        reply_markup = None
+    else:
+        pages = pack_raid_digest(
+            RAID_BOARD_TITLE, raids, footer=RAID_BOARD_FOOTER,
+            limit=TELEGRAM_MESSAGE_LIMIT - RAID_BOARD_OVERFLOW_RESERVE
+        )
+        text, reply_markup = pages[0]
+        shown = sum(len(row) for row in reply_markup.inline_keyboard)
+        if shown < len(raids):
+            text += f"\n➕ {len(raids) - shown} more raid(s): use the 📋 List Raids button."
+
+    # El hash cubre el texto y los botones: cualquier cambio visible obliga a editar
+    buttons = reply_markup.to_dict() if reply_markup else None
+    content_hash = hashlib.sha256(f"{text}|{buttons}".encode()).hexdigest()
+    return text, reply_markup, content_hash
+
+
+# Pedir una actualización del tablero: los cambios se agrupan durante RAID_BOARD_DEBOUNCE segundos
+def request_board_refresh(context: ContextTypes.DEFAULT_TYPE):
+    if context.job_queue.get_jobs_by_name("raid_board_refresh"):
         return
+    context.job_queue.run_once(refresh_raid_boards, when=RAID_BOARD_DEBOUNCE, name="raid_board_refresh")
 
-    for raid_id, username, tweet_id, action_type in raids:
-        endpoint = None
-        if action_type == "retweet":
-            endpoint = f"tweets/{tweet_id}/retweeted_by"
-        elif action_type == "like":
-            endpoint = f"tweets/{tweet_id}/liking_users"
-        elif action_type == "follow":
-            endpoint = f"users/by/username/{username}/followers"
-
-        if not endpoint:
-            print(f"Invalid endpoint for Raid ID {raid_id}. Skipping...")
-            continue
-
-        response = x_api_request(endpoint)
-        if not response or "data" not in response:
-            print(f"No interactions found for Raid ID {raid_id}.")
-            continue
-
-        interacting_users = {user["username"].lower() for user in response["data"]}
-
-        cursor.execute("""
-            SELECT id, username FROM participants
-            WHERE raid_id = ? AND status = 'pending'
-        """, (raid_id,))
-        participants = cursor.fetchall()
-
-        for participant_id, participant_username in participants:
-            if participant_username.lower() in interacting_users:
-                cursor.execute("""
-                    UPDATE participants
-                    SET status = 'completed'
-                    WHERE id = ?
-                """, (participant_id,))
-                cursor.execute("""
-                    INSERT INTO proofs (raid_id, user_id, username, proof)
-                    VALUES (?, ?, ?, ?)
-                """, (raid_id, participant_id, participant_username, f"Completed {action_type}"))
-                conn.commit()
-                print(f"✅ @{participant_username} completed the action for Raid ID {raid_id}.")
 
-        await asyncio.sleep(60)  # Respetar los límites de la API
+async def publish_raid_board(context: ContextTypes.DEFAULT_TYPE, chat_id: int, text: str, reply_markup,
+                             content_hash: str, pin: bool) -> int:
+    """
+    Posts a new board message, optionally pins it, and stores it for the chat.
+    """
+    message = await send_message_queued(
+        context, chat_id, text, reply_markup=reply_markup, parse_mode="HTML", disable_web_page_preview=True
+    )
+    if pin:
+        try:
+            await telegram_outbox.call(
+                lambda: context.bot.pin_chat_message(chat_id, message.message_id, disable_notification=True),
+                chat_id, PRIORITY_REPLY, counts_as_message=False
+            )
+        except Exception as e:
+            print(f"⚠️ Could not pin the raid board in chat {chat_id}: {e}")
+    await db.save_raid_board(chat_id, message.message_id, content_hash, pin)
+    return message.message_id
+
+
+# Editar en el sitio los tableros cuyo contenido cambió
+async def refresh_raid_boards(context: ContextTypes.DEFAULT_TYPE):
+    boards = await db.list_raid_boards()
+    if not boards:
+        return
+
+    text, reply_markup, content_hash = render_raid_board(await db.list_raid_summaries())
+    for board in boards:
+        if board.content_hash == content_hash:
+            continue  # Nada visible cambió: no se envía nada
+        try:
+            await telegram_outbox.call(
+                lambda board=board: context.bot.edit_message_text(
+                    text, chat_id=board.chat_id, message_id=board.message_id,
+                    reply_markup=reply_markup, parse_mode="HTML", disable_web_page_preview=True
+                ),
+                board.chat_id, PRIORITY_SCHEDULED, coalesce_key=("raid_board", board.chat_id)
+            )
+            await db.save_raid_board(board.chat_id, board.message_id, content_hash, board.pinned)
+            print(f"📌 Raid board updated in chat {board.chat_id}.")
+        except BadRequest as e:
+            if "not modified" in str(e).lower():
+                await db.save_raid_board(board.chat_id, board.message_id, content_hash, board.pinned)
+            elif "not found" in str(e).lower():
+                # Alguien borró el tablero: publicar uno nuevo
+                print(f"⚠️ Raid board in chat {board.chat_id} was deleted. Posting a new one.")
+                await publish_raid_board(context, board.chat_id, text, reply_markup, content_hash, board.pinned)
+            else:
+                print(f"❌ Failed to update raid board in chat {board.chat_id}: {e}")
+        except Exception as e:
+            print(f"❌ Failed to update raid board in chat {board.chat_id}: {e}")
+
+
+# Comando: /start_raid_board [pin]
+async def start_raid_board(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Posts a live raid board in the chat that is edited in place as raids change (restricted to admins).
+    """
+    chat_id = update.effective_chat.id
+
+    if not await is_chat_admin(context, chat_id, update.effective_user.id):
+        await update.message.reply_text("❌ This command is restricted to administrators.")
+        return
 
+    if await db.get_raid_board(chat_id):
+        await update.message.reply_text("📌 This chat already has a live raid board. Use /stop_raid_board first.")
+        return
 
+    pin = bool(context.args) and context.args[0].lower() == "pin"
+    try:
+        text, reply_markup, content_hash = render_raid_board(await db.list_raid_summaries())
+        await publish_raid_board(context, chat_id, text, reply_markup, content_hash, pin)
+        print(f"📌 Raid board created in chat {chat_id}.")
+    except Exception as e:
+        print(f"❌ Error creating raid board in chat {chat_id}: {e}")
+        await update.message.reply_text("❌ Failed to create the raid board. Please try again later.")
 
 
+# Comando: /stop_raid_board
+async def stop_raid_board(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Stops updating the chat's live raid board (restricted to admins).
+    """
+    chat_id = update.effective_chat.id
 
+    if not await is_chat_admin(context, chat_id, update.effective_user.id):
+        await update.message.reply_text("❌ This command is restricted to administrators.")
+        return
 
+    if await db.delete_raid_board(chat_id):
+        await update.message.reply_text("✅ The live raid board has been stopped.")
+    else:
+        await update.message.reply_text("❌ This chat has no live raid board.")
 
 
 # Function to welcome new members
@@ -1373,6 +3587,10 @@ async def welcome_new_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
     """
     chat_id = update.effective_chat.id
 
+    # Durante una oleada de ingresos no se da la bienvenida a nadie
+    if await guard_join_flood(update, context):
+        return
+
     for member in update.message.new_chat_members:
         # Create button menu
         keyboard = [
@@ -1393,11 +3611,12 @@ async def welcome_new_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
         # Send welcome message with buttons
         try:
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text=(f"👋 Welcome, {member.full_name}!\n\nExplore the bot's features using the options below."),
+            await send_message_queued(
+                context, chat_id,
+                f"👋 Welcome, {member.full_name}!\n\nExplore the bot's features using the options below.",
                 reply_markup=reply_markup,
                 parse_mode="HTML",
+                wait=False,
             )
         except Exception as e:
             print(f"❌ Failed to welcome user {member.full_name}: {e}")
@@ -1432,7 +3651,8 @@ async def menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 ],
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.message.reply_text(
+            await send_message_queued(
+                context, query.message.chat_id,
                 (
                     "🎯 <b>Raid Help:</b>\n\n"
                     "This is the help for participating in our RAIDS:\n"
@@ -1442,22 +3662,26 @@ async def menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     "Enjoy participating and tracking your progress!"
                 ),
                 reply_markup=reply_markup,
-                parse_mode="HTML"
+                parse_mode="HTML", wait=False
             )
         elif query.data == "top_cryptos":
             # Ejecuta directamente el comando /top_cryptos
             await get_top_cryptos(query, context)
         elif query.data == "about_bot":
-            await query.message.reply_text(
+            await send_message_queued(
+                context, query.message.chat_id,
                 "ℹ️ <b>About the Bot:</b>\n\n"
                 "This bot helps you:\n"
                 "• Track cryptocurrency stats.\n"
                 "• Manage and participate in exclusive raids on X.\n\n"
                 "Use <b>/start</b> to explore all features.",
-                parse_mode="HTML"
+                parse_mode="HTML", wait=False
             )
         else:
-            await query.message.reply_text("❓ <b>Unknown option.</b> Please try again.", parse_mode="HTML")
+            await send_message_queued(
+                context, query.message.chat_id, "❓ <b>Unknown option.</b> Please try again.",
+                parse_mode="HTML", wait=False
+            )
     except Exception as e:
         print(f"❌ Error handling callback data '{query.data}': {e}")
 
@@ -1486,99 +3710,469 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
 
-    # Send start menu
-    try:
-        await update.message.reply_text(welcome_message, parse_mode="HTML", reply_markup=reply_markup)
-    except Exception as e:
-        print(f"❌ Error sending start menu: {e}")
-        await update.message.reply_text("❌ An error occurred while sending the start menu.")
+    # Send start menu
+    try:
+        await update.message.reply_text(welcome_message, parse_mode="HTML", reply_markup=reply_markup)
+    except Exception as e:
+        print(f"❌ Error sending start menu: {e}")
+        await update.message.reply_text("❌ An error occurred while sending the start menu.")
+
+
+
+
+
+
+# Handler for /start_games command
+async def start_games_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Handles the /start_games command in the group.
+    """
+    try:
+        chat_id = update.effective_chat.id
+        await send_message_queued(context, chat_id, "🎮 The games are starting! Get ready...", wait=False)
+    except Exception as e:
+        logger.error(f"❌ Error in start_games_handler: {e}")
+        await update.message.reply_text("❌ An error occurred while starting the games.")
+
+
+
+
+
+
+#SPAM BLOCKER Y RAID DETECTION SYSTEM
+
+# Configuración de seguimiento de spam y links
+mute_duration = timedelta(minutes=60)  # Duración del mute por spam
+link_mute_duration = timedelta(minutes=60)  # Duración del mute por links
+message_limit = 4  # Número máximo de mensajes permitidos en la ventana de tiempo
+time_window = timedelta(seconds=10)  # Ventana de tiempo para detección de spam
+mute_cooldown = timedelta(seconds=30)  # No volver a silenciar al mismo usuario dentro de este margen
+FLOOD_EVICTION_INTERVAL = 60  # Segundos entre barridos de usuarios inactivos
+
+
+class FloodTracker:
+    """
+    Sliding-window message counter keyed by (chat_id, user_id).
+
+    Each key holds a deque capped at `limit + 1` timestamps, so an update is
+    amortized O(1) and memory per user is bounded. Users idle for longer than
+    the window, and expired mute cooldowns, are dropped by `evict_idle`.
+    """
+
+    def __init__(self, limit: int, window: timedelta, cooldown: timedelta):
+        self.limit = limit
+        self.window = window.total_seconds()
+        self.cooldown = cooldown.total_seconds()
+        self._windows: dict = {}  # (chat_id, user_id) -> deque de marcas monotónicas
+        self._handled: dict = {}  # (chat_id, user_id) -> instante en que vence el cooldown
+
+    def record_message(self, chat_id: int, user_id: int) -> bool:
+        """
+        Records a message and tells whether the user exceeded the limit inside the window.
+        """
+        now = time.monotonic()
+        key = (chat_id, user_id)
+        timestamps = self._windows.get(key)
+        if timestamps is None:
+            timestamps = self._windows[key] = deque(maxlen=self.limit + 1)
+        timestamps.append(now)
+        while now - timestamps[0] > self.window:
+            timestamps.popleft()
+        return len(timestamps) > self.limit
+
+    def recently_handled(self, chat_id: int, user_id: int) -> bool:
+        until = self._handled.get((chat_id, user_id))
+        return until is not None and until > time.monotonic()
+
+    def mark_handled(self, chat_id: int, user_id: int):
+        self._handled[(chat_id, user_id)] = time.monotonic() + self.cooldown
+
+    def evict_idle(self) -> int:
+        """
+        Drops users with no message inside the window and expired cooldowns. Returns how many entries were removed.
+        """
+        now = time.monotonic()
+        idle = [key for key, timestamps in self._windows.items() if now - timestamps[-1] > self.window]
+        for key in idle:
+            del self._windows[key]
+        expired = [key for key, until in self._handled.items() if until <= now]
+        for key in expired:
+            del self._handled[key]
+        return len(idle) + len(expired)
+
+    def gauges(self) -> dict:
+        return {
+            "flood_tracked_users": len(self._windows),
+            "flood_tracked_chats": len({chat_id for chat_id, _ in self._windows}),
+            "mute_cooldowns": len(self._handled),
+        }
+
+
+flood_tracker = FloodTracker(message_limit, time_window, mute_cooldown)
+
+
+# Tarea periódica: liberar memoria de usuarios inactivos
+async def evict_idle_flood_entries(context: ContextTypes.DEFAULT_TYPE):
+    removed = flood_tracker.evict_idle() + join_flood_detector.evict_idle()
+    if removed:
+        print(f"🧹 Flood tracker evicted {removed} idle entries. Now tracking {flood_tracker.gauges()['flood_tracked_users']} users.")
+
+# Configuración de detección de raids
+raid_detection_threshold = 5  # Número de miembros para activar detección de raids
+raid_detection_window = 30  # Ventana de tiempo en segundos para detección de raids
+raid_lock_duration = 300  # Duración del bloqueo del grupo en segundos
+raid_restrict_concurrency = 10  # Restricciones simultáneas al castigar una oleada de cuentas
+raid_unlock_retry_delay = 60  # Segundos hasta reintentar un desbloqueo fallido
+# Permisos a restaurar si no se pudieron leer los del chat antes del bloqueo
+RAID_UNLOCK_FALLBACK_PERMISSIONS = ChatPermissions(
+    can_send_messages=True, can_send_audios=True, can_send_documents=True, can_send_photos=True,
+    can_send_videos=True, can_send_video_notes=True, can_send_voice_notes=True, can_send_polls=True,
+    can_send_other_messages=True, can_add_web_page_previews=True, can_invite_users=True,
+)
+
+# Función genérica para restringir usuarios con reintentos
+# (los RetryAfter los absorbe el outbox con reintentos acotados, sin recursión)
+async def restrict_user_with_retry(context, chat_id, user_id, permissions, until_date):
+    try:
+        await telegram_outbox.call(
+            lambda: context.bot.restrict_chat_member(
+                chat_id=chat_id,
+                user_id=user_id,
+                permissions=permissions,
+                until_date=until_date
+            ),
+            chat_id, PRIORITY_MODERATION, counts_as_message=False
+        )
+        print(f"✅ User {user_id} successfully restricted.")
+        return True
+    except Exception as e:
+        print(f"❌ Failed to restrict user {user_id}: {e}")
+        return False
+
+# Función para silenciar usuarios
+async def mute_user(context, chat_id, user_id, username, duration, reason):
+    now = datetime.now(timezone.utc)  # Usar timezone-aware UTC
+
+    # Verificar si el usuario ya ha sido manejado recientemente
+    if flood_tracker.recently_handled(chat_id, user_id):
+        print(f"⚠️ User {user_id} was recently handled. Skipping.")
+        return
+
+    flood_tracker.mark_handled(chat_id, user_id)  # Registrar acción
+    try:
+        success = await restrict_user_with_retry(
+            context,
+            chat_id,
+            user_id,
+            ChatPermissions(can_send_messages=False),
+            now + duration
+        )
+        if success:
+            print(f"✅ User @{username} muted for {duration.total_seconds() / 60:.0f} minutes ({reason}).")
+            await send_message_queued(
+                context, chat_id,
+                f"❌ @{username} has been muted for {duration.total_seconds() / 60:.0f} minutes.\nReason: {reason}.",
+                priority=PRIORITY_MODERATION, wait=False
+            )
+    except Exception as e:
+        print(f"❌ Failed to mute user @{username}: {e}")
+
+class JoinFloodDetector:
+    """
+    Per-chat join-rate detector for bot raids.
+
+    Each chat keeps a ring buffer of its last `threshold` joins; when the oldest
+    of them is still inside the window, the chat is under a join flood. While a
+    chat is locked down, later joiners are collected as suspects instead of
+    being welcomed.
+    """
+
+    def __init__(self, threshold: int, window: float):
+        self.threshold = threshold
+        self.window = window
+        self._joins: dict = {}  # chat_id -> deque de (instante, user_id)
+        self._lockdowns: dict = {}  # chat_id -> {"permissions": ChatPermissions, "suspects": set}
+
+    def record_join(self, chat_id: int, user_id: int) -> Union[list, None]:
+        """
+        Records a join. Returns the burst's user IDs when this join crosses the threshold, else None.
+        """
+        now = time.monotonic()
+        joins = self._joins.get(chat_id)
+        if joins is None:
+            joins = self._joins[chat_id] = deque(maxlen=self.threshold)
+        joins.append((now, user_id))
+        if len(joins) == self.threshold and now - joins[0][0] <= self.window:
+            burst = [joined_user for _, joined_user in joins]
+            joins.clear()
+            return burst
+        return None
+
+    def is_locked(self, chat_id: int) -> bool:
+        return chat_id in self._lockdowns
+
+    def start_lockdown(self, chat_id: int, permissions: ChatPermissions):
+        self._lockdowns[chat_id] = {"permissions": permissions, "suspects": set()}
+
+    def add_suspect(self, chat_id: int, user_id: int):
+        self._lockdowns[chat_id]["suspects"].add(user_id)
+
+    def get_lockdown(self, chat_id: int) -> Union[dict, None]:
+        return self._lockdowns.get(chat_id)
+
+    def take_suspects(self, chat_id: int) -> set:
+        """
+        Hands over the suspects collected so far; later joiners start a new set.
+        """
+        lockdown = self._lockdowns[chat_id]
+        suspects, lockdown["suspects"] = lockdown["suspects"], set()
+        return suspects
+
+    def end_lockdown(self, chat_id: int) -> Union[dict, None]:
+        return self._lockdowns.pop(chat_id, None)
+
+    def evict_idle(self) -> int:
+        now = time.monotonic()
+        idle = [chat_id for chat_id, joins in self._joins.items() if not joins or now - joins[-1][0] > self.window]
+        for chat_id in idle:
+            del self._joins[chat_id]
+        return len(idle)
+
+    def gauges(self) -> dict:
+        return {
+            "join_tracked_chats": len(self._joins),
+            "raid_locked_chats": len(self._lockdowns),
+            "raid_suspects": sum(len(lock["suspects"]) for lock in self._lockdowns.values()),
+        }
 
 
+join_flood_detector = JoinFloodDetector(raid_detection_threshold, raid_detection_window)
 
 
+# Restringir en lote las cuentas de una oleada, con concurrencia acotada
+async def restrict_accounts(context, chat_id: int, user_ids, until_date: datetime) -> int:
+    semaphore = asyncio.Semaphore(raid_restrict_concurrency)
 
+    async def restrict(user_id):
+        async with semaphore:
+            return await restrict_user_with_retry(
+                context, chat_id, user_id, ChatPermissions(can_send_messages=False), until_date
+            )
 
-# Handler for /start_games command
-async def start_games_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    results = await asyncio.gather(*(restrict(user_id) for user_id in user_ids))
+    return sum(1 for result in results if result)
+
+
+# Detectar oleadas de ingresos y bloquear el grupo
+async def guard_join_flood(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
     """
-    Handles the /start_games command in the group.
+    Feeds new members into the join-flood detector. Returns True when the chat is
+    (or has just been) locked down, in which case welcomes must be skipped.
     """
+    chat_id = update.effective_chat.id
+    joiners = [member.id for member in update.message.new_chat_members if member.id != context.bot.id]
+
+    if join_flood_detector.is_locked(chat_id):
+        for user_id in joiners:
+            join_flood_detector.add_suspect(chat_id, user_id)
+        return True
+
+    burst = None
+    for user_id in joiners:
+        burst = join_flood_detector.record_join(chat_id, user_id) or burst
+    if not burst:
+        return False
+
+    # Guardar los permisos actuales para restaurarlos al desbloquear
     try:
-        chat_id = update.effective_chat.id
-        await context.bot.send_message(chat_id=chat_id, text="🎮 The games are starting! Get ready...")
+        chat = await context.bot.get_chat(chat_id)
+        previous_permissions = chat.permissions or RAID_UNLOCK_FALLBACK_PERMISSIONS
     except Exception as e:
-        logger.error(f"❌ Error in start_games_handler: {e}")
-        await update.message.reply_text("❌ An error occurred while starting the games.")
+        print(f"⚠️ Could not read permissions of chat {chat_id}, using defaults on unlock: {e}")
+        previous_permissions = RAID_UNLOCK_FALLBACK_PERMISSIONS
 
+    # Los que entren después del disparo también cuentan como sospechosos
+    burst.extend(user_id for user_id in joiners if user_id not in burst)
+    join_flood_detector.start_lockdown(chat_id, previous_permissions)
 
+    # Persistir el bloqueo antes de cerrar el chat: tras un reinicio, restore_raid_lockdowns lo reabre
+    try:
+        await db.save_raid_lockdown(
+            chat_id, time.time() + raid_lock_duration, json.dumps(previous_permissions.to_dict())
+        )
+    except Exception as e:
+        print(f"⚠️ Could not persist the lockdown of chat {chat_id}; a restart would not reopen it: {e}")
 
+    try:
+        await telegram_outbox.call(
+            lambda: context.bot.set_chat_permissions(chat_id, ChatPermissions(can_send_messages=False)),
+            chat_id, PRIORITY_MODERATION, counts_as_message=False
+        )
+        print(f"🚨 Join flood detected in chat {chat_id}: {len(burst)} joins in {raid_detection_window}s. Chat locked.")
+    except Exception as e:
+        print(f"❌ Failed to lock chat {chat_id}: {e}")
 
+    until_date = datetime.now(timezone.utc) + mute_duration
+    restricted = await restrict_accounts(context, chat_id, burst, until_date)
 
+    try:
+        await send_message_queued(
+            context, chat_id,
+            f"🚨 Raid detected! The group is locked for {raid_lock_duration // 60} minutes.\n"
+            f"{restricted} suspicious accounts have been muted.",
+            priority=PRIORITY_MODERATION, wait=False
+        )
+    except Exception as e:
+        print(f"❌ Failed to announce lockdown in chat {chat_id}: {e}")
 
-#SPAM BLOCKER Y RAID DETECTION SYSTEM
+    context.job_queue.run_once(
+        unlock_chat_after_raid, when=raid_lock_duration, data={"chat_id": chat_id}, name=f"raid_unlock:{chat_id}"
+    )
+    return True
 
-# Configuración de seguimiento de spam y links
-user_message_count = defaultdict(list)
-mute_duration = timedelta(minutes=60)  # Duración del mute por spam
-link_mute_duration = timedelta(minutes=60)  # Duración del mute por links
-message_limit = 4  # Número máximo de mensajes permitidos en la ventana de tiempo
-time_window = timedelta(seconds=10)  # Ventana de tiempo para detección de spam
-recently_handled_users = {}  # Estructura: {user_id: datetime}
 
-# Configuración de detección de raids
-new_members = []  # Lista para rastrear nuevos miembros con marcas de tiempo
-raid_detection_threshold = 5  # Número de miembros para activar detección de raids
-raid_detection_window = 30  # Ventana de tiempo en segundos para detección de raids
-raid_lock_duration = 300  # Duración del bloqueo del grupo en segundos
+# Desbloquear el grupo cuando termina el bloqueo por raid
+async def unlock_chat_after_raid(context: ContextTypes.DEFAULT_TYPE):
+    chat_id = context.job.data["chat_id"]
+    # El bloqueo sigue activo hasta que el chat se reabra de verdad
+    lockdown = join_flood_detector.get_lockdown(chat_id)
+    if not lockdown:
+        return
+
+    # Silenciar en lote a quienes entraron durante el bloqueo, antes de reabrir el chat
+    late_suspects = join_flood_detector.take_suspects(chat_id)
+    until_date = datetime.now(timezone.utc) + mute_duration
+    restricted = await restrict_accounts(context, chat_id, late_suspects, until_date)
 
-# Función genérica para restringir usuarios con reintentos
-async def restrict_user_with_retry(context, chat_id, user_id, permissions, until_date):
     try:
-        await context.bot.restrict_chat_member(
-            chat_id=chat_id,
-            user_id=user_id,
-            permissions=permissions,
-            until_date=until_date
+        await telegram_outbox.call(
+            lambda: context.bot.set_chat_permissions(chat_id, lockdown["permissions"]),
+            chat_id, PRIORITY_MODERATION, counts_as_message=False
         )
-        print(f"✅ User {user_id} successfully restricted.")
-        return True
-    except RetryAfter as e:
-        print(f"⏳ Rate limit hit. Retrying in {e.retry_after} seconds...")
-        await asyncio.sleep(e.retry_after)
-        return await restrict_user_with_retry(context, chat_id, user_id, permissions, until_date)
     except Exception as e:
-        print(f"❌ Failed to restrict user {user_id}: {e}")
-        return False
+        # Conservar el bloqueo (memoria y base de datos) y reintentar más tarde
+        print(f"❌ Failed to unlock chat {chat_id}, retrying in {raid_unlock_retry_delay}s: {e}")
+        context.job_queue.run_once(
+            unlock_chat_after_raid, when=raid_unlock_retry_delay,
+            data={"chat_id": chat_id}, name=f"raid_unlock:{chat_id}"
+        )
+        return
 
-# Función para silenciar usuarios
-async def mute_user(context, chat_id, user_id, username, duration, reason):
-    now = datetime.now(timezone.utc)  # Usar timezone-aware UTC
+    join_flood_detector.end_lockdown(chat_id)
+    print(f"🔓 Chat {chat_id} unlocked after raid lockdown ({restricted} accounts muted).")
+    try:
+        await db.delete_raid_lockdown(chat_id)
+    except Exception as e:
+        print(f"⚠️ Could not delete the saved lockdown for chat {chat_id}: {e}")
+    await send_message_queued(
+        context, chat_id, "🔓 The raid lockdown has ended. Welcome back!", priority=PRIORITY_MODERATION, wait=False
+    )
 
-    # Verificar si el usuario ya ha sido manejado recientemente
-    if user_id in recently_handled_users and (now - recently_handled_users[user_id]).seconds < 30:
-        print(f"⚠️ User {user_id} was recently handled. Skipping.")
+
+# Al arrancar: reprogramar los desbloqueos pendientes (los vencidos se ejecutan ya)
+async def restore_raid_lockdowns(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Reloads lockdowns persisted before a restart and schedules their unlock.
+
+    Suspects collected before the restart were only in memory and are not muted again.
+    """
+    try:
+        lockdowns = await db.list_raid_lockdowns()
+    except Exception as e:
+        print(f"❌ Could not load pending raid lockdowns: {e}")
         return
 
-    recently_handled_users[user_id] = now  # Registrar acción
+    now = time.time()
+    for lockdown in lockdowns:
+        try:
+            permissions = ChatPermissions.de_json(json.loads(lockdown.permissions), context.bot)
+        except Exception as e:
+            print(f"⚠️ Invalid saved permissions for chat {lockdown.chat_id}, using defaults on unlock: {e}")
+            permissions = RAID_UNLOCK_FALLBACK_PERMISSIONS
+        join_flood_detector.start_lockdown(lockdown.chat_id, permissions or RAID_UNLOCK_FALLBACK_PERMISSIONS)
+        context.job_queue.run_once(
+            unlock_chat_after_raid, when=max(0.0, lockdown.unlock_at - now),
+            data={"chat_id": lockdown.chat_id}, name=f"raid_unlock:{lockdown.chat_id}"
+        )
+    if lockdowns:
+        print(f"🔒 Restored {len(lockdowns)} pending raid lockdowns.")
+
+
+# Patrones precompilados
+# El enlace se busca sin lookbehind: "clickhttps://..." o "_www..." también son enlaces
+link_pattern = re.compile(r"(?:https?://|www\.)\S+")
+# El lookbehind (?<!\w) descarta rápido las posiciones a mitad de palabra
+long_word_pattern = re.compile(r"(?<!\w)\w{15,}(?!\w)")
+LINK_ENTITY_TYPES = ("url", "text_link")
+
+
+class MessageScan(NamedTuple):
+    has_link: bool
+    long_words: tuple
+
+
+def scan_message_text(text: str, entities=()) -> MessageScan:
+    """
+    Scans a message for links and long words.
+
+    When Telegram already parsed the message (`entities`), links come from the
+    url/text_link entities and the text is only scanned for long words; otherwise
+    the text is searched for a link first, so a long word can never swallow a
+    URL glued to it.
+    """
+    if entities:
+        has_link = any(entity.type in LINK_ENTITY_TYPES for entity in entities)
+    else:
+        has_link = link_pattern.search(text) is not None
+    if has_link:
+        return MessageScan(True, ())
+    return MessageScan(False, tuple(long_word_pattern.findall(text)))
+
+
+# Aplicar mute progresivo por palabras largas
+async def mute_for_long_words(update: Update, context: ContextTypes.DEFAULT_TYPE, long_words: tuple):
+    chat_id = update.effective_chat.id
+    user_id = update.effective_user.id
+    username = update.effective_user.username or "Unknown"
+
+    # Inicializar advertencias
+    if "long_word_warnings" not in context.chat_data:
+        context.chat_data["long_word_warnings"] = {}
+
+    warnings = context.chat_data["long_word_warnings"].get(user_id, 0)
+    context.chat_data["long_word_warnings"][user_id] = warnings + 1
+
+    # Determinar duración del mute
+    mute_duration = timedelta(minutes=60) if warnings >= 2 else timedelta(minutes=5)
+    reason = f"Using long words: {', '.join(long_words)}"
+    message = (
+        f"❌ @{username}, you have been muted for {mute_duration.total_seconds() / 60:.0f} minutes.\n"
+        f"Reason: {reason}"
+    )
+
+    # Aplicar mute
     try:
-        success = await restrict_user_with_retry(
+        await restrict_user_with_retry(
             context,
             chat_id,
             user_id,
             ChatPermissions(can_send_messages=False),
-            now + duration
+            datetime.now(timezone.utc) + mute_duration
         )
-        if success:
-            print(f"✅ User @{username} muted for {duration.total_seconds() / 60:.0f} minutes ({reason}).")
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text=f"❌ @{username} has been muted for {duration.total_seconds() / 60:.0f} minutes.\nReason: {reason}."
-            )
+        reply = update.message.reply_text
+        telegram_outbox.submit(
+            lambda: reply(message, parse_mode="HTML"), chat_id, PRIORITY_MODERATION
+        ).add_done_callback(_log_send_failure)
+        print(f"✅ Mute applied to @{username} for {reason}.")
     except Exception as e:
         print(f"❌ Failed to mute user @{username}: {e}")
 
-# Detectar y manejar links y spam
-async def detect_links_and_spam(update: Update, context: ContextTypes.DEFAULT_TYPE):
+
+# Manejar mensajes de texto: un único veredicto y como mucho una acción por mensaje
+async def handle_text_messages(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Moderation pipeline for text messages. Priority: links > flooding > long words.
+    """
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id
     username = update.effective_user.username or "Unknown"
@@ -1587,84 +4181,368 @@ async def detect_links_and_spam(update: Update, context: ContextTypes.DEFAULT_TY
         print(f"⚠️ Update without a valid message detected from user {user_id}. Ignoring.")
         return
 
-    message_text = update.message.text  # Extraer el texto del mensaje
-    now = datetime.now(timezone.utc)
+    scan = scan_message_text(update.message.text, update.message.entities)
 
-    # Patrón para detectar links
-    link_pattern = r"(http[s]?://|www\.)[^\s]+"
-
-    # Detectar y manejar links
-    if re.search(link_pattern, message_text):
+    # Enlaces: borrar el mensaje y silenciar
+    if scan.has_link:
         try:
             await update.message.delete()
             print(f"🔗 Link detected and deleted from user {user_id}.")
             await mute_user(context, chat_id, user_id, username, link_mute_duration, "Posting links")
-            return
         except Exception as e:
             print(f"❌ Error handling link for user {user_id}: {e}")
+        return
 
-    # Manejo de detección de spam
-    user_message_count[user_id].append(now)
-    user_message_count[user_id] = [
-        timestamp for timestamp in user_message_count[user_id]
-        if now - timestamp <= time_window
-    ]
-
-    if len(user_message_count[user_id]) > message_limit:
+    # Spam por exceso de mensajes
+    if flood_tracker.record_message(chat_id, user_id):
         await mute_user(context, chat_id, user_id, username, mute_duration, "Spamming")
+        return
 
-# Detectar palabras largas y aplicar mute progresivo
-async def detect_long_words_and_mute(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat_id = update.effective_chat.id
-    user_id = update.effective_user.id
-    username = update.effective_user.username or "Unknown"
-    message_text = update.message.text or ""
+    # Palabras largas (los administradores están exentos)
+    if scan.long_words and not await is_chat_admin(context, chat_id, user_id):
+        await mute_for_long_words(update, context, scan.long_words)
 
-    # Excluir administradores y creadores
-    user = await context.bot.get_chat_member(chat_id, user_id)
-    if user.status in ["administrator", "creator"]:
-        return
 
-    # Detectar palabras largas
-    long_word_pattern = r"\b\w{15,}\b"
-    long_words = re.findall(long_word_pattern, message_text)
 
-    if long_words:
-        # Inicializar advertencias
-        if "long_word_warnings" not in context.chat_data:
-            context.chat_data["long_word_warnings"] = {}
 
-        warnings = context.chat_data["long_word_warnings"].get(user_id, 0)
-        context.chat_data["long_word_warnings"][user_id] = warnings + 1
 
-        # Determinar duración del mute
-        mute_duration = timedelta(minutes=60) if warnings >= 2 else timedelta(minutes=5)
-        reason = f"Using long words: {', '.join(long_words)}"
-        message = (
-            f"❌ @{username}, you have been muted for {mute_duration.total_seconds() / 60:.0f} minutes.\n"
-            f"Reason: {reason}"
-        )
 
-        # Aplicar mute
+
+
+#MARKET DATA BLOCK    # Bloque de la instantánea de datos de mercado (CoinMarketCap)
+
+MARKET_DATA_CREDITS_PER_RUN = 3  # listings + category + quotes/latest de las patrocinadas
+SPONSORED_PRICE_CREDITS_PER_RUN = 1  # Un quotes/latest por cada 100 monedas con cmc_id
+CMC_SCHEDULED_BUDGET_SHARE = 0.9  # Parte del presupuesto diario para las tareas periódicas; el resto, para comandos
+MARKET_DATA_MIN_INTERVAL = 300  # Los listados de CMC se actualizan cada pocos minutos: refrescar más rápido no aporta
+SPONSORED_PRICE_REFRESH_INTERVAL = int(os.getenv("SPONSORED_PRICE_REFRESH_INTERVAL", "900"))  # Segundos entre refrescos
+
+
+def scheduled_cmc_credits_per_day(market_interval: float, sponsored_interval: float) -> float:
+    """
+    Estimates the credits the periodic CMC jobs spend per day (worst case: every part refreshed each run).
+    """
+    return (
+        86400 / market_interval * MARKET_DATA_CREDITS_PER_RUN
+        + 86400 / sponsored_interval * SPONSORED_PRICE_CREDITS_PER_RUN
+        + 86400 / CMC_MEME_CATEGORY_TTL  # /categories para resolver la categoría de memes
+    )
+
+
+def default_market_data_interval() -> int:
+    """
+    Picks the fastest market-data cadence whose credits, with the sponsored price job, fit the daily budget share.
+    """
+    if CMC_DAILY_CREDIT_BUDGET <= 0:
+        return MARKET_DATA_MIN_INTERVAL
+    spare = CMC_DAILY_CREDIT_BUDGET * CMC_SCHEDULED_BUDGET_SHARE - (
+        scheduled_cmc_credits_per_day(math.inf, SPONSORED_PRICE_REFRESH_INTERVAL)
+    )
+    if spare <= 0:
+        return 86400
+    return max(MARKET_DATA_MIN_INTERVAL, math.ceil(86400 * MARKET_DATA_CREDITS_PER_RUN / spare))
+
+
+# Segundos entre refrescos; sin variable de entorno se deriva del presupuesto diario
+MARKET_DATA_REFRESH_INTERVAL = int(os.getenv("MARKET_DATA_REFRESH_INTERVAL") or default_market_data_interval())
+
+
+def check_cmc_schedule_budget():
+    """
+    Warns at startup when the configured CMC job cadences would spend more than the daily budget.
+    """
+    planned = scheduled_cmc_credits_per_day(MARKET_DATA_REFRESH_INTERVAL, SPONSORED_PRICE_REFRESH_INTERVAL)
+    print(f"📅 Market data refresh every {MARKET_DATA_REFRESH_INTERVAL}s, sponsored prices every "
+          f"{SPONSORED_PRICE_REFRESH_INTERVAL}s: up to {planned:.0f} CMC credits/day (budget {CMC_DAILY_CREDIT_BUDGET or '∞'}).")
+    if 0 < CMC_DAILY_CREDIT_BUDGET < planned:
+        hours = 24 * CMC_DAILY_CREDIT_BUDGET / planned
+        print(f"⚠️ The CMC refresh jobs exceed CMC_DAILY_CREDIT_BUDGET: the budget runs out after ~{hours:.0f}h "
+              f"and stale data is served for the rest of each UTC day. Raise the intervals or the budget.")
+
+
+MARKET_LISTINGS_LIMIT = 5  # Monedas del listado general que se guardan (top 5 de /top_cryptos)
+MARKET_MEME_COINS_LIMIT = 10  # Monedas de la categoría de memes que se guardan
+
+
+class CoinQuote(NamedTuple):
+    name: str
+    symbol: str
+    price: Union[float, None]
+    market_cap: Union[float, None]
+
+
+class MarketSnapshot(NamedTuple):
+    top_cryptos: tuple  # CoinQuote del listado general, por ranking
+    meme_coins: tuple  # CoinQuote de la categoría de memes, con precio
+    meme_top_10: tuple  # CoinQuote del resumen de la categoría (sin precio)
+    sponsored_quotes: MappingProxyType  # Símbolo en mayúsculas -> CoinQuote de las monedas patrocinadas
+    updated_at: Union[float, None]  # time.time() del último refresco con éxito; None = aún sin datos
+
+
+# Instantánea vigente; solo el poller la sustituye, nunca se modifica en sitio
+market_snapshot = MarketSnapshot((), (), (), MappingProxyType({}), None)
+market_data_lock = asyncio.Lock()  # Evita que dos refrescos se solapen
+
+
+def coin_quote(coin: dict) -> CoinQuote:
+    """
+    Builds a CoinQuote from a CoinMarketCap coin object; missing USD fields become None.
+    """
+    usd = (coin.get("quote") or {}).get("USD") or {}
+    return CoinQuote(coin.get("name") or "Unknown", coin.get("symbol") or "Unknown", usd.get("price"), usd.get("market_cap"))
+
+
+def quotes_by_symbol(data) -> dict:
+    """
+    Normalizes the `data` of a `/quotes/latest` response (keyed by symbol) into CoinQuote by uppercase symbol.
+    """
+    quotes = {}
+    if not isinstance(data, dict):
+        return quotes
+    for symbol, coin in data.items():
+        # Con símbolos repetidos CMC puede devolver una lista; la primera entrada es la de mayor ranking
+        if isinstance(coin, list):
+            coin = coin[0] if coin else None
+        if isinstance(coin, dict):
+            quotes[symbol.upper()] = coin_quote(coin)
+    return quotes
+
+
+CMC_QUOTES_BATCH_LIMIT = 100  # Símbolos por llamada a /quotes/latest (un crédito por cada 100)
+CMC_QUOTES_BATCH_WINDOW = 0.25  # Segundos que se esperan para juntar peticiones de varios usuarios
+CMC_QUOTE_TTL = 60  # Vida en caché de la cotización de cada símbolo (también de los desconocidos)
+CMC_SYMBOL_PATTERN = re.compile(r"^[A-Z0-9]{1,15}$")
+
+
+class CoinMarketCapError(Exception):
+    """
+    Raised when a CoinMarketCap call needed to answer a request fails.
+    """
+
+
+class CmcQuoteService:
+    """
+    Batched, cached quote lookup by symbol on top of `/quotes/latest`.
+
+    Symbols requested within CMC_QUOTES_BATCH_WINDOW are merged into one call
+    (split at CMC_QUOTES_BATCH_LIMIT), each symbol is cached for CMC_QUOTE_TTL
+    and every caller is answered from the shared result. When a batch fails,
+    symbols with an expired quote get that quote instead of an error.
+    """
+
+    def __init__(self, client: CoinMarketCapClient, window: float = CMC_QUOTES_BATCH_WINDOW,
+                 batch_limit: int = CMC_QUOTES_BATCH_LIMIT, ttl: float = CMC_QUOTE_TTL):
+        self.client = client
+        self.window = window
+        self.batch_limit = batch_limit
+        self.ttl = ttl
+        self.batches = 0  # Llamadas a /quotes/latest realizadas
+        self._cache: dict = {}  # símbolo -> (expira_en, CoinQuote o None si CMC no lo conoce)
+        self._pending: dict = {}  # símbolo -> Future de la próxima tanda
+        self._flush_task = None
+
+    async def get_quotes(self, symbols) -> dict:
+        """
+        Returns CoinQuote by uppercase symbol; unknown, invalid or unavailable symbols are omitted.
+
+        Raises:
+            CoinMarketCapError: If a batch failed and none of the symbols could be answered.
+        """
+        now = time.monotonic()
+        quotes, waiting = {}, {}
+        for symbol in {symbol.upper() for symbol in symbols}:
+            if not CMC_SYMBOL_PATTERN.match(symbol):
+                continue
+            entry = self._cache.get(symbol)
+            if entry is not None and entry[0] > now:
+                if entry[1] is not None:
+                    quotes[symbol] = entry[1]
+                continue
+            future = self._pending.get(symbol)
+            if future is None:
+                future = self._pending[symbol] = asyncio.get_running_loop().create_future()
+            waiting[symbol] = future
+
+        if waiting:
+            if self._flush_task is None:
+                self._flush_task = asyncio.ensure_future(self._flush_later())
+            # shield: cancelar a un llamador no debe cancelar los futuros compartidos con otros usuarios
+            results = await asyncio.shield(asyncio.gather(*waiting.values(), return_exceptions=True))
+            errors = [result for result in results if isinstance(result, BaseException)]
+            quotes.update((symbol, quote) for symbol, quote in zip(waiting, results)
+                          if quote is not None and not isinstance(quote, BaseException))
+            # Respuesta parcial si hay algo que mostrar; error solo si no queda ninguna cotización
+            if errors and not quotes:
+                raise errors[0]
+        return quotes
+
+    async def _flush_later(self):
+        pending = None
         try:
-            await restrict_user_with_retry(
-                context,
-                chat_id,
-                user_id,
-                ChatPermissions(can_send_messages=False),
-                datetime.now(timezone.utc) + mute_duration
+            await asyncio.sleep(self.window)
+            pending, self._pending, self._flush_task = self._pending, {}, None
+            symbols = sorted(pending)
+            # Una tanda mezcla símbolos de varios comandos: no se atribuye al primer llamador
+            with cmc_usage("quotes_batch"):
+                results = await asyncio.gather(*(
+                    self._fetch_batch(symbols[i:i + self.batch_limit], pending)
+                    for i in range(0, len(symbols), self.batch_limit)
+                ), return_exceptions=True)
+            for result in results:
+                if isinstance(result, BaseException):
+                    print(f"❌ Unexpected error in CMC quote batch: {result!r}")
+        finally:
+            # Pase lo que pase (error, datos inesperados, cancelación), ningún llamador queda esperando
+            if pending is None:
+                pending, self._pending, self._flush_task = self._pending, {}, None
+            error = CoinMarketCapError("Quote lookup was aborted")
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(error)
+
+    async def _fetch_batch(self, symbols: list, pending: dict):
+        self.batches += 1
+        try:
+            response = await self.client.request(
+                "cryptocurrency/quotes/latest", {"symbol": ",".join(symbols), "convert": "USD", "skip_invalid": "true"}
             )
-            await update.message.reply_text(message, parse_mode="HTML")
-            print(f"✅ Mute applied to @{username} for {reason}.")
+            quotes = None if response is None else quotes_by_symbol(response.get("data"))
         except Exception as e:
-            print(f"❌ Failed to mute user @{username}: {e}")
+            print(f"❌ Error in CMC quote batch: {e!r}")
+            quotes = None
+
+        if quotes is None:
+            # Degradar a cotizaciones caducadas; solo falla quien no tenga ninguna
+            error = CoinMarketCapError(f"Quote lookup failed for {len(symbols)} symbols")
+            for symbol in symbols:
+                if symbol in self._cache:
+                    self.client.stale_served += 1
+                    pending[symbol].set_result(self._cache[symbol][1])
+                else:
+                    pending[symbol].set_exception(error)
+            return
 
-# Manejar mensajes de texto
-async def handle_text_messages(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await detect_links_and_spam(update, context)
-    await detect_long_words_and_mute(update, context)
+        expires_at = time.monotonic() + self.ttl
+        for symbol in symbols:
+            quote = quotes.get(symbol)
+            self._cache[symbol] = (expires_at, quote)
+            pending[symbol].set_result(quote)
+
+    def gauges(self) -> dict:
+        now = time.monotonic()
+        return {
+            "quote_batches": self.batches,
+            "quote_cache_entries": sum(1 for expires_at, _ in self._cache.values() if expires_at > now),
+            "quote_pending_symbols": len(self._pending),
+        }
+
+
+cmc_quote_service = CmcQuoteService(cmc_client)
+
+
+async def fetch_meme_coins() -> Union[tuple, None]:
+    category = await cmc_get_meme_category()
+    if not category or not category.get("id"):
+        return None
+    response = await cmc_client.request(
+        "cryptocurrency/category", {"id": category["id"], "limit": str(MARKET_MEME_COINS_LIMIT), "convert": "USD"}
+    )
+    if response is None:
+        return None
+    top_10 = tuple(coin_quote(coin) for coin in category.get("top_10_coins", []))
+    coins = tuple(coin_quote(coin) for coin in (response.get("data") or {}).get("coins", []))
+    return coins, top_10
+
+
+async def fetch_sponsored_quotes() -> Union[dict, None]:
+    # Las monedas con cmc_id se refrescan por ID en refresh_sponsored_prices
+    symbols = [coin.symbol for coin in await get_all_sponsored_coins() if coin.symbol and coin.cmc_id is None]
+    return await cmc_quote_service.get_quotes(symbols) if symbols else {}
+
+
+# Tarea periódica: refrescar la instantánea de mercado
+async def refresh_market_data(context: ContextTypes.DEFAULT_TYPE = None):
+    """
+    Refreshes top listings, meme category coins and sponsored coin quotes into a new immutable snapshot.
+
+    The three fetches run concurrently; a part that fails keeps the values of the previous snapshot.
+    """
+    global market_snapshot
+
+    if market_data_lock.locked():
+        return
+
+    async with market_data_lock:
+        with cmc_usage("market_data_refresh"):
+            listings, memes, sponsored = await asyncio.gather(
+                cmc_client.request(
+                    "cryptocurrency/listings/latest", {"start": "1", "limit": str(MARKET_LISTINGS_LIMIT), "convert": "USD"}
+                ),
+                fetch_meme_coins(),
+                fetch_sponsored_quotes(),
+                return_exceptions=True,
+            )
+
+        previous = market_snapshot
+        top_cryptos = previous.top_cryptos
+        if isinstance(listings, dict):
+            top_cryptos = tuple(coin_quote(coin) for coin in listings.get("data", []))
+
+        meme_coins, meme_top_10 = memes if isinstance(memes, tuple) else (previous.meme_coins, previous.meme_top_10)
+        sponsored_quotes = MappingProxyType(sponsored) if isinstance(sponsored, dict) else previous.sponsored_quotes
+
+        failed = [name for name, result in (("listings", listings), ("memes", memes), ("sponsored", sponsored))
+                  if result is None or isinstance(result, BaseException)]
+        updated_at = previous.updated_at if len(failed) == 3 else time.time()
+
+        market_snapshot = MarketSnapshot(top_cryptos, meme_coins, meme_top_10, sponsored_quotes, updated_at)
+
+    if failed:
+        print(f"⚠️ Market data refresh incomplete ({', '.join(failed)}). Serving previous values for those parts.")
+
+
+# Tarea periódica: refrescar precio y capitalización de las monedas patrocinadas con cmc_id
+async def refresh_sponsored_prices(context: ContextTypes.DEFAULT_TYPE = None):
+    """
+    Refreshes the price and market cap of every mapped sponsored coin with one batched
+    `/quotes/latest` call (per CMC_QUOTES_BATCH_LIMIT ids) and one executemany update.
+    """
+    cmc_ids = sorted(await sponsored_coin_cache.mapped_cmc_ids())
+    if not cmc_ids:
+        return
+
+    prices = {}
+    with cmc_usage("sponsored_price_refresh"):
+        for i in range(0, len(cmc_ids), CMC_QUOTES_BATCH_LIMIT):
+            batch = cmc_ids[i:i + CMC_QUOTES_BATCH_LIMIT]
+            response = await cmc_client.request(
+                "cryptocurrency/quotes/latest",
+                {"id": ",".join(map(str, batch)), "convert": "USD", "skip_invalid": "true"},
+            )
+            if response is None:
+                print(f"⚠️ Sponsored price refresh failed for {len(batch)} coins. Keeping stored prices.")
+                continue
+            for key, coin in (response.get("data") or {}).items():
+                quote = coin_quote(coin)
+                if isinstance(quote.price, (int, float)) and isinstance(quote.market_cap, (int, float)):
+                    prices[int(key)] = (quote.price, quote.market_cap)
+
+    try:
+        updated = await sponsored_coin_cache.apply_prices(prices)
+    except Exception as e:
+        print(f"❌ Error storing sponsored coin prices: {e}")
+        return
+
+    missing = len(cmc_ids) - len(prices)
+    print(f"💹 Refreshed {updated} sponsored coin rows from CoinMarketCap" + (f" ({missing} ids without a quote)." if missing else "."))
 
 
+def format_usd(value, decimals: int = 2) -> str:
+    return f"${value:,.{decimals}f}" if isinstance(value, (int, float)) else "N/A"
+
+
+TOP_CRYPTOS_MAX_SYMBOLS = 20  # Símbolos admitidos por cada /top_cryptos <símbolos>
+MARKET_DATA_LOADING_MESSAGE = "⏳ Market data is still loading. Please try again in a moment."
 
 
 
@@ -1673,86 +4551,66 @@ async def handle_text_messages(update: Update, context: ContextTypes.DEFAULT_TYP
 # Function to get cryptocurrencies with filters for top categories or specific symbols
 async def get_top_cryptos(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
-    Fetches and displays cryptocurrencies. Supports categories like 'memes' or specific symbols.
+    Displays cryptocurrencies. Supports categories like 'memes' or specific symbols.
+    The top 5 and the meme category come from the market snapshot; symbols go through the batched quote service.
     """
-    url_listings = "https://pro-api.coinmarketcap.com/v1/cryptocurrency/listings/latest"
-    url_categories = "https://pro-api.coinmarketcap.com/v1/cryptocurrency/categories"
-    headers = {
-        "Accepts": "application/json",
-        "X-CMC_PRO_API_KEY": COINMARKETCAP_API_KEY,
-    }
+    snapshot = market_snapshot
+    if snapshot.updated_at is None and not (context.args and context.args[0].lower() != "memes"):
+        await update.message.reply_text(MARKET_DATA_LOADING_MESSAGE)
+        return
 
     try:
         # Verificar si se pasa "memes" como categoría
         if context.args and context.args[0].lower() == "memes":
-            # Llamar a la API de categorías
-            response = requests.get(url_categories, headers=headers)
-            response.raise_for_status()
-            categories = response.json().get("data", [])
-
-            # Buscar la categoría 'memes'
-            meme_category = next((cat for cat in categories if "meme" in cat["name"].lower()), None)
-            if not meme_category:
-                await update.message.reply_text("❌ Meme category not found.")
-                return
-
-            # Obtener las monedas de la categoría 'memes'
-            meme_coins = meme_category.get("top_10_coins", [])
-            if not meme_coins:
+            if not snapshot.meme_top_10:
                 await update.message.reply_text("❌ No meme coins found.")
                 return
 
             # Construir el mensaje
             message = "<b>📊 Top Meme Coins:</b>\n\n"
-            for coin in meme_coins:
-                message += f"• <b>{coin['name']} ({coin['symbol']})</b>\n"
+            for coin in snapshot.meme_top_10:
+                message += f"• <b>{coin.name} ({coin.symbol})</b>\n"
 
             await update.message.reply_text(message, parse_mode="HTML")
             return
 
-        # Si se pasan símbolos específicos (BTC ETH DOGE)
+        # Si se pasan símbolos específicos (BTC ETH DOGE), cotizarlos en lote con /quotes/latest
         elif context.args:
-            symbols = ",".join(context.args).upper()
-            params = {"symbol": symbols, "convert": "USD"}
-            response = requests.get(url_listings, headers=headers, params=params)
-            response.raise_for_status()
-            data = response.json().get("data", [])
+            symbols = list(dict.fromkeys(symbol.upper() for symbol in context.args))[:TOP_CRYPTOS_MAX_SYMBOLS]
+            try:
+                quotes = await cmc_quote_service.get_quotes(symbols)
+            except CoinMarketCapError as e:
+                print(f"❌ Error fetching quotes: {e}")
+                await update.message.reply_text("❌ Failed to fetch cryptocurrency data. Please try again later.")
+                return
 
-            if not data:
+            if not quotes:
                 await update.message.reply_text("❌ No data found for the specified symbols.")
                 return
 
             message = "<b>📊 Selected Cryptocurrencies:</b>\n\n"
-            for crypto in data:
-                message += (
-                    f"• <b>{crypto['name']} ({crypto['symbol']})</b>: "
-                    f"${crypto['quote']['USD']['price']:.2f}\n"
-                )
+            for symbol in symbols:
+                if symbol in quotes:
+                    crypto = quotes[symbol]
+                    message += f"• <b>{crypto.name} ({crypto.symbol})</b>: {format_usd(crypto.price)}\n"
+
+            missing = [symbol for symbol in symbols if symbol not in quotes]
+            if missing:
+                message += f"\n⚠️ Not found: {html.escape(', '.join(missing))}"
 
             await update.message.reply_text(message, parse_mode="HTML")
             return
 
         # Si no hay argumentos, mostrar el top 5 general
-        params = {"start": "1", "limit": "5", "convert": "USD"}
-        response = requests.get(url_listings, headers=headers, params=params)
-        response.raise_for_status()
-        data = response.json().get("data", [])
-
-        if not data:
+        if not snapshot.top_cryptos:
             raise ValueError("No cryptocurrency data found.")
 
         message = "<b>📊 Top 5 Cryptocurrencies:</b>\n\n"
-        for crypto in data:
-            message += (
-                f"• <b>{crypto['name']} ({crypto['symbol']})</b>: "
-                f"${crypto['quote']['USD']['price']:.2f}\n"
-            )
+        for crypto in snapshot.top_cryptos[:5]:
+            message += f"• <b>{crypto.name} ({crypto.symbol})</b>: {format_usd(crypto.price)}\n"
 
         await update.message.reply_text(message, parse_mode="HTML")
 
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Error fetching cryptocurrency data: {e}")
-        await update.message.reply_text("❌ Failed to fetch cryptocurrency data. Please try again later.")
     except Exception as e:
         print(f"❌ Unexpected error: {e}")
         await update.message.reply_text("❌ An error occurred while processing the cryptocurrency data.")
@@ -1761,88 +4619,34 @@ async def get_top_cryptos(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # Function to get top meme coins with updated button layout
 async def get_top_meme_coins(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
-    Fetches and displays top meme coins using the CoinMarketCap API.
-    If specific symbols are provided as arguments, includes them and displays them first with proper spacing.
+    Displays sponsored coins and the top meme coins from the market snapshot.
+    Sponsored coins show live quotes when CoinMarketCap knows their symbol, otherwise the stored values.
     Monetization options with updated button layout.
     """
-    url_categories = "https://pro-api.coinmarketcap.com/v1/cryptocurrency/categories"
-    url_category = "https://pro-api.coinmarketcap.com/v1/cryptocurrency/category"
-    url_quotes = "https://pro-api.coinmarketcap.com/v1/cryptocurrency/quotes/latest"
-    headers = {
-        "Accepts": "application/json",
-        "X-CMC_PRO_API_KEY": COINMARKETCAP_API_KEY,
-    }
+    snapshot = market_snapshot
+    if snapshot.updated_at is None:
+        await update.message.reply_text(MARKET_DATA_LOADING_MESSAGE)
+        return
+
     try:
         # Create the message
         message = "<b>📊 Meme Coins Overview:</b>\n\n"
 
-        # Step 1: Fetch sponsored coins from the database
-        sponsored_coins = get_all_sponsored_coins()
-        if sponsored_coins:
-            message += "<b>📋 <u>Sponsored Meme Coins</u>:</b>\n\n"
-            for coin in sponsored_coins:
-                name = coin.get("name", "Unknown")
-                symbol = coin.get("symbol", "Unknown")
-                price = coin.get("price", "N/A")
-                market_cap = coin.get("market_cap", "N/A")
-                url = coin.get("url", "#")
-
-                # Format price and market cap safely
-                price_str = f"${price:,.2f}" if isinstance(price, (int, float)) else "N/A"
-                market_cap_str = f"${market_cap:,.0f}" if isinstance(market_cap, (int, float)) else "N/A"
-
-                message += (
-                    f"⭐ <b>{name} ({symbol})</b>\n"
-                    f"   💵 <i>Price:</i> <b>{price_str}</b>\n"
-                    f"   💰 <i>Market Cap:</i> <b>{market_cap_str}</b>\n"
-                    f"   🔗 <a href='{url}'>Visit Website</a>\n\n"
-                )
-
-        # Separator between sponsored and top coins
-        if sponsored_coins:
-            message += "<b>──────────────────────────────</b>\n\n"
-
-        # Step 2: Fetch top meme coins dynamically from CoinMarketCap
-        response = requests.get(url_categories, headers=headers)
-        response.raise_for_status()
-        categories = response.json().get("data", [])
-
-        # Find "meme coins" category
-        meme_category = next((cat for cat in categories if "meme" in cat["name"].lower()), None)
-        if not meme_category:
-            await update.message.reply_text("❌ Meme coins category not found in CoinMarketCap API.")
-            return
-
-        # Fetch cryptocurrencies under the "meme coins" category
-        category_identifier = meme_category.get("id")
-        if not category_identifier:
-            await update.message.reply_text("❌ Unable to identify the Meme Coins category.")
-            return
-
-        response = requests.get(url_category, headers=headers, params={"id": category_identifier})
-        response.raise_for_status()
-        meme_coins = response.json().get("data", {}).get("coins", [])
+        # Step 1: Sponsored coins (pre-rendered block, rebuilt only when coins or quotes change)
+        message += await sponsored_coin_cache.render_html(snapshot.sponsored_quotes)
 
-        if not meme_coins:
+        # Step 2: Top meme coins from the snapshot
+        if not snapshot.meme_coins:
             await update.message.reply_text("❌ No meme coins found in the category.")
             return
 
         # Step 3: Add the top 5 meme coins
         message += "🎯 <b><u>Top 5 Meme Coins</u>:</b>\n\n"
-        for coin in meme_coins[:5]:  # Limit to top 5 coins
-            name = coin.get("name", "Unknown")
-            symbol = coin.get("symbol", "Unknown")
-            price = coin.get("quote", {}).get("USD", {}).get("price", "N/A")
-            market_cap = coin.get("quote", {}).get("USD", {}).get("market_cap", "N/A")
-
-            # Format price and market cap safely
-            price_str = f"${price:,.6f}" if isinstance(price, (int, float)) else "N/A"
-            market_cap_str = f"${market_cap:,.0f}" if isinstance(market_cap, (int, float)) else "N/A"
-
+        for coin in snapshot.meme_coins[:5]:  # Limit to top 5 coins
             message += (
-                f"• <b>{name} ({symbol})</b>\n"
-                f"   💵 <i>Price:</i> {price_str}\n"
-                f"   💰 <i>Market Cap:</i> {market_cap_str}\n\n"
+                f"• <b>{coin.name} ({coin.symbol})</b>\n"
+                f"   💵 <i>Price:</i> {format_usd(coin.price, 6)}\n"
+                f"   💰 <i>Market Cap:</i> {format_usd(coin.market_cap, 0)}\n\n"
             )
 
         # Inline keyboard with updated layout
@@ -1857,11 +4661,6 @@ async def get_top_meme_coins(update: Update, context: ContextTypes.DEFAULT_TYPE)
         # Send the message with buttons
         await update.message.reply_text(message.strip(), parse_mode="HTML", reply_markup=keyboard)
 
-    except requests.exceptions.RequestException as e:
-        logger.error(f"❌ Error fetching meme coins: {e}")
-        await update.message.reply_text(
-            "❌ Failed to fetch meme coins. Please try again later."
-        )
     except Exception as e:
         logger.error(f"❌ Unexpected error: {e}")
         await update.message.reply_text(
@@ -1883,7 +4682,9 @@ async def post_random_phrase(context: ContextTypes.DEFAULT_TYPE):
     try:
         chat_id = context.job.data["chat_id"]
         phrase = random.choice(crypto_phrases)
-        await context.bot.send_message(chat_id=chat_id, text=phrase)
+        await send_message_queued(
+            context, chat_id, phrase, priority=PRIORITY_SCHEDULED, coalesce_key=("phrase", chat_id)
+        )
     except Exception as e:
         print(f"Error sending random crypto phrase: {e}")
 
@@ -1909,9 +4710,8 @@ async def start_auto_posts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     Starts periodic posting of random crypto phrases (admin-only command).
     """
     chat_id = update.effective_chat.id
-    user = await context.bot.get_chat_member(chat_id, update.effective_user.id)
 
-    if user.status not in ["administrator", "creator"]:
+    if not await is_chat_admin(context, chat_id, update.effective_user.id):
         await update.message.reply_text("❌ This command is restricted to administrators.")
         return
 
@@ -1933,9 +4733,8 @@ async def stop_auto_posts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     Stops periodic posting of random crypto phrases (admin-only command).
     """
     chat_id = update.effective_chat.id
-    user = await context.bot.get_chat_member(chat_id, update.effective_user.id)
 
-    if user.status not in ["administrator", "creator"]:
+    if not await is_chat_admin(context, chat_id, update.effective_user.id):
         await update.message.reply_text("❌ This command is restricted to administrators.")
         return
 
@@ -1951,6 +4750,51 @@ async def stop_auto_posts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("🔕 Auto-posting has been stopped!")
 
 
+#METRICS BLOCK    # Bloque de métricas internas del bot
+
+def collect_metrics() -> dict:
+    """
+    Gathers the in-memory gauges exposed by the bot's components.
+    """
+    metrics = {"admin_cache_chats": chat_admin_cache.tracked_chats()}
+    metrics.update(flood_tracker.gauges())
+    metrics.update(join_flood_detector.gauges())
+    metrics.update(telegram_outbox.gauges())
+    metrics.update(cmc_client.gauges())
+    metrics.update(cmc_quote_service.gauges())
+    metrics.update(sponsored_coin_cache.gauges())
+    return metrics
+
+
+# Comando para consultar las métricas (solo administradores)
+async def metrics_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Shows the bot's internal gauges (admin-only command).
+    """
+    chat_id = update.effective_chat.id
+
+    if not await is_chat_admin(context, chat_id, update.effective_user.id):
+        await update.message.reply_text("❌ This command is restricted to administrators.")
+        return
+
+    lines = [f"• {name}: {value}" for name, value in collect_metrics().items()]
+    await update.message.reply_text("📊 Bot metrics:\n" + "\n".join(lines))
+
+
+# Comando para consultar el consumo de créditos de CoinMarketCap (solo administradores)
+async def cmc_usage_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Shows today's CoinMarketCap credit usage per endpoint and per command (admin-only command).
+    """
+    chat_id = update.effective_chat.id
+
+    if not await is_chat_admin(context, chat_id, update.effective_user.id):
+        await update.message.reply_text("❌ This command is restricted to administrators.")
+        return
+
+    await update.message.reply_text(cmc_client.meter.report())
+
+
 # Bot setup
 import logging
 
@@ -1964,7 +4808,7 @@ logger = logging.getLogger(__name__)
 if __name__ == "__main__":
     try:
         # Initialize the bot application
-        app = ApplicationBuilder().token(BOT_TOKEN).build()
+        app = ApplicationBuilder().token(BOT_TOKEN).post_shutdown(close_resources).build()
 
         # Modularización del registro de comandos
         def register_commands(app):
@@ -1977,18 +4821,24 @@ if __name__ == "__main__":
                     CommandHandler("add_sponsored_coin", add_sponsored_coin_handler),  # Nuevo comando
                     CommandHandler("edit_sponsored_coin", edit_sponsored_coin_handler),  # Nuevo comando
                     CommandHandler("remove_sponsored_coin", remove_sponsored_coin_handler),  # Nuevo comando
+                    CommandHandler("map_sponsored_coin", map_sponsored_coin_handler),
                     CommandHandler("start_auto_posts", start_auto_posts),
                     CommandHandler("stop_auto_posts", stop_auto_posts),
                     CommandHandler("new_raid", new_raid),
                     CommandHandler("start_raid_posts", start_raid_posts),
                     CommandHandler("stop_raid_posts", stop_raid_posts),
+                    CommandHandler("start_raid_board", start_raid_board, block=False),  # Espera el envío del tablero
+                    CommandHandler("stop_raid_board", stop_raid_board),
                     CommandHandler("delete_all_raids", delete_all_raids),
                     CommandHandler("raid_status", raid_status),
                     CommandHandler("list_raids_detailed", list_raids_detailed),
                     CommandHandler("reset_database", reset_database_command),
                     CommandHandler("show_proofs", show_proofs),
+                    CommandHandler("check_raid_counters", check_raid_counters_command),
                     CommandHandler("start_proof_verification", start_proof_verification),
                     CommandHandler("stop_proof_verification", stop_proof_verification),
+                    CommandHandler("metrics", metrics_command),
+                    CommandHandler("cmc_usage", cmc_usage_command),
                 ]
                 for handler in command_handlers:
                     app.add_handler(handler)
@@ -2001,6 +4851,7 @@ if __name__ == "__main__":
             try:
                 # CallbackQueryHandler para botones generales y específicos
                 app.add_handler(CallbackQueryHandler(handle_join_raid, pattern="^join_raid:"))
+                app.add_handler(CallbackQueryHandler(handle_page_navigation, pattern=PAGE_CALLBACK_PATTERN))
                 app.add_handler(CallbackQueryHandler(menu_handler))  # Manejo general
                 app.add_handler(CallbackQueryHandler(confirm_delete_raids, pattern="^confirm_delete_raids$"))
                 app.add_handler(CallbackQueryHandler(cancel_delete_raids, pattern="^cancel_delete_raids$"))
@@ -2011,6 +4862,7 @@ if __name__ == "__main__":
             try:
                 # Manejadores de mensajes
                 app.add_handler(MessageHandler(filters.StatusUpdate.NEW_CHAT_MEMBERS, welcome_new_member))
+                app.add_handler(ChatMemberHandler(track_chat_admins, ChatMemberHandler.ANY_CHAT_MEMBER))
                 app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_messages))
                 logger.info("✅ Message handlers registered successfully.")
             except Exception as e:
@@ -2039,9 +4891,28 @@ if __name__ == "__main__":
         register_commands(app)
         register_handlers(app)
 
+        # Instantánea de mercado: los comandos de cripto solo leen de ella
+        check_cmc_schedule_budget()
+        app.job_queue.run_repeating(
+            refresh_market_data, interval=MARKET_DATA_REFRESH_INTERVAL, first=1, name="market_data_refresh"
+        )
+
+        # Precios de las monedas patrocinadas con cmc_id: una llamada en lote y un executemany por pasada
+        app.job_queue.run_repeating(
+            refresh_sponsored_prices, interval=SPONSORED_PRICE_REFRESH_INTERVAL, first=5, name="sponsored_price_refresh"
+        )
+
+        # Reabrir los chats que quedaron bloqueados por un raid antes de un reinicio
+        app.job_queue.run_once(restore_raid_lockdowns, when=0, name="raid_lockdown_restore")
+
+        # Barrido periódico de la memoria del detector de spam
+        app.job_queue.run_repeating(
+            evict_idle_flood_entries, interval=FLOOD_EVICTION_INTERVAL, first=FLOOD_EVICTION_INTERVAL, name="flood_eviction"
+        )
+
         # Debugging: Print a success message when the bot starts
         logger.info("✅ The bot is running...")
-        app.run_polling()
+        app.run_polling(allowed_updates=Update.ALL_TYPES)  # chat_member solo llega si se pide explícitamente
 
     except Exception as e:
         # Log and display any errors during setup
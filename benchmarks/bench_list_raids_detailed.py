@@ -0,0 +1,183 @@
+"""
+Benchmark for the detailed raid listing.
+
+Builds a throwaway database with 1k raids x 500 participants (plus proofs for
+half of them) and renders it with the same renderer two ways: the old N+1
+pattern (two queries per raid, each a hop to a reader thread, concatenated with
++=) and the grouped one (one query per table for a whole batch of raids,
+grouped in Python and joined once).
+
+    python benchmarks/bench_list_raids_detailed.py [raids] [participants_per_raid]
+"""
+import asyncio
+import importlib.util
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BOT_FILE = Path(__file__).resolve().parent.parent / "GORILLAGUARD_V1.0_bot.py"
+FULL_DUMP_BATCH = 100  # Raids por consulta agrupada al volcar la tabla completa
+
+
+def load_bot(db_file: str):
+    os.environ["DB_PATH"] = db_file
+    spec = importlib.util.spec_from_file_location("gorillaguard_bot", BOT_FILE)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def populate(db_file: str, raids: int, participants: int):
+    connection = sqlite3.connect(db_file)
+    with connection:
+        connection.executemany(
+            "INSERT INTO raids (id, name, description, username, tweet_id, action_type, creator_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ((raid_id, f"Raid {raid_id}", "Like and share!", "gorilla", str(raid_id), "like", 1) for raid_id in range(1, raids + 1)),
+        )
+        connection.executemany(
+            "INSERT INTO participants (raid_id, user_id, username, status) VALUES (?, ?, ?, ?)",
+            (
+                (raid_id, user_id, f"user{user_id}", "completed" if user_id % 2 else "pending")
+                for raid_id in range(1, raids + 1) for user_id in range(participants)
+            ),
+        )
+        connection.executemany(
+            "INSERT INTO proofs (raid_id, user_id, username, proof) VALUES (?, ?, ?, ?)",
+            (
+                (raid_id, user_id, f"user{user_id}", "Completed like")
+                for raid_id in range(1, raids + 1) for user_id in range(1, participants, 2)
+            ),
+        )
+    connection.close()
+
+
+class Counter:
+    queries = 0
+
+
+async def details_n_plus_one(bot, raids: list, limit) -> dict:
+    # Patrón anterior: participantes y pruebas consultados raid por raid
+    details = {}
+    for raid in raids:
+        participants = await bot.db.get_participants_page(raid.id, limit=limit)
+        proofs = await bot.db.get_proofs_page(raid.id, limit=limit)
+        details[raid.id] = bot.RaidDetails(participants.items, participants.has_next, proofs.items, proofs.has_next)
+        Counter.queries += 2
+    return details
+
+
+async def details_grouped(bot, raids: list, limit) -> dict:
+    Counter.queries += 2
+    return await bot.db.get_raid_details([raid.id for raid in raids], limit=limit)
+
+
+async def walk_pages(bot, load_details) -> int:
+    """
+    Renders every page of /list_raids_detailed, following the Next cursor.
+    """
+    cursor, rendered = None, 0
+    while True:
+        page = await bot.db.list_raid_summaries_page(cursor, False, bot.DETAILED_PAGE_SIZE)
+        Counter.queries += 1
+        details = await load_details(bot, page.items, bot.DETAILED_PREVIEW_SIZE)
+        lines = []
+        for raid in page.items:
+            lines.extend(bot.render_raid_details(raid, details.get(raid.id)))
+        rendered += len("\n".join(lines))
+        if not page.has_next:
+            return rendered
+        cursor = page.last_id
+
+
+async def full_dump_n_plus_one(bot) -> int:
+    raids = await bot.db.list_raid_summaries()
+    Counter.queries += 1
+    message = ""
+    for raid in raids:
+        participants = await bot.db._read(lambda connection, raid_id=raid.id: [
+            bot.ParticipantStatus(*row) for row in
+            connection.execute("SELECT username, status FROM participants WHERE raid_id = ? ORDER BY id", (raid_id,))
+        ])
+        proofs = await bot.db._read(lambda connection, raid_id=raid.id: [
+            bot.Proof(*row) for row in
+            connection.execute("SELECT username, proof, submitted_at FROM proofs WHERE raid_id = ? ORDER BY id", (raid_id,))
+        ])
+        Counter.queries += 2
+        for line in bot.render_raid_details(raid, bot.RaidDetails(participants, False, proofs, False)):
+            message += line + "\n"
+    return len(message)
+
+
+async def full_dump_grouped(bot) -> int:
+    raids = await bot.db.list_raid_summaries()
+    Counter.queries += 1
+    lines = []
+    # Por lotes: memoria acotada y una consulta por tabla y lote
+    for start in range(0, len(raids), FULL_DUMP_BATCH):
+        batch = raids[start:start + FULL_DUMP_BATCH]
+        details = await details_grouped(bot, batch, None)
+        for raid in batch:
+            lines.extend(bot.render_raid_details(raid, details.get(raid.id)))
+    return len("\n".join(lines))
+
+
+def timed(label: str, coroutine_function, bot, repeat: int = 1) -> float:
+    async def run():
+        best, size, queries = float("inf"), 0, 0
+        for _ in range(repeat):
+            Counter.queries = 0
+            start = time.perf_counter()
+            size = await coroutine_function(bot)
+            best = min(best, time.perf_counter() - start)
+            queries = Counter.queries
+        return best, size, queries
+
+    elapsed, size, queries = asyncio.run(run())
+    print(f"  {label:<10} {elapsed * 1000:>10.2f} ms  {queries:>6} queries  {size:>12,} chars")
+    return elapsed
+
+
+def compare(title: str, before, after, bot, repeat: int = 1):
+    print(title)
+    elapsed_before = timed("before", before, bot, repeat)
+    elapsed_after = timed("after", after, bot, repeat)
+    print(f"  speed-up   {elapsed_before / elapsed_after:>10.1f}x")
+
+
+async def first_page(bot, load_details) -> int:
+    page = await bot.db.list_raid_summaries_page(None, False, bot.DETAILED_PAGE_SIZE)
+    Counter.queries += 1
+    details = await load_details(bot, page.items, bot.DETAILED_PREVIEW_SIZE)
+    lines = []
+    for raid in page.items:
+        lines.extend(bot.render_raid_details(raid, details.get(raid.id)))
+    return len("\n".join(lines))
+
+
+def main():
+    raids = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    participants = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    db_file = os.path.join(tempfile.mkdtemp(), "bench.db")
+    bot = load_bot(db_file)
+    print(f"⏳ Populating {raids:,} raids x {participants:,} participants...")
+    populate(db_file, raids, participants)
+
+    print(f"📊 /list_raids_detailed, {raids:,} raids x {participants:,} participants")
+    compare(
+        "First page (what the command sends), best of 50:",
+        lambda bot: first_page(bot, details_n_plus_one), lambda bot: first_page(bot, details_grouped), bot, repeat=50
+    )
+    compare(
+        "Every page, following Next:",
+        lambda bot: walk_pages(bot, details_n_plus_one), lambda bot: walk_pages(bot, details_grouped), bot, repeat=3
+    )
+    compare("Full dump of every participant and proof:", full_dump_n_plus_one, full_dump_grouped, bot)
+    bot.db.close()
+
+
+if __name__ == "__main__":
+    main()
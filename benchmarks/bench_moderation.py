@@ -0,0 +1,78 @@
+"""
+Micro-benchmark for the moderation scanner.
+
+Compares the single-pass `scan_message_text` against the old two-pass approach
+(uncompiled link regex + uncompiled long-word regex) and prints messages per
+second on one core.
+
+    python benchmarks/bench_moderation.py [messages]
+"""
+import importlib.util
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+BOT_FILE = Path(__file__).resolve().parent.parent / "GORILLAGUARD_V1.0_bot.py"
+
+
+def load_bot():
+    # Base de datos temporal para no tocar la real
+    os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+    spec = importlib.util.spec_from_file_location("gorillaguard_bot", BOT_FILE)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def build_corpus(size: int):
+    random.seed(42)
+    words = ["gm", "wagmi", "raid", "gorilla", "moon", "ser", "hold", "pump", "lfg", "community"]
+    corpus = []
+    for i in range(size):
+        text = " ".join(random.choice(words) for _ in range(random.randint(5, 40)))
+        entities = ()
+        if i % 20 == 0:
+            text += " https://example.com/airdrop"
+            entities = (SimpleNamespace(type="url"),)
+        elif i % 25 == 0:
+            text += " supercalifragilisticexpialidocious"
+        corpus.append((text, entities))
+    return corpus
+
+
+def legacy_scan(text: str):
+    if re.search(r"(http[s]?://|www\.)[^\s]+", text):
+        return True, []
+    return False, re.findall(r"\b\w{15,}\b", text)
+
+
+def run(label: str, fn, corpus, repeat: int = 5):
+    # Mejor de varias rondas para reducir el ruido
+    elapsed = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text, entities in corpus:
+            fn(text, entities)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    print(f"{label:<28} {len(corpus) / elapsed:>12,.0f} msgs/s")
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    bot = load_bot()
+    corpus = build_corpus(size)
+    plain_corpus = [(text, ()) for text, _ in corpus]
+
+    print(f"📊 {size:,} messages, single core")
+    run("legacy (two regex passes)", lambda text, _: legacy_scan(text), corpus)
+    run("single pass (regex only)", bot.scan_message_text, plain_corpus)
+    run("single pass (entities)", bot.scan_message_text, corpus)
+
+
+if __name__ == "__main__":
+    main()